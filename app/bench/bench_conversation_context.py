@@ -0,0 +1,97 @@
+"""Benchmark: per-reply conversation context rendering.
+
+Simulates a channel receiving messages; after each one the history window
+(newest lines fitting max_chars, excluding the message being answered) is
+rendered the way a reply needs it:
+
+  legacy       previous format_conversation_history (insert(0) + re-join of
+               the accumulated lines per entry: O(n^2) chars per reply)
+  rewritten    current format_conversation_history (single pass, one join)
+  incremental  HistoryStore.render_history (ConversationLines: lines kept
+               formatted, O(1) append / evict, window by bisect, one join)
+
+Times are the mean per message (append + render) over a steady-state
+stream; all three outputs are checked to be identical.
+
+Usage:
+  python app/bench/bench_conversation_context.py [--messages 2000]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, "..", "src"))
+
+# constants.py requires these; the benchmark never talks to Discord / OpenAI.
+for _k, _v in {
+    "DISCORD_BOT_TOKEN": "bench",
+    "DISCORD_CLIENT_ID": "0",
+    "OPENAI_API_KEY": "sk-bench",
+    "PERMISSIONS": "0",
+    "ALLOWED_SERVER_IDS": "",
+}.items():
+    os.environ.setdefault(_k, _v)
+
+from sub.history_store import HistoryEntry, HistoryStore  # noqa: E402
+from sub.format_conversation import format_conversation_history  # noqa: E402
+
+
+def legacy_format_conversation_history(history_entries, max_chars: int = 2000) -> str:
+    """format_conversation_history before the incremental renderer."""
+    if not history_entries:
+        return ""
+    formatted_lines = []
+    for entry in reversed(history_entries):
+        formatted_lines.insert(0, f"{entry.username}({entry.user_id}): {entry.content}")
+        if len("\n".join(formatted_lines)) > max_chars:
+            formatted_lines.pop(0)
+            break
+    return "\n".join(formatted_lines)
+
+
+def _stream(n: int):
+    rng = random.Random(7)
+    users = [(1_100_000_000_000_000_000 + i, f"user{i}") for i in range(20)]
+    for i in range(n):
+        user_id, name = rng.choice(users)
+        content = "こんにちは、今日の天気は? " * rng.randint(1, 6) if i % 3 else "ok " * rng.randint(1, 40)
+        yield HistoryEntry(user_id, name, content, "text", time.time())
+
+
+def _run(variant: str, entries, max_items: int, max_chars: int):
+    store = HistoryStore(max_items=max_items)
+    out = []
+    t0 = time.perf_counter()
+    for entry in entries:
+        store.add_message("c", entry)
+        if variant == "incremental":
+            out.append(store.render_history("c", max_chars, skip_newest=1))
+        else:
+            fmt = legacy_format_conversation_history if variant == "legacy" else format_conversation_history
+            out.append(fmt(store.get_history("c")[:-1], max_chars))
+    return (time.perf_counter() - t0) / len(entries) * 1e6, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    entries = list(_stream(args.messages))
+    print(f"messages={args.messages} python={sys.version.split()[0]}")
+    print(f"{'max_items':>9} {'max_chars':>9} {'legacy us':>10} {'rewritten us':>13} {'incremental us':>15} {'speedup':>8}")
+    for max_items, max_chars in ((30, 2000), (30, 100_000), (200, 2000), (200, 100_000), (1000, 100_000)):
+        results = {v: _run(v, entries, max_items, max_chars) for v in ("legacy", "rewritten", "incremental")}
+        assert results["legacy"][1] == results["rewritten"][1] == results["incremental"][1]
+        legacy, rewritten, incremental = (results[v][0] for v in ("legacy", "rewritten", "incremental"))
+        print(
+            f"{max_items:>9} {max_chars:>9} {legacy:>10.1f} {rewritten:>13.1f} {incremental:>15.1f}"
+            f" {legacy / incremental:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
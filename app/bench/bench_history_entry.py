@@ -0,0 +1,128 @@
+"""Benchmark: memory and construction cost of HistoryEntry / Message.
+
+Compares the slot-based ``sub.history_store.HistoryEntry`` (int snowflake,
+epoch float, interned username) and ``sub.core.base.Message`` (slots,
+interned user) with the previous plain dataclasses (per-instance __dict__,
+str ids, datetime timestamps), at 100k entries from a pool of users so
+usernames repeat like they do in real channels.
+
+Reported per variant: construction time, traced allocation (tracemalloc)
+in total and per entry, and garbage collections run while building
+(allocation pressure).
+
+Usage:
+  python app/bench/bench_history_entry.py [--n 100000] [--users 200]
+"""
+from __future__ import annotations
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Union
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, "..", "src"))
+
+# constants.py requires these; the benchmark never talks to Discord / OpenAI.
+for _k, _v in {
+    "DISCORD_BOT_TOKEN": "bench",
+    "DISCORD_CLIENT_ID": "0",
+    "OPENAI_API_KEY": "sk-bench",
+    "PERMISSIONS": "0",
+    "ALLOWED_SERVER_IDS": "",
+}.items():
+    os.environ.setdefault(_k, _v)
+
+from sub.history_store import HistoryEntry  # noqa: E402
+from sub.core.base import Message  # noqa: E402
+
+
+# ---- previous representations ----
+@dataclass
+class LegacyHistoryEntry:
+    user_id: str
+    username: str
+    content: str
+    source: str
+    timestamp: datetime
+
+
+@dataclass(frozen=True)
+class LegacyMessage:
+    user: str
+    role: str
+    content: Optional[Union[str, list]] = None
+
+
+def _inputs(n: int, users: int):
+    """Per-message inputs as a Discord event delivers them: a fresh name string each time."""
+    contents = [f"message {i} " + "あいう" * (i % 7) for i in range(n)]
+    ids = [1_100_000_000_000_000_000 + (i % users) for i in range(n)]
+    names = [f"user{i % users}" for i in range(n)]
+    names = ["".join(list(name)) for name in names]  # distinct objects, like per-event strings
+    return contents, ids, names
+
+
+def _collections() -> int:
+    return sum(s["collections"] for s in gc.get_stats())
+
+
+def _measure(label: str, build):
+    gc.collect()
+    collections = _collections()
+    t0 = time.perf_counter()
+    items = build()
+    elapsed = time.perf_counter() - t0
+    collections = _collections() - collections
+    gc.collect()
+    tracemalloc.start()
+    items = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<22} build={elapsed * 1000:8.1f} ms  mem={current / 1e6:7.2f} MB"
+        f" ({current / len(items):5.0f} B/entry)  gc_runs={collections}"
+    )
+    return items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+    contents, ids, names = _inputs(args.n, args.users)
+    print(f"entries={args.n} users={args.users} python={sys.version.split()[0]}")
+
+    print("\nHistoryEntry")
+    legacy = _measure("legacy dataclass", lambda: [
+        LegacyHistoryEntry(str(u), name, c, "text", datetime.now()) for u, name, c in zip(ids, names, contents)
+    ])
+    del legacy
+    gc.collect()
+    now = time.time
+    compact = _measure("slots", lambda: [
+        HistoryEntry(u, name, c, "text", now()) for u, name, c in zip(ids, names, contents)
+    ])
+    del compact
+    gc.collect()
+
+    print("\nMessage")
+    roles = ["user", "assistant"]
+    legacy = _measure("legacy dataclass", lambda: [
+        LegacyMessage(user=name, role=roles[i & 1], content=c) for i, (name, c) in enumerate(zip(names, contents))
+    ])
+    del legacy
+    gc.collect()
+    intern = sys.intern
+    _measure("slots + intern", lambda: [
+        Message(user=intern(name), role=roles[i & 1], content=c) for i, (name, c) in enumerate(zip(names, contents))
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark: near-duplicate cache lookup latency vs. index size.
+
+Fills ``sub.llm.near_dup_cache.NearDupCache`` with synthetic Japanese
+questions (random place + random two-kanji topic + one of a few phrasings;
+the phrasings are shared by every entry, as in real chat) and measures per-lookup
+latency for paraphrased queries (expected hits) and unrelated queries
+(expected misses) at several index sizes.
+
+Usage:
+  python app/bench/bench_near_dup_cache.py [--sizes 100,1000,10000,50000] [--lookups 2000]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src")
+sys.path.append(SRC_DIR)
+
+# constants.py requires these; the benchmark never talks to Discord / OpenAI.
+for _k, _v in {
+    "DISCORD_BOT_TOKEN": "bench",
+    "DISCORD_CLIENT_ID": "0",
+    "OPENAI_API_KEY": "sk-bench",
+    "PERMISSIONS": "0",
+    "ALLOWED_SERVER_IDS": "",
+}.items():
+    os.environ.setdefault(_k, _v)
+
+from sub.llm.near_dup_cache import NearDupCache, text_grams, jaccard  # noqa: E402
+
+_KANJI = "天気株価為替地震電車遅延試合結果映画物価金利選挙台風花粉渋滞予報速報決算発表新型規制補助税制年金医療教育観光交通空港鉄道道路病院学校"
+_PHRASES = ["の{t}は？", "の{t}教えて", "の{t}を知りたい", "の{t}について", "の{t}どうなってる"]
+_STORE_PHRASES = _PHRASES[:2]
+_QUERY_PHRASES = _PHRASES[2:]
+_KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわ"
+
+
+def _entity(rng: random.Random) -> str:
+    return "".join(rng.choice(_KANA) for _ in range(4)) + "市"
+
+
+def _topic(rng: random.Random) -> str:
+    return rng.choice(_KANJI) + rng.choice(_KANJI)
+
+
+def _text(entity: str, topic: str, phrase: str) -> str:
+    q = entity + phrase.format(t=topic)
+    return f"{q}\n{q}"
+
+
+def _pct(samples, q):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * q))]
+
+
+def run(size: int, lookups: int, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    cache = NearDupCache(threshold=0.5, ttl_sec=3600, max_items=size)
+    stored = []
+    t0 = time.perf_counter()
+    for _ in range(size):
+        entity, topic = _entity(rng), _topic(rng)
+        text = _text(entity, topic, rng.choice(_STORE_PHRASES))
+        cache.add("bench", "guild", text, "reply", "primary")
+        stored.append((entity, topic, text))
+    add_us = (time.perf_counter() - t0) / size * 1e6
+
+    hit_lat, miss_lat = [], []
+    hits = false_hits = reachable = 0
+    for i in range(lookups):
+        if i % 2 == 0:
+            entity, topic, original = rng.choice(stored)
+            text = _text(entity, topic, rng.choice(_QUERY_PHRASES))
+            # ceiling: an exhaustive scan would hit iff similarity >= threshold
+            reachable += jaccard(text_grams(text), text_grams(original)) >= cache.threshold
+            t = time.perf_counter()
+            r = cache.lookup("bench", "guild", text)
+            hit_lat.append((time.perf_counter() - t) * 1e6)
+            hits += r is not None
+        else:
+            text = _text(_entity(rng) + "町", _topic(rng), rng.choice(_QUERY_PHRASES))
+            t = time.perf_counter()
+            r = cache.lookup("bench", "guild", text)
+            miss_lat.append((time.perf_counter() - t) * 1e6)
+            false_hits += r is not None
+    print(
+        f"size={size:>6} add={add_us:6.1f}us "
+        f"paraphrase p50={statistics.median(hit_lat):6.1f}us p99={_pct(hit_lat, 0.99):7.1f}us recall={hits / len(hit_lat):.2f} (exhaustive {reachable / len(hit_lat):.2f}) | "
+        f"unrelated p50={statistics.median(miss_lat):6.1f}us p99={_pct(miss_lat, 0.99):7.1f}us false_hits={false_hits / len(miss_lat):.3f} "
+        f"buckets={cache.snapshot()['buckets']}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,10000,50000")
+    ap.add_argument("--lookups", type=int, default=2000)
+    args = ap.parse_args()
+    for size in (int(s) for s in args.sizes.split(",")):
+        run(size, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark: pooled aiohttp transport vs. SDK-in-thread (asyncio.to_thread).
+
+Starts a local OpenAI-compatible stub server (POST /v1/chat/completions) and
+fires bursts of concurrent calls through both invoke paths of
+``sub.llm.openai_wrapper``. The stub is plain HTTP on localhost, so TLS
+handshake savings of the pooled session are NOT included (real gains are
+larger).
+
+Usage:
+  python app/bench/bench_openai_transport.py [--requests 200] [--concurrency 32] [--latency-ms 150]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src")
+sys.path.append(SRC_DIR)
+
+# constants.py requires these; the benchmark never talks to Discord / OpenAI.
+for _k, _v in {
+    "DISCORD_BOT_TOKEN": "bench",
+    "DISCORD_CLIENT_ID": "0",
+    "OPENAI_API_KEY": "sk-bench",
+    "PERMISSIONS": "0",
+    "ALLOWED_SERVER_IDS": "",
+}.items():
+    os.environ.setdefault(_k, _v)
+
+from aiohttp import web  # noqa: E402
+import openai  # noqa: E402
+from sub.llm import openai_wrapper  # noqa: E402
+from sub.llm.openai_transport import OpenAIHTTPTransport  # noqa: E402
+
+_MESSAGES = [
+    {"role": "system", "content": "あなたはベンチマーク用のアシスタントです。"},
+    {"role": "user", "content": "こんにちは"},
+]
+
+
+def _stub_app(latency_ms: float) -> web.Application:
+    async def completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 1, "total_tokens": 13},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+async def _burst(invoke, n: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            resp, _ = await invoke()
+            assert resp.choices[0]["message"]["content"] == "ok"
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - t0
+    return wall, latencies
+
+
+def _report(name: str, wall: float, latencies, n: int):
+    lat = sorted(latencies)
+    p50 = statistics.median(lat)
+    p95 = lat[int(len(lat) * 0.95) - 1]
+    print(f"{name:<8} req={n} wall_s={wall:.2f} rps={n / wall:.1f} p50_ms={p50:.1f} p95_ms={p95:.1f} max_ms={lat[-1]:.1f}")
+
+
+async def main(args):
+    runner = web.AppRunner(_stub_app(args.latency_ms))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    api_base = f"http://127.0.0.1:{port}/v1"
+
+    openai.api_key = "sk-bench"
+    openai.api_base = api_base
+    http = OpenAIHTTPTransport(api_base=api_base, pool_limit=args.concurrency)
+    openai_wrapper.http_transport = http
+
+    async def via_thread():
+        return await asyncio.to_thread(openai_wrapper._invoke_thread, "bench-model", _MESSAGES, 30)
+
+    async def via_http():
+        return await openai_wrapper._invoke_http("bench-model", _MESSAGES, 30)
+
+    print(f"stub latency={args.latency_ms}ms concurrency={args.concurrency} "
+          f"default_executor_workers={min(32, (os.cpu_count() or 1) + 4)}")
+    # warm-up both paths (connection setup, thread pool spin-up)
+    await _burst(via_thread, args.concurrency, args.concurrency)
+    await _burst(via_http, args.concurrency, args.concurrency)
+    for name, invoke in (("thread", via_thread), ("aiohttp", via_http)):
+        wall, latencies = await _burst(invoke, args.requests, args.concurrency)
+        _report(name, wall, latencies, args.requests)
+
+    await http.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,146 @@
+"""Benchmark: script-class token estimator accuracy and throughput.
+
+Compares ``sub.llm.token_utils.estimate_tokens`` (used when tiktoken or its
+BPE files are unavailable) with the previous heuristics (len / 4 and
+ASCII / 4 + 1 per non-ASCII char) against tiktoken reference counts for
+cl100k_base (gpt-4 / gpt-3.5) and o200k_base (gpt-4o / gpt-4.1).
+
+The reference counts are bundled in data/token_corpus.jsonl (chat-style
+Japanese / English / mixed text, code, URLs, numbers, emoji, mentions,
+search context), so accuracy can be checked without tiktoken. With
+tiktoken installed, --live recounts the corpus and --write-reference
+rewrites the bundled counts (after adding corpus lines).
+
+When tiktoken and its BPE files are available, throughput also covers the
+encoder path prompt budgeting uses (count_tokens_batch: encoder resolved
+once, one encode_batch per call, memoized counts) against resolving the
+encoder and encoding every text on each call.
+
+Usage:
+  python app/bench/bench_token_estimator.py [--live] [--write-reference] [--repeat 200]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+CORPUS_PATH = os.path.join(BENCH_DIR, "data", "token_corpus.jsonl")
+sys.path.append(SRC_DIR)
+
+# constants.py requires these; the benchmark never talks to Discord / OpenAI.
+for _k, _v in {
+    "DISCORD_BOT_TOKEN": "bench",
+    "DISCORD_CLIENT_ID": "0",
+    "OPENAI_API_KEY": "sk-bench",
+    "PERMISSIONS": "0",
+    "ALLOWED_SERVER_IDS": "",
+}.items():
+    os.environ.setdefault(_k, _v)
+
+from sub.llm import token_utils  # noqa: E402
+from sub.llm.token_utils import count_tokens_batch, estimate_tokens  # noqa: E402
+
+ENCODINGS = {"cl100k_base": "gpt-4", "o200k_base": "gpt-4.1"}
+
+
+def _len4(text: str) -> int:
+    return int(len(text) / 4)
+
+
+def _ascii4(text: str) -> int:
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return int(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def _load() -> list:
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _pct(samples, q):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * q))]
+
+
+def accuracy(corpus: list) -> None:
+    for enc_name, model in ENCODINGS.items():
+        print(f"[{enc_name}] model={model} lines={len(corpus)} ref_tokens={sum(r[enc_name] for r in corpus)}")
+        for label, fn in (
+            ("estimate_tokens", lambda t: estimate_tokens(t, model)),
+            ("ascii/4 + 1/char", _ascii4),
+            ("len/4", _len4),
+        ):
+            errors = [abs(fn(r["text"]) - r[enc_name]) / max(1, r[enc_name]) for r in corpus]
+            ratio = sum(fn(r["text"]) for r in corpus) / sum(r[enc_name] for r in corpus)
+            print(
+                f"  {label:<17} mean_abs_err={statistics.mean(errors):6.1%} "
+                f"p90={_pct(errors, 0.9):6.1%} total_ratio={ratio:5.2f}"
+            )
+
+
+def throughput(corpus: list, repeat: int) -> None:
+    texts = [r["text"] for r in corpus]
+    chars = sum(len(t) for t in texts) * repeat
+    fns = [
+        ("estimate_tokens", lambda t: estimate_tokens(t, "gpt-4.1")),
+        ("ascii/4 + 1/char", _ascii4),
+        ("len/4", _len4),
+    ]
+    try:
+        import tiktoken  # type: ignore
+        enc = tiktoken.get_encoding("o200k_base")
+        fns.append(("tiktoken o200k", lambda t: len(enc.encode(t))))
+        fns.append(("tiktoken per call", lambda t: len(tiktoken.encoding_for_model("gpt-4.1").encode(t))))
+    except Exception:
+        enc = None
+        print("  (tiktoken or its BPE files unavailable: encoder rows skipped)")
+    for label, fn in fns:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for t in texts:
+                fn(t)
+        elapsed = time.perf_counter() - t0
+        print(f"  {label:<17} {chars / elapsed / 1e6:7.2f} Mchar/s  {elapsed / (len(texts) * repeat) * 1e6:6.2f} us/text")
+    if enc is None:
+        return
+    # the whole corpus counted per call, as prompt budgeting does on every turn
+    for label, cold in (("batch, cold memo", True), ("batch, warm memo", False)):
+        token_utils._memo.clear()
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            if cold:
+                token_utils._memo.clear()
+            count_tokens_batch(texts, "gpt-4.1")
+        elapsed = time.perf_counter() - t0
+        print(f"  {label:<17} {chars / elapsed / 1e6:7.2f} Mchar/s  {elapsed / (len(texts) * repeat) * 1e6:6.2f} us/text")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--live", action="store_true", help="recount references with tiktoken")
+    ap.add_argument("--write-reference", action="store_true", help="rewrite bundled counts with tiktoken")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+    corpus = _load()
+    if args.live or args.write_reference:
+        import tiktoken  # type: ignore
+        for enc_name in ENCODINGS:
+            enc = tiktoken.get_encoding(enc_name)
+            for r in corpus:
+                r[enc_name] = len(enc.encode(r["text"]))
+        if args.write_reference:
+            with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+                for r in corpus:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    accuracy(corpus)
+    print(f"throughput (repeat={args.repeat}):")
+    throughput(corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ import sys
 import discord
 import logging
 import asyncio
-from typing import List, Tuple
+from typing import List, Literal, Tuple
 
 # debugpyによるリモートデバッグ有効化
 try:
@@ -23,9 +23,14 @@ from sub.constants import (
     EXAMPLE_CONVOS,
     ACTIVATE_THREAD_PREFX,
     HISTORY_MAX_ITEMS,
+    HISTORY_CONTEXT_CHARS,
+    HISTORY_MAX_CHANNELS,
+    HISTORY_IDLE_TTL_SEC,
+    HISTORY_MAX_BYTES,
     RESPOND_WITHOUT_MENTION,
     RATE_LIMIT_WINDOW_SEC,
     RATE_LIMIT_MAX_EVENTS,
+    STREAM_REPLIES,
 )
 from sub.infra.logging import (
     should_block,
@@ -33,6 +38,11 @@ from sub.infra.logging import (
     log_event,
 )
 from sub.llm import completion
+from sub.llm.openai_wrapper import diag_lines as openai_diag_lines
+from sub.llm.openai_transport import transport as openai_transport
+from sub.llm.concurrency import LLMPriority
+from sub.llm.summarizer import summarizer
+from sub.llm.usage_ledger import ledger as usage_ledger
 from sub.llm.completion import (
     generate_completion_response,
     process_thread_response,
@@ -44,6 +54,10 @@ from sub.event import (
     channel_chat,
 )
 from sub.history_store import HistoryStore
+from sub.history_backend import history_persister
+from sub.discord.channel_cache import channel_cache
+from sub.channel_actor import channel_actors
+from sub.overload import work_gate
 from sub.search.websearch import perform_web_search, format_search_results
 from sub.dedup import GLOBAL_MESSAGE_DEDUP
 from sub.rate_limit import build_rate_limiter
@@ -60,27 +74,72 @@ intents.members = False
 intents.typing = False
 log_event("startup_intents", message_content=intents.message_content, guilds=intents.guilds)
 
-client = discord.Client(intents=intents)
+class ChappieClient(discord.Client):
+    async def close(self):
+        # client.run() awaits this on shutdown / signals: release the pooled OpenAI session too
+        await super().close()
+        await openai_transport.close()
+
+
+client = ChappieClient(intents=intents)
 tree = discord.app_commands.CommandTree(client)
 
 # Initialize global history store
-history_store = HistoryStore(max_items=HISTORY_MAX_ITEMS)
+history_store = HistoryStore(
+    max_items=HISTORY_MAX_ITEMS,
+    on_evict=summarizer.on_evict,
+    on_drop=summarizer.forget,
+    max_channels=HISTORY_MAX_CHANNELS,
+    idle_ttl_sec=HISTORY_IDLE_TTL_SEC,
+    max_bytes=HISTORY_MAX_BYTES,
+    persister=history_persister,
+    context_chars=HISTORY_CONTEXT_CHARS,
+)
 rate_limiter = build_rate_limiter(RATE_LIMIT_WINDOW_SEC, RATE_LIMIT_MAX_EVENTS)
 
 @client.event
 async def on_ready():
     log_event("login", user=str(client.user), invite_url=BOT_INVITE_URL)
     log_event("guild_connected", guild_count=len(client.guilds))
+    if channel_cache is not None:
+        channel_cache.invalidate(reason="ready")  # new session: events may have been missed
     completion.READY_BOT_NAME = client.user.name
     completion.READY_BOT_EXAMPLE_CONVOS = [Conversation(messages=[m for m in c.messages]) for c in EXAMPLE_CONVOS]
+    if usage_ledger is not None:
+        await usage_ledger.open()  # today's quota totals, read off the event loop
     await tree.sync()
     schedule_background_tasks()
 
+@client.event
+async def on_resumed():
+    if channel_cache is not None:
+        channel_cache.invalidate(reason="resumed")
+
+@client.event
+async def on_message_edit(before, after):
+    if channel_cache is not None:
+        channel_cache.on_message_edit(after)
+
+@client.event
+async def on_raw_message_edit(payload):
+    if channel_cache is not None:
+        channel_cache.on_raw_message_edit(payload)
+
+@client.event
+async def on_raw_message_delete(payload):
+    if channel_cache is not None:
+        channel_cache.on_raw_message_delete(payload.channel_id, (payload.message_id,))
+
+@client.event
+async def on_raw_bulk_message_delete(payload):
+    if channel_cache is not None:
+        channel_cache.on_raw_message_delete(payload.channel_id, payload.message_ids)
+
 async def heartbeat_task():
     while True:
         try:
             latency_ms = client.latency * 1000 if client.latency else None
-            log_event("heartbeat", latency_ms=f"{latency_ms:.1f}" if latency_ms is not None else None)
+            log_event("heartbeat", latency_ms=f"{latency_ms:.1f}" if latency_ms is not None else None, overload_level=work_gate.level.name)
         except Exception as e:
             logger.warning(f"[health] heartbeat error: {e}")
         await asyncio.sleep(30)
@@ -148,6 +207,9 @@ async def on_message(message):
         if should_block(guild=message.guild):
             log_event("guild_blocked", guild_id=getattr(message.guild,'id',None))
             return
+        # keep the channel cache current (bot replies included)
+        if channel_cache is not None:
+            channel_cache.on_message(message)
 
         # ignore messages from the bot
         if message.author.bot:
@@ -165,6 +227,7 @@ async def on_message(message):
             await thread_chat(message=message, client=client, history_store=history_store)
             return
 
+        priority = LLMPriority.MENTION
         addressed, reasons = _is_message_addressed(message, client.user)
         log_event("address_check", addressed=addressed, reasons=','.join(reasons) if reasons else None, author_id=getattr(message.author,'id',None), preview=message.content[:60])
         if not addressed:
@@ -175,10 +238,11 @@ async def on_message(message):
                     log_event("rate_limit_drop", user_id=uid, window_s=RATE_LIMIT_WINDOW_SEC, max_events=RATE_LIMIT_MAX_EVENTS)
                     return
                 log_event("fallback_respond", reason="respond_without_mention")
+                priority = LLMPriority.FALLBACK
             else:
                 return
         log_event("address_accept", author_id=getattr(message.author,'id',None), reasons=','.join(reasons) if reasons else None)
-        await channel_chat(message=message, client=client, history_store=history_store)
+        await channel_chat(message=message, client=client, history_store=history_store, priority=priority)
         
     except Exception as e:
         logger.exception(e)
@@ -234,7 +298,8 @@ async def thread_command(int: discord.Interaction, message: str):
             # fetch completion
             messages = [Message(role="system", user=user.name, content=message)]
             response_data = await generate_completion_response(
-                messages=messages, user=user
+                messages=messages, user=user, stream=bool(STREAM_REPLIES), channel=thread,
+                priority=LLMPriority.COMMAND,
             )
             # send the result
             await process_thread_response(
@@ -294,7 +359,8 @@ async def message_command(int: discord.Interaction, message: str):
             # fetch completion
             messages = [Message(role="system", user=user.name, content=message)]
             response_data = await generate_completion_response(
-                messages=messages, user=user
+                messages=messages, user=user, stream=bool(STREAM_REPLIES), channel=int.channel,
+                priority=LLMPriority.COMMAND,
             )
             # send the result
             await process_channel_response(
@@ -385,6 +451,44 @@ async def websearch_command(int: discord.Interaction, query: str):
                 f"❌ **エラー**: コマンド実行中にエラーが発生しました: {str(e)}"
             )
 
+@tree.command(name="usage", description="このサーバーのトークン使用量とコストを表示")
+@discord.app_commands.checks.has_permissions(send_messages=True)
+@discord.app_commands.describe(days="集計日数 (今日を含む)", by="内訳の単位")
+async def usage_command(
+    int: discord.Interaction,
+    days: discord.app_commands.Range[int, 1, 90] = 1,
+    by: Literal["user", "channel", "model", "purpose"] = "user",
+):
+    try:
+        if should_block(guild=int.guild):
+            return
+        if usage_ledger is None:
+            await int.response.send_message("使用量の記録は無効です (USAGE_LEDGER_ENABLED=0)", ephemeral=True)
+            return
+        await int.response.defer(thinking=True, ephemeral=True)
+        guild_id = str(int.guild.id)
+        column = {"user": "user_id", "channel": "channel_id"}.get(by, by)
+        totals, rows = await usage_ledger.summary(days=days, group_by=column, guild_id=guild_id)
+        calls, prompt_tokens, completion_tokens, cost, avg_ms = totals
+        if not calls:
+            await int.followup.send(f"直近{days}日の使用記録はありません", ephemeral=True)
+            return
+        lines = [
+            f"Usage (直近{days}日): calls={calls} tokens={prompt_tokens}+{completion_tokens} "
+            f"cost={cost:.4f} avg_latency={avg_ms:.0f}ms",
+            f"内訳 ({by}):",
+        ]
+        for value, r_calls, r_prompt, r_completion, r_cost, r_ms in rows:
+            label = {"user": f"<@{value}>", "channel": f"<#{value}>"}.get(by, value) if value else "(background)"
+            lines.append(f"- {label} calls={r_calls} tokens={r_prompt + r_completion} cost={r_cost:.4f} avg={r_ms:.0f}ms")
+        await int.followup.send("\n".join(lines)[:1900], ephemeral=True)
+    except Exception as e:
+        logger.exception(e)
+        try:
+            await int.followup.send(f"使用量の取得に失敗しました: {e}", ephemeral=True)
+        except Exception:
+            pass
+
 @tree.command(name="diag", description="診断情報を表示 (latency / guild / websearch quick check)")
 @discord.app_commands.checks.has_permissions(send_messages=True)
 async def diag_command(int: discord.Interaction):
@@ -401,9 +505,22 @@ async def diag_command(int: discord.Interaction):
             f"Latency: {latency_ms:.1f}ms\n"
             f"Guilds: {guild_count}\n"
             f"WebSearch: status={status} detail={result_line[:120]}\n"
-            f"Intents: message_content={intents.message_content} guilds={intents.guilds}"
+            f"Intents: message_content={intents.message_content} guilds={intents.guilds}\n"
+            f"Summary: {' '.join(f'{k}={v}' for k, v in summarizer.snapshot().items())}"
         )
-        await int.followup.send(content, ephemeral=True)
+        content += f"\nHistory: {' '.join(f'{k}={v}' for k, v in history_store.snapshot().items())}"
+        if history_persister is not None:
+            content += f"\nHistoryBackend: {' '.join(f'{k}={v}' for k, v in history_persister.snapshot().items())}"
+        content += f"\nWorkGate: {' '.join(f'{k}={v}' for k, v in work_gate.snapshot().items())}"
+        content += f"\nChannelActors: {' '.join(f'{k}={v}' for k, v in channel_actors.snapshot().items())}"
+        if channel_cache is not None:
+            content += f"\nChannelCache: {' '.join(f'{k}={v}' for k, v in channel_cache.snapshot().items())}"
+        if usage_ledger is not None:
+            content += f"\nUsageLedger: {' '.join(f'{k}={v}' for k, v in usage_ledger.snapshot().items())}"
+        openai_lines = openai_diag_lines()
+        if openai_lines:
+            content += "\n" + "\n".join(openai_lines)
+        await int.followup.send(content[:1900], ephemeral=True)
     except Exception as e:
         logger.exception(e)
         try:
@@ -0,0 +1,204 @@
+"""Per-channel actors: coalesce message bursts into one completion.
+
+Each channel (or thread) with pending work gets one actor task that owns a
+bounded inbox:
+  1. Wait for the first message, then keep collecting until the channel has
+     been quiet for ``quiet_sec`` (SECONDS_DELAY_RECEIVING_MSG) or
+     ``max_wait_sec`` passed since the burst started. The whole burst is
+     answered by ONE run (the latest message's); earlier items are discarded.
+  2. While that run (search + LLM call) is in flight, a newer message
+     cancels it and starts a new burst instead of letting it finish and
+     throwing the reply away afterwards. The new burst inherits the best
+     priority of the cancelled one (a superseded mention stays a mention).
+  3. The run's result is delivered (sent to Discord) without further
+     cancellation; messages arriving meanwhile wait for the next cycle.
+
+A full inbox drops its oldest item (it would have been coalesced anyway),
+or the new one with CHANNEL_INBOX_POLICY=drop_newest.
+Actors exit after ``idle_sec`` without messages.
+
+Replaces the old "every message sleeps, then drops itself if it is no
+longer the last one" debounce, which kept N sleeping tasks per burst.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from sub.constants import (
+    SECONDS_DELAY_RECEIVING_MSG,
+    CHANNEL_INBOX_MAX,
+    COALESCE_MAX_WAIT_SEC,
+    CHANNEL_ACTOR_IDLE_SEC,
+    CHANNEL_INBOX_POLICY,
+)
+from sub.infra.logging import logger, log_event
+
+
+@dataclass
+class Work:
+    message: Any  # discord.Message
+    priority: int
+    # cancellable stage: (burst messages oldest -> newest, best priority) -> result
+    run: Callable[[List[Any], int], Awaitable[Any]]
+    # not cancelled by newer messages
+    deliver: Callable[[Any], Awaitable[None]]
+    # called when the item is coalesced / dropped / its run cancelled (e.g. stop prefetch)
+    discard: Optional[Callable[[], None]] = None
+
+    def drop(self) -> None:
+        if self.discard is not None:
+            try:
+                self.discard()
+            except Exception as e:
+                logger.warning(f"[actor] discard failed error={e}")
+
+
+class ChannelActor:
+    def __init__(self, channel_id: int, registry: "ChannelActors"):
+        self.channel_id = channel_id
+        self.registry = registry
+        self._inbox: Deque[Work] = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # best priority of a cancelled run, owed to the burst that superseded it
+        self._carried_priority: Optional[int] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._inbox)
+
+    def submit(self, work: Work) -> None:
+        if len(self._inbox) >= self.registry.inbox_max:
+            self.registry.dropped += 1
+            if self.registry.inbox_policy == "drop_newest":
+                work.drop()
+                return
+            self._inbox.popleft().drop()
+        self._inbox.append(work)
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def _next(self, timeout: float) -> Optional[Work]:
+        """Pop the next item, waiting at most timeout seconds (None on timeout)."""
+        if not self._inbox:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                if not self._inbox:
+                    return None
+        return self._inbox.popleft()
+
+    async def _collect(self, first: Work) -> List[Work]:
+        burst = [first]
+        start = time.monotonic()
+        while True:
+            remaining = min(self.registry.quiet_sec, start + self.registry.max_wait_sec - time.monotonic())
+            if remaining <= 0:
+                break
+            item = await self._next(remaining)
+            if item is None:
+                break
+            burst.append(item)
+        return burst
+
+    async def _loop(self) -> None:
+        try:
+            while True:
+                first = await self._next(self.registry.idle_sec)
+                if first is None:
+                    break
+                burst = await self._collect(first)
+                await self._process(burst)
+        except Exception as e:
+            logger.exception(e)
+        # idle (no await since the empty check): safe to unregister
+        if self.registry._actors.get(self.channel_id) is self and not self._inbox:
+            del self.registry._actors[self.channel_id]
+
+    async def _process(self, burst: List[Work]) -> None:
+        latest = burst[-1]
+        for item in burst[:-1]:
+            item.drop()
+        self.registry.runs += 1
+        self.registry.coalesced += len(burst) - 1
+        log_event("channel_burst", channel_id=self.channel_id, messages=len(burst), pending=len(self._inbox))
+        priority = min(w.priority for w in burst)
+        if self._carried_priority is not None:
+            priority = min(priority, self._carried_priority)
+            self._carried_priority = None
+        run = asyncio.ensure_future(latest.run([w.message for w in burst], priority))
+        try:
+            while not run.done():
+                if self._inbox:
+                    # a newer message supersedes this run: cancel instead of finishing
+                    run.cancel()
+                    self._carried_priority = priority
+                    self.registry.cancelled += 1
+                    latest.drop()
+                    log_event("channel_run_cancelled", channel_id=self.channel_id, superseded_by=len(self._inbox))
+                    await asyncio.gather(run, return_exceptions=True)  # let it clean up (stream discard)
+                    return
+                self._wake.clear()
+                waiter = asyncio.ensure_future(self._wake.wait())
+                await asyncio.wait({run, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+        except asyncio.CancelledError:
+            run.cancel()
+            raise
+        try:
+            result = run.result()
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.exception(e)
+            return
+        try:
+            await latest.deliver(result)
+        except Exception as e:
+            logger.exception(e)
+
+
+class ChannelActors:
+    def __init__(
+        self,
+        quiet_sec: float = SECONDS_DELAY_RECEIVING_MSG,
+        max_wait_sec: float = COALESCE_MAX_WAIT_SEC,
+        inbox_max: int = CHANNEL_INBOX_MAX,
+        idle_sec: float = CHANNEL_ACTOR_IDLE_SEC,
+        inbox_policy: str = CHANNEL_INBOX_POLICY,
+    ):
+        self.quiet_sec = quiet_sec
+        self.max_wait_sec = max(quiet_sec, max_wait_sec)
+        self.inbox_max = max(1, inbox_max)
+        self.idle_sec = idle_sec
+        self.inbox_policy = inbox_policy
+        self._actors: Dict[int, ChannelActor] = {}
+        self.runs = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.dropped = 0
+
+    def submit(self, channel_id: int, work: Work) -> None:
+        actor = self._actors.get(channel_id)
+        if actor is None:
+            actor = self._actors[channel_id] = ChannelActor(channel_id, self)
+        actor.submit(work)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "actors": len(self._actors),
+            "pending": sum(a.pending for a in self._actors.values()),
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+        }
+
+
+channel_actors = ChannelActors()
+
+__all__ = ["channel_actors", "ChannelActors", "ChannelActor", "Work"]
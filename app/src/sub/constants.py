@@ -13,6 +13,10 @@ CONFIG: Config = dacite.from_dict(
     Config, yaml.safe_load(open(os.path.join(SCRIPT_DIR, "config.yaml"), "r"))
 )
 
+# Local state files (SQLite). Relative *_PATH values below resolve under DATA_DIR, not the CWD;
+# the default app/data is inside the compose volume (./app) and git-ignored.
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.normpath(os.path.join(SCRIPT_DIR, "..", "..", "data"))
+
 BOT_NAME = CONFIG.name
 EXAMPLE_CONVOS = CONFIG.example_conversations
 OPENAI_MODEL = CONFIG.model
@@ -20,9 +24,9 @@ OPENAI_PROMPT_TOKEN_COST = float(os.environ.get("OPENAI_PROMPT_TOKEN_COST", "0.0
 OPENAI_COMPLETION_TOKEN_COST = float(os.environ.get("OPENAI_COMPLETION_TOKEN_COST", "0.0"))  # USD per 1k tokens
 
 # Conversation summarization thresholds (heuristic)
-SUMMARY_TRIGGER_PROMPT_TOKENS = int(os.environ.get("SUMMARY_TRIGGER_PROMPT_TOKENS", "2800"))
-SUMMARY_TARGET_REDUCTION_RATIO = float(os.environ.get("SUMMARY_TARGET_REDUCTION_RATIO", "0.5"))  # reduce to 50% of chars heuristically
-SUMMARY_MAX_SOURCE_CHARS = int(os.environ.get("SUMMARY_MAX_SOURCE_CHARS", "8000"))  # upper bound to attempt summarization
+SUMMARY_BATCH_ITEMS = int(os.environ.get("SUMMARY_BATCH_ITEMS", "5"))  # evicted history entries folded into the rolling summary per update
+SUMMARY_MAX_CHARS = int(os.environ.get("SUMMARY_MAX_CHARS", "800"))  # rolling summary length cap
+SUMMARY_MAX_SOURCE_CHARS = int(os.environ.get("SUMMARY_MAX_SOURCE_CHARS", "8000"))  # bound on queued (not yet summarized) text per channel
 SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL", OPENAI_MODEL)
 
 DISCORD_BOT_TOKEN = os.environ["DISCORD_BOT_TOKEN"]
@@ -57,9 +61,37 @@ MAX_CHARS_PER_REPLY_MSG = (
 SECONDS_DELAY_RECEIVING_MSG = (
     3  # give a delay for the bot to respond so it can catch multiple messages
 )
+# Start the search decision / web search / channel history fetch during that delay (0/1)
+SPECULATIVE_PREFETCH = int(os.environ.get("SPECULATIVE_PREFETCH", "1"))
+# Per-channel burst coalescing (sub/channel_actor.py); the quiet window is SECONDS_DELAY_RECEIVING_MSG
+CHANNEL_INBOX_MAX = int(os.environ.get("CHANNEL_INBOX_MAX", "20"))  # queued messages per channel (oldest dropped)
+COALESCE_MAX_WAIT_SEC = float(os.environ.get("COALESCE_MAX_WAIT_SEC", "10"))  # answer a never-ending burst after this
+CHANNEL_ACTOR_IDLE_SEC = float(os.environ.get("CHANNEL_ACTOR_IDLE_SEC", "60"))  # idle actors exit
+CHANNEL_INBOX_POLICY = os.environ.get("CHANNEL_INBOX_POLICY", "drop_oldest")  # full inbox: drop_oldest | drop_newest
+
+# Global work admission and degradation ladder (sub/overload.py)
+WORK_MAX_CONCURRENT = int(os.environ.get("WORK_MAX_CONCURRENT", "8"))  # channel runs in flight across channels
+WORK_QUEUE_MAX = int(os.environ.get("WORK_QUEUE_MAX", "32"))  # runs waiting for a slot before shedding
+WORK_OVERLOAD_POLICY = os.environ.get("WORK_OVERLOAD_POLICY", "busy")  # full queue: busy (short notice) | drop
+DEGRADE_WAIT_MS = os.environ.get("DEGRADE_WAIT_MS", "3000,8000,15000")  # queue wait ms: skip search, fallback model, busy
+DEGRADE_HALF_LIFE_SEC = float(os.environ.get("DEGRADE_HALF_LIFE_SEC", "15"))  # wait EWMA decay when idle
+
+# Event-fed cache of recent channel messages (replaces channel.history() on every reply)
+CHANNEL_CACHE_ENABLED = int(os.environ.get("CHANNEL_CACHE_ENABLED", "1"))  # 0 = fetch history every turn
+CHANNEL_CACHE_MESSAGES = max(MAX_CHANNEL_MESSAGES, MAX_THREAD_MESSAGES)  # kept per channel (= backfill size)
+CHANNEL_CACHE_MAX_CHANNELS = int(os.environ.get("CHANNEL_CACHE_MAX_CHANNELS", "500"))  # LRU bound
 
 # History management for user identification
 HISTORY_MAX_ITEMS = int(os.environ.get("HISTORY_MAX_ITEMS", "30"))
+HISTORY_CONTEXT_CHARS = int(os.environ.get("HISTORY_CONTEXT_CHARS", "2000"))  # history sent per reply; older lines are summarized
+HISTORY_MAX_CHANNELS = int(os.environ.get("HISTORY_MAX_CHANNELS", "1000"))  # LRU bound (0 = unbounded)
+HISTORY_IDLE_TTL_SEC = int(os.environ.get("HISTORY_IDLE_TTL_SEC", "86400"))  # drop idle channels (0 = keep)
+HISTORY_MAX_BYTES = int(os.environ.get("HISTORY_MAX_BYTES", "0"))  # approx total size cap (0 = off)
+# Durable history (SQLite WAL, write-behind, loaded per channel on first touch)
+HISTORY_PERSIST_ENABLED = int(os.environ.get("HISTORY_PERSIST_ENABLED", "0"))  # opt-in: stores message text on disk
+HISTORY_PERSIST_PATH = os.path.join(DATA_DIR, os.environ.get("HISTORY_PERSIST_PATH", "history.sqlite3"))
+HISTORY_FLUSH_SEC = float(os.environ.get("HISTORY_FLUSH_SEC", "2"))  # write-behind interval
+HISTORY_COMPACT_SEC = float(os.environ.get("HISTORY_COMPACT_SEC", "3600"))  # purge idle channels + WAL checkpoint
 
 # Respond without explicit mention in normal channel messages (0/1). Default=1 (enabled)
 RESPOND_WITHOUT_MENTION = int(os.environ.get("RESPOND_WITHOUT_MENTION", "1"))
@@ -73,3 +105,76 @@ OPENAI_PRIMARY_TIMEOUT_SEC = int(os.environ.get("OPENAI_PRIMARY_TIMEOUT_SEC", "2
 OPENAI_FALLBACK_TIMEOUT_SEC = int(os.environ.get("OPENAI_FALLBACK_TIMEOUT_SEC", "8"))  # fallback model timeout
 OPENAI_FALLBACK_MODEL = os.environ.get("OPENAI_FALLBACK_MODEL", "")  # optional fallback model
 OPENAI_MAX_ATTEMPTS = int(os.environ.get("OPENAI_MAX_ATTEMPTS", "3"))  # max retry attempts
+
+# OpenAI HTTP transport ("aiohttp" = pooled asyncio session, "thread" = openai SDK via asyncio.to_thread)
+OPENAI_TRANSPORT = os.environ.get("OPENAI_TRANSPORT", "aiohttp").strip().lower()
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+OPENAI_HTTP_POOL_LIMIT = int(os.environ.get("OPENAI_HTTP_POOL_LIMIT", "32"))  # max pooled connections
+OPENAI_HTTP_KEEPALIVE_SEC = float(os.environ.get("OPENAI_HTTP_KEEPALIVE_SEC", "60"))  # idle keep-alive seconds
+OPENAI_HTTP_DNS_TTL_SEC = int(os.environ.get("OPENAI_HTTP_DNS_TTL_SEC", "300"))  # DNS cache TTL seconds
+# Ask for token usage on streamed calls (stream_options.include_usage): auto = only for api.openai.com, 1 / 0
+OPENAI_STREAM_USAGE = os.environ.get("OPENAI_STREAM_USAGE", "auto").strip().lower()
+
+# Streaming replies: post first tokens early, then edit in place (throttled for Discord edit rate limits)
+STREAM_REPLIES = int(os.environ.get("STREAM_REPLIES", "0"))  # 0/1
+STREAM_EDIT_INTERVAL_SEC = float(os.environ.get("STREAM_EDIT_INTERVAL_SEC", "1.2"))  # min seconds between edits
+STREAM_FIRST_CHUNK_CHARS = int(os.environ.get("STREAM_FIRST_CHUNK_CHARS", "20"))  # chars before the first post
+
+# Adaptive (AIMD) OpenAI concurrency, tracked per model
+OPENAI_CONCURRENCY_INITIAL = int(os.environ.get("OPENAI_CONCURRENCY_INITIAL", "3"))  # starting limit
+OPENAI_CONCURRENCY_MIN = int(os.environ.get("OPENAI_CONCURRENCY_MIN", "1"))  # floor after decreases
+OPENAI_CONCURRENCY_MAX = int(os.environ.get("OPENAI_CONCURRENCY_MAX", "16"))  # ceiling for increases
+OPENAI_CONCURRENCY_DECREASE_FACTOR = float(os.environ.get("OPENAI_CONCURRENCY_DECREASE_FACTOR", "0.5"))  # multiplicative cut on 429/overload/timeout
+
+# Client-side OpenAI budget (token buckets per model, 0 = disabled)
+OPENAI_TPM_LIMIT = int(os.environ.get("OPENAI_TPM_LIMIT", "0"))  # tokens per minute
+OPENAI_RPM_LIMIT = int(os.environ.get("OPENAI_RPM_LIMIT", "0"))  # requests per minute
+OPENAI_EXPECTED_COMPLETION_TOKENS = int(os.environ.get("OPENAI_EXPECTED_COMPLETION_TOKENS", "512"))  # charged up front, corrected from usage
+
+# Hedged requests: start the fallback model in parallel if the primary is slow (requires OPENAI_FALLBACK_MODEL)
+OPENAI_HEDGE_ENABLED = int(os.environ.get("OPENAI_HEDGE_ENABLED", "0"))  # 0/1
+OPENAI_HEDGE_DELAY_SEC = float(os.environ.get("OPENAI_HEDGE_DELAY_SEC", "0"))  # fixed delay; 0 = rolling percentile of primary latency
+OPENAI_HEDGE_PERCENTILE = float(os.environ.get("OPENAI_HEDGE_PERCENTILE", "0.9"))  # percentile used when delay is automatic
+OPENAI_HEDGE_MIN_DELAY_SEC = float(os.environ.get("OPENAI_HEDGE_MIN_DELAY_SEC", "2.0"))  # lower bound for the automatic delay
+
+# Per-model circuit breaker (skip straight to fallback while the primary is degraded)
+OPENAI_BREAKER_ENABLED = int(os.environ.get("OPENAI_BREAKER_ENABLED", "1"))  # 0/1
+OPENAI_BREAKER_WINDOW_SEC = float(os.environ.get("OPENAI_BREAKER_WINDOW_SEC", "60"))  # rolling outcome window
+OPENAI_BREAKER_MIN_REQUESTS = int(os.environ.get("OPENAI_BREAKER_MIN_REQUESTS", "10"))  # samples before rates are trusted
+OPENAI_BREAKER_ERROR_RATE = float(os.environ.get("OPENAI_BREAKER_ERROR_RATE", "0.5"))  # open at this failure ratio
+OPENAI_BREAKER_TIMEOUT_RATE = float(os.environ.get("OPENAI_BREAKER_TIMEOUT_RATE", "0.3"))  # open at this timeout ratio
+OPENAI_BREAKER_OPEN_SEC = float(os.environ.get("OPENAI_BREAKER_OPEN_SEC", "30"))  # stay open before probing
+OPENAI_BREAKER_HALF_OPEN_PROBES = int(os.environ.get("OPENAI_BREAKER_HALF_OPEN_PROBES", "2"))  # trial calls (all must succeed to close)
+
+# Priority scheduling of queued OpenAI calls: one priority level is worth this many seconds of waiting (aging)
+OPENAI_PRIORITY_AGING_SEC = float(os.environ.get("OPENAI_PRIORITY_AGING_SEC", "5"))
+
+# Share one upstream call between identical concurrent requests (same model + rendered messages) (1=on)
+OPENAI_SINGLE_FLIGHT = int(os.environ.get("OPENAI_SINGLE_FLIGHT", "1"))
+
+# Persistent exact-match completion cache (SQLite, opt-in)
+COMPLETION_CACHE_ENABLED = int(os.environ.get("COMPLETION_CACHE_ENABLED", "0"))
+COMPLETION_CACHE_PATH = os.path.join(DATA_DIR, os.environ.get("COMPLETION_CACHE_PATH", "completion_cache.sqlite3"))
+COMPLETION_CACHE_TTL_SEC = int(os.environ.get("COMPLETION_CACHE_TTL_SEC", "86400"))
+COMPLETION_CACHE_MAX_BYTES = int(os.environ.get("COMPLETION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Near-duplicate answer cache for search-backed questions (MinHash/LSH, in-process, opt-in)
+NEAR_DUP_CACHE_ENABLED = int(os.environ.get("NEAR_DUP_CACHE_ENABLED", "0"))
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.5"))  # Jaccard similarity of char n-grams
+NEAR_DUP_NGRAM = int(os.environ.get("NEAR_DUP_NGRAM", "2"))
+NEAR_DUP_CACHE_TTL_SEC = int(os.environ.get("NEAR_DUP_CACHE_TTL_SEC", "600"))
+NEAR_DUP_CACHE_MAX_ITEMS = int(os.environ.get("NEAR_DUP_CACHE_MAX_ITEMS", "5000"))
+
+# Token-budgeted prompt assembly (sections are trimmed to fit before sending)
+OPENAI_CONTEXT_WINDOW = int(os.environ.get("OPENAI_CONTEXT_WINDOW", "0"))  # 0 = from the model name table (token_utils.MODELS)
+PROMPT_MAX_TOKENS = int(os.environ.get("PROMPT_MAX_TOKENS", "16000"))  # hard prompt cap below the window (cost control; also limits large-window models); 0 = window only
+PROMPT_COMPLETION_RESERVE_TOKENS = int(os.environ.get("PROMPT_COMPLETION_RESERVE_TOKENS", "1024"))  # kept free for the reply
+
+# Usage ledger (tokens / cost per guild, channel, user, model, purpose) and daily quotas
+USAGE_LEDGER_ENABLED = int(os.environ.get("USAGE_LEDGER_ENABLED", "0"))  # 0/1 (opt-in: writes to DATA_DIR)
+USAGE_LEDGER_PATH = os.path.join(DATA_DIR, os.environ.get("USAGE_LEDGER_PATH", "usage.sqlite3"))
+USAGE_FLUSH_SEC = float(os.environ.get("USAGE_FLUSH_SEC", "10"))  # write-behind interval
+USAGE_DAILY_TOKEN_LIMIT_GUILD = int(os.environ.get("USAGE_DAILY_TOKEN_LIMIT_GUILD", "0"))  # 0 = unlimited
+USAGE_DAILY_TOKEN_LIMIT_USER = int(os.environ.get("USAGE_DAILY_TOKEN_LIMIT_USER", "0"))
+USAGE_DAILY_COST_LIMIT_GUILD = float(os.environ.get("USAGE_DAILY_COST_LIMIT_GUILD", "0"))  # same unit as OPENAI_*_TOKEN_COST
+USAGE_DAILY_COST_LIMIT_USER = float(os.environ.get("USAGE_DAILY_COST_LIMIT_USER", "0"))
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from typing import Optional, List, Union
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Message:
     user: str
     role: str
@@ -0,0 +1,216 @@
+"""Event-fed cache of recent converted channel messages.
+
+Responsibilities:
+  - Keep the last CHANNEL_CACHE_MESSAGES converted Messages per channel,
+    maintained from gateway events (on_message / on_message_edit /
+    on_raw_message_delete), so building a reply no longer calls
+    channel.history() and re-converts every message on each turn.
+  - Backfill from the API only when a channel is cold: first use, evicted
+    from the LRU, or invalidated by a detected gap (reconnect with a new
+    session, an edit of a message discord.py no longer has cached, or the
+    message being answered missing from the cache). Concurrent callers share
+    one backfill; events arriving during it are merged on top.
+  - Bound memory: at most CHANNEL_CACHE_MAX_CHANNELS channels (LRU).
+
+Entries are keyed by message id in arrival order; messages that convert to
+None (e.g. embed-only) are kept as None so a later edit lands in place.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import discord
+from sub.core.base import Message
+from sub.constants import (
+    CHANNEL_CACHE_ENABLED,
+    CHANNEL_CACHE_MESSAGES,
+    CHANNEL_CACHE_MAX_CHANNELS,
+)
+from sub.discord.discord_utils import discord_message_to_message
+from sub.infra.logging import log_event
+
+# marks a message deleted while its channel was being backfilled
+_DELETED = object()
+
+
+async def fetch_channel_messages(channel, limit: int) -> List[Message]:
+    """channel.history() converted, oldest -> newest (uncached path)."""
+    converted = [discord_message_to_message(m) async for m in channel.history(limit=limit)]
+    filtered = [x for x in converted if x is not None]
+    filtered.reverse()
+    return filtered
+
+
+class _ChannelState:
+    __slots__ = ("entries", "warm", "backfill", "reason")
+
+    def __init__(self):
+        # message id -> Message (None: not convertible, _DELETED: tombstone during backfill)
+        self.entries: "OrderedDict[int, object]" = OrderedDict()
+        self.warm = False
+        self.backfill: Optional[asyncio.Task] = None
+        self.reason = "cold"  # why the next backfill is needed (logged)
+
+
+class ChannelMessageCache:
+    def __init__(self, max_messages: int = CHANNEL_CACHE_MESSAGES, max_channels: int = CHANNEL_CACHE_MAX_CHANNELS):
+        self.max_messages = max_messages
+        self.max_channels = max_channels
+        self._channels: "OrderedDict[int, _ChannelState]" = OrderedDict()
+        self.hits = 0
+        self.backfills = 0
+        self.gaps = 0
+        self.events = 0
+
+    def _state(self, channel_id: int, create: bool = False) -> Optional[_ChannelState]:
+        state = self._channels.get(channel_id)
+        if state is not None:
+            self._channels.move_to_end(channel_id)
+        elif create:
+            state = self._channels[channel_id] = _ChannelState()
+            while len(self._channels) > self.max_channels:
+                _, old = self._channels.popitem(last=False)
+                if old.backfill is not None:
+                    old.backfill.cancel()
+        return state
+
+    def _trim(self, state: _ChannelState) -> None:
+        while len(state.entries) > self.max_messages:
+            state.entries.popitem(last=False)
+
+    # ---- gateway events ----
+    def on_message(self, message: discord.Message) -> None:
+        state = self._state(message.channel.id)
+        if state is None or not (state.warm or state.backfill):
+            return  # cold: the next backfill fetches it
+        self.events += 1
+        state.entries[message.id] = discord_message_to_message(message)
+        self._trim(state)
+
+    def on_message_edit(self, after: discord.Message) -> None:
+        state = self._state(after.channel.id)
+        if state is None or after.id not in state.entries:
+            return
+        self.events += 1
+        if state.entries[after.id] is not _DELETED:
+            state.entries[after.id] = discord_message_to_message(after)
+
+    def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        """Edit of a message discord.py no longer caches: no on_message_edit follows."""
+        if payload.cached_message is not None:
+            return
+        state = self._state(payload.channel_id)
+        if state is not None and payload.message_id in state.entries:
+            self.invalidate(payload.channel_id, reason="uncached_edit")
+
+    def on_raw_message_delete(self, channel_id: int, message_ids: Iterable[int]) -> None:
+        state = self._state(channel_id)
+        if state is None:
+            return
+        for message_id in message_ids:
+            self.events += 1
+            if state.backfill is not None:
+                state.entries[message_id] = _DELETED
+            else:
+                state.entries.pop(message_id, None)
+
+    def invalidate(self, channel_id: Optional[int] = None, reason: str = "gap") -> None:
+        """Mark one channel (or all, e.g. after a reconnect) cold."""
+        states = [self._channels.get(channel_id)] if channel_id is not None else list(self._channels.values())
+        dropped = 0
+        for state in states:
+            if state is None or not (state.warm or state.backfill):
+                continue
+            dropped += 1
+            if state.backfill is not None:
+                state.backfill.cancel()
+                state.backfill = None
+            state.entries = OrderedDict()
+            state.warm = False
+            state.reason = reason
+        if dropped:
+            self.gaps += 1
+            log_event("channel_cache_invalidate", reason=reason, channels=dropped)
+
+    # ---- reads ----
+    def _start_backfill(self, channel, state: _ChannelState) -> asyncio.Task:
+        if state.backfill is None:
+            state.backfill = asyncio.ensure_future(self._backfill(channel, state))
+        return state.backfill
+
+    async def _backfill(self, channel, state: _ChannelState) -> None:
+        try:
+            await self._fill(channel, state)
+        finally:
+            if state.backfill is asyncio.current_task():
+                state.backfill = None
+
+    async def _fill(self, channel, state: _ChannelState) -> None:
+        t0 = time.perf_counter()
+        history = [m async for m in channel.history(limit=self.max_messages)]
+        history.reverse()
+        merged: "OrderedDict[int, object]" = OrderedDict((m.id, discord_message_to_message(m)) for m in history)
+        # events seen while fetching win over the (possibly older) API copy
+        for message_id, value in state.entries.items():
+            if value is _DELETED:
+                merged.pop(message_id, None)
+            else:
+                merged[message_id] = value
+        state.entries = OrderedDict(sorted(merged.items()))
+        self._trim(state)
+        state.warm = True
+        self.backfills += 1
+        log_event(
+            "channel_cache_backfill",
+            channel_id=channel.id,
+            reason=state.reason,
+            fetched=len(history),
+            ms=f"{(time.perf_counter() - t0) * 1000:.1f}",
+        )
+
+    async def get(self, channel, limit: int, expect_id: Optional[int] = None) -> List[Message]:
+        """Newest ``limit`` converted messages, oldest -> newest.
+
+        expect_id: the message being answered; if the cache does not have it
+        events were missed, so the channel is backfilled again.
+        """
+        state = self._state(channel.id, create=True)
+        if state.warm and expect_id is not None and expect_id not in state.entries:
+            self.invalidate(channel.id, reason="missing_message")
+        if state.warm:
+            self.hits += 1
+        while not state.warm:
+            backfill = self._start_backfill(channel, state)
+            try:
+                await asyncio.shield(backfill)
+            except asyncio.CancelledError:
+                if not backfill.cancelled():
+                    raise  # this caller was cancelled
+                # invalidated / evicted mid-fetch: start over
+                state = self._state(channel.id, create=True)
+        values = [v for v in state.entries.values() if v is not None and v is not _DELETED]
+        return values[-limit:] if limit > 0 else []
+
+    def prefetch(self, channel) -> None:
+        """Start the backfill of a cold channel without waiting for it."""
+        state = self._state(channel.id, create=True)
+        if not state.warm and state.backfill is None:
+            # failures are retried (and raised) by the next get()
+            self._start_backfill(channel, state).add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._channels),
+            "warm": sum(1 for s in self._channels.values() if s.warm),
+            "hits": self.hits,
+            "backfills": self.backfills,
+            "gaps": self.gaps,
+            "events": self.events,
+        }
+
+
+# singleton (None when CHANNEL_CACHE_ENABLED=0)
+channel_cache: Optional[ChannelMessageCache] = ChannelMessageCache() if CHANNEL_CACHE_ENABLED else None
+
+__all__ = ["channel_cache", "ChannelMessageCache", "fetch_channel_messages"]
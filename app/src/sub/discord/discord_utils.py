@@ -1,4 +1,5 @@
 import discord
+import sys
 from typing import Optional, List
 from sub.core.base import Message
 from sub.constants import MAX_CHARS_PER_REPLY_MSG, INACTIVATE_THREAD_PREFIX
@@ -27,9 +28,9 @@ def discord_message_to_message(message: discord.Message) -> Optional[Message]:
                             "type": "image_url",
                             "image_url": {"url": attachment.url}
                         })
-                return Message(role=role, user=message.author.name, content=content_list)
+                return Message(role=role, user=sys.intern(message.author.name), content=content_list)
             else:
-                return Message(role=role, user=message.author.name, content=message.content)
+                return Message(role=role, user=sys.intern(message.author.name), content=message.content)
     return None
 
 def split_into_shorter_messages(message: str) -> List[str]:
@@ -38,16 +39,6 @@ def split_into_shorter_messages(message: str) -> List[str]:
         for i in range(0, len(message), MAX_CHARS_PER_REPLY_MSG)
     ]
 
-def is_last_message_stale(
-    interaction_message: discord.Message, last_message: discord.Message, bot_id: str
-) -> bool:
-    return (
-        last_message
-        and last_message.id != interaction_message.id
-        and last_message.author
-        and last_message.author.id != bot_id
-    )
-
 async def close_thread(thread: discord.Thread):
     await thread.edit(name=INACTIVATE_THREAD_PREFIX)
     await thread.send(
@@ -61,6 +52,5 @@ async def close_thread(thread: discord.Thread):
 __all__ = [
     'discord_message_to_message',
     'split_into_shorter_messages',
-    'is_last_message_stale',
     'close_thread'
 ]
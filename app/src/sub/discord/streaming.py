@@ -0,0 +1,121 @@
+"""Progressive rendering of a streamed LLM reply into Discord messages.
+
+Flow:
+  - push(text) is called with the FULL text accumulated so far (cheap, sync).
+  - Once STREAM_FIRST_CHUNK_CHARS are available the first message is sent.
+  - A single pump task re-renders at most every STREAM_EDIT_INTERVAL_SEC,
+    editing messages in place (Discord allows ~5 edits / 5s per channel).
+  - Text beyond MAX_CHARS_PER_REPLY_MSG rolls over into a new message.
+  - finalize(text) renders the final (prefixed / sanitized) reply exactly once
+    more and trims surplus messages; discard() deletes partial output.
+"""
+from __future__ import annotations
+import asyncio
+from typing import List, Optional
+import discord
+from sub.constants import STREAM_EDIT_INTERVAL_SEC, STREAM_FIRST_CHUNK_CHARS
+from sub.discord.discord_utils import split_into_shorter_messages
+from sub.infra.logging import logger, log_event
+
+_CURSOR = " ▌"
+
+
+class StreamingReply:
+    def __init__(
+        self,
+        channel: discord.abc.Messageable,
+        edit_interval: float = STREAM_EDIT_INTERVAL_SEC,
+        first_chunk_chars: int = STREAM_FIRST_CHUNK_CHARS,
+    ):
+        self.channel = channel
+        self.edit_interval = edit_interval
+        self.first_chunk_chars = first_chunk_chars
+        self._text = ""
+        self._messages: List[discord.Message] = []
+        self._rendered: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._finalized = False
+        self.edits = 0
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def push(self, text: str) -> None:
+        """Replace the pending text; rendering happens on the pump task."""
+        if self._closed.is_set():
+            return
+        self._text = text
+        if self._task is None:
+            if len(text.strip()) >= self.first_chunk_chars:
+                self._task = asyncio.create_task(self._pump())
+        else:
+            self._wake.set()
+
+    async def _pump(self) -> None:
+        try:
+            while not self._closed.is_set():
+                self._wake.clear()
+                await self._render(self._text, cursor=True)
+                # throttle: wait the edit interval unless finalize() closes us
+                try:
+                    await asyncio.wait_for(self._closed.wait(), timeout=self.edit_interval)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                if not self._wake.is_set():
+                    waiter = asyncio.create_task(self._wake.wait())
+                    closer = asyncio.create_task(self._closed.wait())
+                    done, pending = await asyncio.wait({waiter, closer}, return_when=asyncio.FIRST_COMPLETED)
+                    for t in pending:
+                        t.cancel()
+        except Exception as e:
+            logger.warning(f"[stream] render failed error={e}")
+
+    async def _render(self, text: str, cursor: bool) -> None:
+        async with self._lock:
+            chunks = split_into_shorter_messages(text) if text else []
+            if cursor and chunks:
+                chunks[-1] = chunks[-1] + _CURSOR
+            for i, chunk in enumerate(chunks):
+                if i < len(self._messages):
+                    if self._rendered[i] != chunk:
+                        await self._messages[i].edit(content=chunk)
+                        self._rendered[i] = chunk
+                        self.edits += 1
+                else:
+                    self._messages.append(await self.channel.send(chunk))
+                    self._rendered.append(chunk)
+            # text shrank (retry restarted / fallback model): drop surplus messages
+            while len(self._messages) > len(chunks):
+                msg = self._messages.pop()
+                self._rendered.pop()
+                try:
+                    await msg.delete()
+                except Exception as e:
+                    logger.warning(f"[stream] delete surplus failed error={e}")
+
+    async def _stop(self) -> None:
+        self._closed.set()
+        if self._task is not None:
+            await self._task
+
+    async def finalize(self, text: str) -> None:
+        """Render the final reply (no cursor) and stop the pump."""
+        await self._stop()
+        await self._render(text, cursor=False)
+        self._finalized = True
+        log_event("stream_finalize", messages=len(self._messages), edits=self.edits, chars=len(text))
+
+    async def discard(self) -> None:
+        """Stop streaming and delete any partial messages (no-op after finalize)."""
+        if self._finalized:
+            return
+        await self._stop()
+        await self._render("", cursor=False)
+
+
+__all__ = ["StreamingReply"]
@@ -1,28 +1,38 @@
 import discord
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
 import asyncio
-from datetime import datetime
+import time
 from sub.llm.completion import (
     generate_completion_response,
     process_thread_response,
     process_channel_response,
+    start_search_prefetch,
+    SearchPrefetch,
+    CompletionData,
+    CompletionResult,
 )
 from sub.infra.logging import logger
 from sub.discord.discord_utils import (
     close_thread,
-    is_last_message_stale,
     discord_message_to_message,
 )
+from sub.discord.channel_cache import channel_cache, fetch_channel_messages
 from sub.constants import (
     ACTIVATE_THREAD_PREFX,
     MAX_THREAD_MESSAGES,
     MAX_CHANNEL_MESSAGES,
     SECONDS_DELAY_RECEIVING_MSG,
+    SPECULATIVE_PREFETCH,
+    STREAM_REPLIES,
 )
 from sub.history_store import HistoryEntry, HistoryStore
-from sub.format_conversation import create_conversation_context
+from sub.channel_actor import channel_actors, Work
+from sub.overload import work_gate, WorkShed, DegradeLevel, BUSY_MESSAGE
+from sub.llm.concurrency import LLMPriority
+from sub.llm.summarizer import summarizer
+from sub.format_conversation import append_current_message
 
-async def thread_chat(message, client: discord.Client, history_store: HistoryStore) -> bool:
+async def thread_chat(message, client: discord.Client, history_store: HistoryStore, priority: int = LLMPriority.MENTION) -> bool:
     logger.info("thread_chat called")
     thread: discord.Thread = message.channel
 
@@ -35,112 +45,165 @@ async def thread_chat(message, client: discord.Client, history_store: HistorySto
         await close_thread(thread=thread)
         return False
 
-    # Debounce
-    if SECONDS_DELAY_RECEIVING_MSG > 0:
-        await asyncio.sleep(SECONDS_DELAY_RECEIVING_MSG)
-        if is_last_message_stale(
-            interaction_message=message,
-            last_message=thread.last_message,
-            bot_id=client.user.id,
-        ):
-            return False
-
-    logger.info(
-        f"Thread message to process - {message.author}: {message.content[:50]} - {thread.name} {thread.jump_url}"
-    )
-
-    conversation_context, channel_messages = await _prepare_context_and_messages(
-        message=message,
-        history_store=history_store,
-        max_messages=MAX_THREAD_MESSAGES,
-    )
-
-    async with thread.typing():
-        response_data = await generate_completion_response(
-            user=message.author, messages=channel_messages, conversation_context=conversation_context
+    async def run(burst: List[discord.Message], burst_priority: int) -> Optional[CompletionData]:
+        logger.info(
+            f"Thread message to process - {message.author}: {message.content[:50]} - {thread.name} {thread.jump_url} burst={len(burst)}"
+        )
+        conversation_context, conversation_summary, channel_messages = await _prepare_context_and_messages(
+            message=message,
+            history_store=history_store,
+            max_messages=MAX_THREAD_MESSAGES,
+            channel_messages=prefetched_messages,
+            burst=burst,
+        )
+        try:
+            async with work_gate.admit(burst_priority) as level:
+                if level >= DegradeLevel.BUSY:
+                    return _busy_reply(burst_priority, prefetch)
+                async with thread.typing():
+                    return await generate_completion_response(
+                        user=message.author, messages=channel_messages, conversation_context=conversation_context,
+                        conversation_summary=conversation_summary,
+                        stream=bool(STREAM_REPLIES), channel=thread, priority=burst_priority,
+                        latest_message=discord_message_to_message(message), prefetch=prefetch,
+                        degrade=level,
+                    )
+        except WorkShed as e:
+            return _busy_reply(burst_priority if e.policy == "busy" else None, prefetch)
+
+    async def deliver(response_data: Optional[CompletionData]) -> None:
+        if response_data is None:
+            return
+        await process_thread_response(
+            user=message.author, thread=thread, response_data=response_data
         )
 
-    if is_last_message_stale(
-        interaction_message=message,
-        last_message=thread.last_message,
-        bot_id=client.user.id,
-    ):
-        return False
-
-    await process_thread_response(
-        user=message.author, thread=thread, response_data=response_data
-    )
+    prefetch, prefetched_messages = _start_prefetch(message, MAX_THREAD_MESSAGES)
+    channel_actors.submit(thread.id, Work(
+        message=message, priority=priority, run=run, deliver=deliver,
+        discard=lambda: _cancel_prefetch(prefetch, prefetched_messages),
+    ))
     return True
 
-async def channel_chat(message, client: discord.Client, history_store: HistoryStore) -> bool:
+async def channel_chat(message, client: discord.Client, history_store: HistoryStore, priority: int = LLMPriority.MENTION) -> bool:
     logger.info("channel_chat called")
     channel: discord.TextChannel = message.channel
 
-    # Debounce
-    if SECONDS_DELAY_RECEIVING_MSG > 0:
-        await asyncio.sleep(SECONDS_DELAY_RECEIVING_MSG)
-        if is_last_message_stale(
-            interaction_message=message,
-            last_message=channel.last_message,
-            bot_id=client.user.id,
-        ):
-            return False
-
-    logger.info(
-        f"Channel message to process - {message.author}: {message.content[:50]} - {channel.name} {channel.jump_url}"
-    )
-
-    conversation_context, channel_messages = await _prepare_context_and_messages(
-        message=message,
-        history_store=history_store,
-        max_messages=MAX_CHANNEL_MESSAGES,
-    )
-
-    async with channel.typing():
-        response_data = await generate_completion_response(
-            user=message.author, messages=channel_messages, conversation_context=conversation_context
+    async def run(burst: List[discord.Message], burst_priority: int) -> Optional[CompletionData]:
+        logger.info(
+            f"Channel message to process - {message.author}: {message.content[:50]} - {channel.name} {channel.jump_url} burst={len(burst)}"
+        )
+        conversation_context, conversation_summary, channel_messages = await _prepare_context_and_messages(
+            message=message,
+            history_store=history_store,
+            max_messages=MAX_CHANNEL_MESSAGES,
+            channel_messages=prefetched_messages,
+            burst=burst,
+        )
+        try:
+            async with work_gate.admit(burst_priority) as level:
+                if level >= DegradeLevel.BUSY:
+                    return _busy_reply(burst_priority, prefetch)
+                async with channel.typing():
+                    return await generate_completion_response(
+                        user=message.author, messages=channel_messages, conversation_context=conversation_context,
+                        conversation_summary=conversation_summary,
+                        stream=bool(STREAM_REPLIES), channel=channel, priority=burst_priority,
+                        latest_message=discord_message_to_message(message), prefetch=prefetch,
+                        degrade=level,
+                    )
+        except WorkShed as e:
+            return _busy_reply(burst_priority if e.policy == "busy" else None, prefetch)
+
+    async def deliver(response_data: Optional[CompletionData]) -> None:
+        if response_data is None:
+            return
+        await process_channel_response(
+            user=message.author, channel=channel, response_data=response_data
         )
 
-    await process_channel_response(
-        user=message.author, channel=channel, response_data=response_data
-    )
+    prefetch, prefetched_messages = _start_prefetch(message, MAX_CHANNEL_MESSAGES)
+    channel_actors.submit(channel.id, Work(
+        message=message, priority=priority, run=run, deliver=deliver,
+        discard=lambda: _cancel_prefetch(prefetch, prefetched_messages),
+    ))
     return True
 
+def _busy_reply(priority: Optional[int], prefetch: Optional[SearchPrefetch]) -> Optional[CompletionData]:
+    """Short notice instead of a reply under overload; None drops the reply
+    (priority None, or passive chatter). Stops the unused search prefetch."""
+    if prefetch is not None:
+        prefetch.cancel()
+    if priority is None or priority >= LLMPriority.FALLBACK:
+        return None
+    return CompletionData(status=CompletionResult.OK, reply_text=BUSY_MESSAGE, status_text=None)
+
+def _start_prefetch(
+    message: discord.Message, max_messages: int
+) -> Tuple[Optional[SearchPrefetch], Optional["asyncio.Task[List]"]]:
+    """With SPECULATIVE_PREFETCH, start the search decision / web search and the
+    channel history fetch (the cache backfill when the channel cache is on and
+    cold) while the channel actor waits for the burst to end.
+
+    The prefetch of a message that gets coalesced into a later one (or whose
+    run is cancelled) is cancelled through Work.discard.
+    """
+    if not SPECULATIVE_PREFETCH or SECONDS_DELAY_RECEIVING_MSG <= 0:
+        return None, None
+    prefetch = start_search_prefetch(discord_message_to_message(message), message.channel)
+    if channel_cache is not None:
+        channel_cache.prefetch(message.channel)  # read when the run starts: later edits apply
+        return prefetch, None
+    return prefetch, asyncio.ensure_future(get_channel_messages(message, max_messages))
+
+def _cancel_prefetch(prefetch: Optional[SearchPrefetch], channel_messages: Optional[asyncio.Task]) -> None:
+    if prefetch is not None:
+        prefetch.cancel()
+    if channel_messages is not None:
+        channel_messages.cancel()
+
 async def get_channel_messages(message: discord.Message, limit: int) -> List:
-    # Collect + convert
-    converted = [
-        discord_message_to_message(m)
-        async for m in message.channel.history(limit=limit)
-    ]
-    filtered = [x for x in converted if x is not None]
-    filtered.reverse()  # chronological order oldest -> newest
-    return filtered
+    # chronological order oldest -> newest; served from the event-fed cache when enabled
+    if channel_cache is not None:
+        return await channel_cache.get(message.channel, limit, expect_id=message.id)
+    return await fetch_channel_messages(message.channel, limit)
 
 async def _prepare_context_and_messages(
     message: discord.Message,
     history_store: HistoryStore,
     max_messages: int,
-) -> Tuple[str, List]:
-    """Add current message to history, build conversation context, fetch channel messages.
-
-    Returns: (conversation_context, channel_messages)
+    channel_messages: Optional[asyncio.Task] = None,
+    burst: Optional[Sequence[discord.Message]] = None,
+) -> Tuple[str, str, "asyncio.Task[List]"]:
+    """Add current message to history, build conversation context, start fetching channel messages.
+
+    burst: every message coalesced into this reply (oldest -> newest, ending
+    with message); all of them are added to history_store.
+
+    Returns: (conversation_context, conversation_summary, channel_messages)
+    conversation_summary covers entries already evicted from history_store
+    (maintained in the background by sub.llm.summarizer; read without waiting).
+    channel_messages is a running task (the one started on arrival when
+    given): generate_completion_response awaits it while the search
+    decision / web search proceed concurrently.
     """
     channel_id = str(message.channel.id)
-    history_entry = HistoryEntry(
-        user_id=str(message.author.id),
-        username=message.author.display_name or message.author.name,
-        content=message.content,
-        source="text",
-        timestamp=datetime.now(),
-    )
-    history_store.add_message(channel_id, history_entry)
-
-    history_entries = history_store.get_history(channel_id)
-    conversation_context = create_conversation_context(
-        history_entries[:-1],  # exclude current
+    await history_store.warm(channel_id)  # persisted history after a restart (first touch only)
+    for m in burst or [message]:
+        history_store.add_message(channel_id, HistoryEntry(
+            user_id=m.author.id,
+            username=m.author.display_name or m.author.name,
+            content=m.content,
+            source="text",
+            timestamp=time.time(),
+        ))
+
+    conversation_context = append_current_message(
+        history_store.render_history(channel_id, skip_newest=1),  # exclude current; window = context_chars
         message.content,
         str(message.author.id),
         message.author.display_name or message.author.name,
     )
-    channel_messages = await get_channel_messages(message, max_messages)
-    return conversation_context, channel_messages
\ No newline at end of file
+    if channel_messages is None:
+        channel_messages = asyncio.ensure_future(get_channel_messages(message, max_messages))
+    return conversation_context, summarizer.get(channel_id), channel_messages
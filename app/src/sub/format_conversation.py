@@ -1,61 +1,140 @@
-from typing import List
-from .history_store import HistoryEntry
+from __future__ import annotations
+from bisect import bisect_left
+from collections import deque
+from itertools import islice
+from typing import TYPE_CHECKING, Deque, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .history_store import HistoryEntry
+
+
+def format_entry(entry: HistoryEntry) -> str:
+    """Format: username(userId): content"""
+    return f"{entry.username}({entry.user_id}): {entry.content}"
 
 
 def format_conversation_history(history_entries: List[HistoryEntry], max_chars: int = 2000) -> str:
     """
     Format conversation history for GPT prompt in the format:
     username(userId): content
-    
+
     Args:
         history_entries: List of HistoryEntry objects in chronological order
         max_chars: Maximum character limit for the formatted output (for token control)
-    
+
     Returns:
         Formatted conversation history string
     """
     if not history_entries:
         return ""
-    
+
     formatted_lines = []
-    
+    total = -1  # no newline before the first line
+
     # Process from most recent to oldest to prioritize recent messages
     for entry in reversed(history_entries):
-        # Format: username(userId): content
-        formatted_line = f"{entry.username}({entry.user_id}): {entry.content}"
-        
-        # Add to the beginning of the list to maintain chronological order
-        formatted_lines.insert(0, formatted_line)
-        
-        # Check if the current result exceeds character limit
-        current_result = "\n".join(formatted_lines)
-        if len(current_result) > max_chars:
-            # Remove the line we just added and stop
-            formatted_lines.pop(0)
+        formatted_line = format_entry(entry)
+
+        # Stop at the first line that would exceed the character limit
+        total += len(formatted_line) + 1
+        if total > max_chars:
             break
-    
+        formatted_lines.append(formatted_line)
+
+    formatted_lines.reverse()  # chronological order
     return "\n".join(formatted_lines)
 
 
+class ConversationLines:
+    """Incrementally formatted history of one channel.
+
+    Keeps the formatted lines plus running character offsets, so append /
+    evict are O(1) and the newest-lines window that fits ``max_chars`` is
+    found by bisect instead of re-joining; the window text is joined once
+    and cached until the next change. Same output as
+    format_conversation_history over the same entries.
+    """
+
+    __slots__ = ("lines", "_ends", "_start", "_version", "_cache")
+
+    def __init__(self):
+        self.lines: Deque[str] = deque()
+        # absolute end offset of each line counting one separator per line
+        # (monotonic; evicting from the left only moves _start)
+        self._ends: Deque[int] = deque()
+        self._start = 0
+        self._version = 0
+        self._cache: Optional[Tuple[Tuple[int, int, int], str]] = None
+
+    def append(self, entry: HistoryEntry) -> str:
+        line = format_entry(entry)
+        end = self._ends[-1] if self._ends else self._start
+        self.lines.append(line)
+        self._ends.append(end + len(line) + 1)
+        self._version += 1
+        return line
+
+    def popleft(self) -> str:
+        self._start = self._ends.popleft()
+        self._version += 1
+        return self.lines.popleft()
+
+    def clear(self) -> None:
+        self.lines.clear()
+        self._ends.clear()
+        self._start = 0
+        self._version += 1
+
+    @property
+    def chars(self) -> int:
+        """Length of all lines joined with newlines."""
+        return max(0, (self._ends[-1] if self._ends else self._start) - self._start - 1)
+
+    def chars_before_newest(self) -> int:
+        """Length of all lines but the newest joined with newlines."""
+        return max(0, (self._ends[-2] if len(self._ends) > 1 else self._start) - self._start - 1)
+
+    def window(self, max_chars: int = 2000, skip_newest: int = 0) -> str:
+        """Newest lines whose join fits max_chars, excluding the last skip_newest."""
+        last = len(self.lines) - 1 - skip_newest
+        if last < 0:
+            return ""
+        key = (self._version, max_chars, skip_newest)
+        if self._cache is not None and self._cache[0] == key:
+            return self._cache[1]
+        # lines first..last fit when _ends[last] - start(first) - 1 <= max_chars
+        threshold = self._ends[last] - 1 - max_chars
+        if self._start >= threshold:
+            first = 0
+        else:
+            first = bisect_left(self._ends, threshold, 0, last + 1) + 1
+        text = "\n".join(islice(self.lines, first, last + 1)) if first <= last else ""
+        self._cache = (key, text)
+        return text
+
+
+def append_current_message(history_text: str, current_message: str, current_user_id: str, current_username: str) -> str:
+    """Append the current message (same format) to already formatted history."""
+    current_msg_formatted = f"{current_username}({current_user_id}): {current_message}"
+
+    if history_text:
+        return f"{history_text}\n{current_msg_formatted}"
+    else:
+        return current_msg_formatted
+
+
 def create_conversation_context(history_entries: List[HistoryEntry], current_message: str, current_user_id: str, current_username: str) -> str:
     """
     Create full conversation context including history and current message
-    
+
     Args:
         history_entries: Previous conversation history
         current_message: The current message content
         current_user_id: Current message author's user ID
         current_username: Current message author's username
-    
+
     Returns:
         Complete conversation context for GPT
     """
     history_text = format_conversation_history(history_entries)
-    
-    # Add current message in the same format
-    current_msg_formatted = f"{current_username}({current_user_id}): {current_message}"
-    
-    if history_text:
-        return f"{history_text}\n{current_msg_formatted}"
-    else:
-        return current_msg_formatted
\ No newline at end of file
+    return append_current_message(history_text, current_message, current_user_id, current_username)
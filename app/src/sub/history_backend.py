@@ -0,0 +1,263 @@
+"""Durable backend for HistoryStore (SQLite, write-behind, lazy per channel).
+
+Responsibilities:
+  - Persist conversation history so a restart / deploy keeps the context of
+    every channel. HistoryStore stays the in-memory source of truth; this
+    module only sees batches of appends and clears.
+  - Write-behind: operations are queued in memory and written in one
+    transaction every HISTORY_FLUSH_SEC (or sooner once _MAX_PENDING are
+    waiting). All sqlite3 calls run on one worker thread, in submission
+    order, so the event loop never touches disk and a load always sees the
+    writes queued before it.
+  - Lazy loading: nothing is read at startup. A channel's last max_items
+    rows are loaded the first time it is touched (HistoryStore.warm).
+  - Compaction: each write batch trims the channels it touched to max_items
+    rows; every HISTORY_COMPACT_SEC rows of channels idle longer than the
+    TTL are deleted and the WAL is checkpointed.
+
+Backends implement load / write / compact / close (HistoryBackend); the
+worker thread and batching live in HistoryPersister.
+"""
+from __future__ import annotations
+import asyncio
+import atexit
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from sub.constants import (
+    HISTORY_PERSIST_ENABLED,
+    HISTORY_PERSIST_PATH,
+    HISTORY_FLUSH_SEC,
+    HISTORY_COMPACT_SEC,
+)
+from sub.infra.logging import logger, log_event
+
+_MAX_PENDING = 256
+
+# ("add", channel_id, entry) | ("clear", channel_id, None)
+_Op = Tuple[str, str, Any]
+
+
+class HistoryBackend(ABC):
+    """Storage interface; every method is called from the persister thread."""
+
+    @abstractmethod
+    def load(self, channel_id: str, limit: int) -> List[Tuple[str, str, str, str, float]]:
+        """Newest ``limit`` rows (user_id, username, content, source, ts), oldest -> newest."""
+
+    @abstractmethod
+    def write(self, ops: List[_Op], keep: int) -> None:
+        """Apply ops in order in one batch; keep at most ``keep`` rows per touched channel."""
+
+    @abstractmethod
+    def compact(self, older_than: float) -> int:
+        """Delete rows of channels idle since ``older_than`` (epoch, 0 = none); returns rows removed."""
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteHistoryBackend(HistoryBackend):
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # the exit flush may run outside the worker
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, channel_id TEXT NOT NULL,"
+                " user_id TEXT, username TEXT, content TEXT, source TEXT, ts REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS history_channel ON history (channel_id, id)")
+            conn.commit()
+            self._conn = conn
+            log_event("history_backend_open", path=self.path)
+        return self._conn
+
+    def load(self, channel_id: str, limit: int) -> List[Tuple[str, str, str, str, float]]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT user_id, username, content, source, ts FROM history"
+                " WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
+                (channel_id, limit),
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def write(self, ops: List[_Op], keep: int) -> None:
+        touched = set()
+        with self._lock:
+            db = self._db()
+            with db:
+                for kind, channel_id, entry in ops:
+                    if kind == "clear":
+                        db.execute("DELETE FROM history WHERE channel_id = ?", (channel_id,))
+                        touched.discard(channel_id)
+                        continue
+                    db.execute(
+                        "INSERT INTO history (channel_id, user_id, username, content, source, ts)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (channel_id, entry.user_id, entry.username, entry.content, entry.source, entry.timestamp),
+                    )
+                    touched.add(channel_id)
+                for channel_id in touched:
+                    db.execute(
+                        "DELETE FROM history WHERE channel_id = ? AND id <= ("
+                        " SELECT id FROM history WHERE channel_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (channel_id, channel_id, keep),
+                    )
+
+    def compact(self, older_than: float) -> int:
+        with self._lock:
+            db = self._db()
+            removed = 0
+            if older_than > 0:
+                with db:
+                    removed = db.execute(
+                        "DELETE FROM history WHERE channel_id IN ("
+                        " SELECT channel_id FROM history GROUP BY channel_id HAVING MAX(ts) < ?)",
+                        (older_than,),
+                    ).rowcount
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class HistoryPersister:
+    """Batches HistoryStore operations onto a backend on one worker thread."""
+
+    def __init__(
+        self,
+        backend: HistoryBackend,
+        flush_sec: float = HISTORY_FLUSH_SEC,
+        compact_sec: float = HISTORY_COMPACT_SEC,
+    ):
+        self.backend = backend
+        self.flush_sec = flush_sec
+        self.compact_sec = compact_sec
+        self.keep = 30  # set by HistoryStore (max_items)
+        self.idle_ttl_sec = 0.0  # set by HistoryStore
+        self._pending: List[_Op] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_compact = time.monotonic()
+        self._closed = False
+        self.loads = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.compacted = 0
+        self.errors = 0
+        atexit.register(self.close)
+
+    # ---- write-behind ----
+    def append(self, channel_id: str, entry: Any) -> None:
+        self._queue(("add", channel_id, entry))
+
+    def clear(self, channel_id: str) -> None:
+        self._queue(("clear", channel_id, None))
+
+    def _queue(self, op: _Op) -> None:
+        if self._closed:
+            return
+        self._pending.append(op)
+        if len(self._pending) >= _MAX_PENDING:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        except RuntimeError:
+            pass  # no loop (offline use): flushed on _MAX_PENDING / exit
+
+    async def _flush_loop(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.flush_sec)
+            await asyncio.wrap_future(self.flush())
+
+    def flush(self) -> "Future[None]":
+        """Submit the pending operations as one batch; returns the worker future."""
+        ops, self._pending = self._pending, []
+        future = self._executor.submit(self._write, ops)
+        if self.compact_sec > 0 and time.monotonic() - self._last_compact >= self.compact_sec:
+            self._last_compact = time.monotonic()
+            future = self._executor.submit(self._compact)
+        return future
+
+    def _write(self, ops: List[_Op]) -> None:
+        if not ops:
+            return
+        try:
+            self.backend.write(ops, self.keep)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"history_backend write failed ops={len(ops)} error={e}")
+            return
+        self.flushes += 1
+        self.rows_written += sum(1 for op in ops if op[0] == "add")
+
+    def _compact(self) -> None:
+        older_than = time.time() - self.idle_ttl_sec if self.idle_ttl_sec > 0 else 0
+        try:
+            removed = self.backend.compact(older_than)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"history_backend compact failed error={e}")
+            return
+        self.compacted += removed
+        log_event("history_backend_compact", removed=removed)
+
+    # ---- lazy load ----
+    async def load(self, channel_id: str, limit: int) -> List[Tuple[str, str, str, str, float]]:
+        """Rows of one channel, after every operation queued so far is written."""
+        self.flush()
+        rows = await asyncio.wrap_future(self._executor.submit(self.backend.load, channel_id, limit))
+        self.loads += 1
+        return rows
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        ops, self._pending = self._pending, []
+        self._executor.shutdown(wait=True)
+        self._write(ops)
+        self.backend.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "compacted": self.compacted,
+            "errors": self.errors,
+        }
+
+
+# singleton (None when HISTORY_PERSIST_ENABLED=0)
+history_persister: Optional[HistoryPersister] = (
+    HistoryPersister(SqliteHistoryBackend(HISTORY_PERSIST_PATH)) if HISTORY_PERSIST_ENABLED else None
+)
+
+__all__ = ["history_persister", "HistoryPersister", "HistoryBackend", "SqliteHistoryBackend"]
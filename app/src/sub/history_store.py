@@ -1,46 +1,247 @@
+import sys
+import time
+from collections import OrderedDict, deque
 from dataclasses import dataclass
-from typing import Dict, List, Optional
-from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Deque, Dict, List, Optional
+from sub.format_conversation import ConversationLines
 
+if TYPE_CHECKING:
+    from sub.history_backend import HistoryPersister
 
-@dataclass
+
+@dataclass(slots=True)
 class HistoryEntry:
-    """Represents a single message in conversation history"""
-    user_id: str
+    """Represents a single message in conversation history
+
+    Compact: no per-instance __dict__, the snowflake id as int, the time as
+    epoch seconds and the display name interned (one copy per user).
+    """
+    user_id: int  # Discord snowflake
     username: str  # display name
     content: str
     source: str  # "text" or future "voice"
-    timestamp: datetime
+    timestamp: float  # epoch seconds
+
+    def __post_init__(self):
+        self.username = sys.intern(self.username)
+
+
+# rough per-entry overhead (slots instance + int + float + deque slots + line offset);
+# usernames are interned, so only the content and its rendered line are counted
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def approx_entry_bytes(entry: HistoryEntry, line: str = "") -> int:
+    return _ENTRY_OVERHEAD_BYTES + sys.getsizeof(entry.content) + sys.getsizeof(line)
+
+
+class _ChannelHistory:
+    __slots__ = ("entries", "lines", "bytes", "touched", "loaded")
+
+    def __init__(self, max_items: int, loaded: bool = True):
+        self.entries: Deque[HistoryEntry] = deque(maxlen=max_items)
+        self.lines = ConversationLines()  # entries rendered as username(userId): content
+        self.bytes = 0
+        self.touched = time.monotonic()
+        self.loaded = loaded  # False until the persisted rows were merged in (warm)
 
 
 class HistoryStore:
-    """Manages conversation history per channel with circular buffer"""
-    
-    def __init__(self, max_items: int = 30):
+    """Manages conversation history per channel with circular buffer
+
+    Memory bounds:
+      - each channel is a fixed-capacity ring buffer (max_items, O(1) append);
+        the entry pushed out goes to on_evict (rolling summary)
+      - context_chars (0 = off) also bounds the ring to the reply window:
+        once the lines before the newest no longer fit, the oldest entries are
+        evicted the same way, so everything in the buffer is rendered into the
+        reply context (render_history(skip_newest=1)) and everything older is
+        in the summary
+      - at most max_channels channels are tracked; the least recently used
+        channel is dropped beyond that
+      - channels untouched for idle_ttl_sec are dropped (0 = never)
+      - max_bytes caps the approximate size of all entries by dropping least
+        recently used channels (0 = no cap; the channel being written is kept)
+    Whole channels dropped by these bounds do not go through on_evict (idle
+    conversations are not summarized); on_drop(channel_id) is called instead,
+    as it is for clear_history, so per-channel state kept elsewhere (the
+    rolling summary) is released with the channel.
+
+    With a persister (sub.history_backend) every add / clear is also written
+    behind to disk, and ``await warm(channel_id)`` merges a channel's
+    persisted rows the first time it is touched (after a restart or after the
+    channel was dropped from memory). The synchronous API is unchanged.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 30,
+        on_evict: Optional[Callable[[str, HistoryEntry], None]] = None,
+        on_drop: Optional[Callable[[str], None]] = None,
+        max_channels: int = 0,
+        idle_ttl_sec: float = 0,
+        max_bytes: int = 0,
+        persister: Optional["HistoryPersister"] = None,
+        context_chars: int = 0,
+    ):
         self.max_items = max_items
-        self.channel_histories: Dict[str, List[HistoryEntry]] = {}
-    
+        self.context_chars = context_chars
+        self.channel_histories: "OrderedDict[str, _ChannelHistory]" = OrderedDict()
+        # called with (channel_id, entry) when an entry ages out of the buffer
+        self.on_evict = on_evict
+        # called with channel_id when a whole channel is dropped or cleared
+        self.on_drop = on_drop
+        self.max_channels = max_channels
+        self.idle_ttl_sec = idle_ttl_sec
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.dropped_channels = 0
+        self.persister = persister
+        if persister is not None:
+            persister.keep = max_items
+            persister.idle_ttl_sec = idle_ttl_sec
+
+    def _touch(self, channel_id: str) -> _ChannelHistory:
+        now = time.monotonic()
+        self._expire_idle(now)
+        history = self.channel_histories.get(channel_id)
+        if history is None:
+            history = self.channel_histories[channel_id] = _ChannelHistory(
+                self.max_items, loaded=self.persister is None
+            )
+        else:
+            self.channel_histories.move_to_end(channel_id)
+        history.touched = now
+        return history
+
     def add_message(self, channel_id: str, entry: HistoryEntry) -> None:
         """Add a message to the channel's history"""
-        if channel_id not in self.channel_histories:
-            self.channel_histories[channel_id] = []
-        
-        history = self.channel_histories[channel_id]
-        history.append(entry)
-        
-        # Maintain circular buffer - remove oldest if exceeding max_items
-        if len(history) > self.max_items:
-            history.pop(0)
-    
+        history = self._touch(channel_id)
+        self._append(channel_id, history, entry)
+        if self.persister is not None:
+            self.persister.append(channel_id, entry)
+        self._enforce_bounds(keep=channel_id)
+
+    async def warm(self, channel_id: str) -> None:
+        """Merge the persisted history of a channel not loaded yet (no-op without a persister)."""
+        if self.persister is None:
+            return
+        history = self._touch(channel_id)
+        if history.loaded:
+            return
+        # entries already in memory are queued before the load, so it returns them too
+        known = {id(e) for e in history.entries}
+        rows = await self.persister.load(channel_id, self.max_items)
+        if self.channel_histories.get(channel_id) is not history or history.loaded:
+            return  # dropped / cleared / merged by a concurrent warm meanwhile
+        newer = [e for e in history.entries if id(e) not in known]
+        history.entries.clear()
+        history.lines.clear()
+        self.total_bytes -= history.bytes
+        history.bytes = 0
+        history.loaded = True
+        for user_id, username, content, source, timestamp in rows:
+            self._append(channel_id, history, HistoryEntry(int(user_id), username, content, source, timestamp))
+        for entry in newer:
+            self._append(channel_id, history, entry)
+        self._enforce_bounds(keep=channel_id)
+
+    def _append(self, channel_id: str, history: _ChannelHistory, entry: HistoryEntry) -> None:
+        # Maintain circular buffer - the oldest goes beyond max_items
+        if len(history.entries) == history.entries.maxlen:
+            self._evict_oldest(channel_id, history)
+        history.entries.append(entry)
+        size = approx_entry_bytes(entry, history.lines.append(entry))
+        history.bytes += size
+        self.total_bytes += size
+        # ... and once it falls out of the reply window (all lines but the newest)
+        if self.context_chars > 0:
+            while len(history.entries) > 1 and history.lines.chars_before_newest() > self.context_chars:
+                self._evict_oldest(channel_id, history)
+
+    def _evict_oldest(self, channel_id: str, history: _ChannelHistory) -> None:
+        evicted = history.entries.popleft()
+        size = approx_entry_bytes(evicted, history.lines.popleft())
+        history.bytes -= size
+        self.total_bytes -= size
+        if self.on_evict is not None:
+            self.on_evict(channel_id, evicted)
+
     def get_history(self, channel_id: str) -> List[HistoryEntry]:
         """Get the conversation history for a channel"""
-        return self.channel_histories.get(channel_id, [])
-    
+        history = self.channel_histories.get(channel_id)
+        if history is None:
+            return []
+        self.channel_histories.move_to_end(channel_id)
+        history.touched = time.monotonic()
+        return list(history.entries)
+
+    def render_history(self, channel_id: str, max_chars: Optional[int] = None, skip_newest: int = 0) -> str:
+        """Formatted history (format_conversation_history) from the incremental renderer.
+
+        max_chars: defaults to context_chars (2000 when unset).
+        skip_newest: leave out the newest entries (e.g. the message being answered).
+        """
+        if max_chars is None:
+            max_chars = self.context_chars or 2000
+        history = self.channel_histories.get(channel_id)
+        if history is None:
+            return ""
+        self.channel_histories.move_to_end(channel_id)
+        history.touched = time.monotonic()
+        return history.lines.window(max_chars, skip_newest)
+
     def clear_history(self, channel_id: str) -> None:
         """Clear history for a specific channel"""
-        if channel_id in self.channel_histories:
-            del self.channel_histories[channel_id]
-    
+        history = self.channel_histories.pop(channel_id, None)
+        if history is not None:
+            self.total_bytes -= history.bytes
+        if self.persister is not None:
+            self.persister.clear(channel_id)
+        if self.on_drop is not None:
+            self.on_drop(channel_id)
+
+    def _drop_oldest(self) -> str:
+        channel_id, history = self.channel_histories.popitem(last=False)
+        self.total_bytes -= history.bytes
+        self.dropped_channels += 1
+        if self.on_drop is not None:
+            self.on_drop(channel_id)
+        return channel_id
+
+    def _expire_idle(self, now: float) -> None:
+        if self.idle_ttl_sec <= 0:
+            return
+        # LRU order: the head is the least recently touched channel
+        while self.channel_histories:
+            history = next(iter(self.channel_histories.values()))
+            if now - history.touched < self.idle_ttl_sec:
+                break
+            channel_id = self._drop_oldest()
+            if self.persister is not None:
+                self.persister.clear(channel_id)  # expired: do not reload it on the next touch
+
+    def _enforce_bounds(self, keep: str) -> None:
+        while len(self.channel_histories) > 1 and (
+            (self.max_channels > 0 and len(self.channel_histories) > self.max_channels)
+            or (self.max_bytes > 0 and self.total_bytes > self.max_bytes)
+        ):
+            if next(iter(self.channel_histories)) == keep:
+                break
+            self._drop_oldest()
+
     def get_channel_count(self) -> int:
         """Get the number of channels with stored history"""
-        return len(self.channel_histories)
\ No newline at end of file
+        return len(self.channel_histories)
+
+    def approx_bytes(self) -> int:
+        """Approximate memory held by stored entries"""
+        return self.total_bytes
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "channels": len(self.channel_histories),
+            "entries": sum(len(h.entries) for h in self.channel_histories.values()),
+            "approx_bytes": self.total_bytes,
+            "dropped_channels": self.dropped_channels,
+        }
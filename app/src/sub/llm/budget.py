@@ -0,0 +1,143 @@
+"""Client-side TPM / RPM budgeting for OpenAI calls (token buckets per model).
+
+Each request is charged before it is sent:
+  - 1 request against the RPM bucket
+  - estimated prompt tokens + OPENAI_EXPECTED_COMPLETION_TOKENS against TPM
+After the call the token charge is corrected from ``usage.total_tokens``
+(settle) or returned entirely when the call failed (refund).
+
+Requests that do not fit wait locally (FIFO) instead of being sent and
+bounced with 429s that would burn retries and backoff time. A limit of 0
+disables the corresponding bucket.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from sub.constants import OPENAI_TPM_LIMIT, OPENAI_RPM_LIMIT
+from sub.infra.logging import log_event
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available (amount is clamped to capacity)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount  # may go negative (debt) after a usage correction
+
+    def give(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+@dataclass
+class Reservation:
+    tokens: int
+    wait_ms: float
+
+
+class RequestBudgeter:
+    def __init__(self, name: str, tpm: int = OPENAI_TPM_LIMIT, rpm: int = OPENAI_RPM_LIMIT):
+        self.name = name
+        self.tpm: Optional[TokenBucket] = TokenBucket(tpm) if tpm > 0 else None
+        self.rpm: Optional[TokenBucket] = TokenBucket(rpm) if rpm > 0 else None
+        self._lock = asyncio.Lock()  # FIFO among waiters
+        self.waiting = 0
+        self.total_wait_ms = 0.0
+        self.waited_requests = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.tpm is not None or self.rpm is not None
+
+    async def reserve(self, tokens: int) -> Reservation:
+        if not self.enabled:
+            return Reservation(tokens, 0.0)
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = max(
+                        self.rpm.wait_time(1) if self.rpm else 0.0,
+                        self.tpm.wait_time(tokens) if self.tpm else 0.0,
+                    )
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                if self.rpm:
+                    self.rpm.take(1)
+                if self.tpm:
+                    self.tpm.take(tokens)
+        finally:
+            self.waiting -= 1
+        wait_ms = (time.perf_counter() - start) * 1000
+        if wait_ms >= 1.0:
+            self.total_wait_ms += wait_ms
+            self.waited_requests += 1
+            log_event("openai_budget_wait", model=self.name, tokens=tokens, wait_ms=f"{wait_ms:.1f}")
+        return Reservation(tokens, wait_ms)
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]) -> None:
+        """Correct the up-front estimate with the real usage."""
+        if self.tpm is None or actual_tokens is None:
+            return
+        delta = actual_tokens - reservation.tokens
+        if delta > 0:
+            self.tpm.take(delta)
+        elif delta < 0:
+            self.tpm.give(-delta)
+
+    def refund(self, reservation: Reservation) -> None:
+        """Failed call: return the token charge (the request still counts for RPM)."""
+        if self.tpm is not None:
+            self.tpm.give(reservation.tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap: Dict[str, Any] = {"waiting": self.waiting, "waited_requests": self.waited_requests,
+                                "total_wait_ms": round(self.total_wait_ms, 1)}
+        if self.tpm:
+            self.tpm._refill()
+            snap["tpm_available"] = int(self.tpm.tokens)
+            snap["tpm_limit"] = int(self.tpm.capacity)
+        if self.rpm:
+            self.rpm._refill()
+            snap["rpm_available"] = int(self.rpm.tokens)
+            snap["rpm_limit"] = int(self.rpm.capacity)
+        return snap
+
+
+_budgeters: Dict[str, RequestBudgeter] = {}
+
+
+def get_budgeter(model: str) -> RequestBudgeter:
+    budgeter = _budgeters.get(model)
+    if budgeter is None:
+        budgeter = RequestBudgeter(model)
+        _budgeters[model] = budgeter
+    return budgeter
+
+
+def budget_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: b.snapshot() for name, b in _budgeters.items() if b.enabled}
+
+
+__all__ = ["TokenBucket", "RequestBudgeter", "Reservation", "get_budgeter", "budget_snapshot"]
@@ -0,0 +1,168 @@
+"""Per-model circuit breaker for OpenAI calls.
+
+States:
+  - CLOSED: calls pass; each attempt's outcome goes into a rolling window.
+    The breaker opens once the window holds >= MIN_REQUESTS samples and the
+    failure ratio >= ERROR_RATE or the timeout ratio >= TIMEOUT_RATE.
+  - OPEN: calls are rejected immediately (chat_with_fallback goes straight
+    to the fallback model) for OPEN_SEC.
+  - HALF_OPEN: up to HALF_OPEN_PROBES trial calls are admitted; all of them
+    succeeding closes the breaker, any failure re-opens it.
+
+Only provider-side failures count (rate limit / overload / 5xx / timeout /
+connection); invalid requests are the caller's fault and are ignored.
+State changes are reported via log_event("openai_breaker_state").
+"""
+from __future__ import annotations
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Deque, Dict, Optional, Tuple
+from sub.constants import (
+    OPENAI_BREAKER_ENABLED,
+    OPENAI_BREAKER_WINDOW_SEC,
+    OPENAI_BREAKER_MIN_REQUESTS,
+    OPENAI_BREAKER_ERROR_RATE,
+    OPENAI_BREAKER_TIMEOUT_RATE,
+    OPENAI_BREAKER_OPEN_SEC,
+    OPENAI_BREAKER_HALF_OPEN_PROBES,
+)
+from sub.infra.logging import log_event
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class BreakerTicket:
+    probe: bool  # admitted as a HALF_OPEN trial call
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window_sec: float = OPENAI_BREAKER_WINDOW_SEC,
+        min_requests: int = OPENAI_BREAKER_MIN_REQUESTS,
+        error_rate: float = OPENAI_BREAKER_ERROR_RATE,
+        timeout_rate: float = OPENAI_BREAKER_TIMEOUT_RATE,
+        open_sec: float = OPENAI_BREAKER_OPEN_SEC,
+        half_open_probes: int = OPENAI_BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.window_sec = window_sec
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.open_sec = open_sec
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = BreakerState.CLOSED
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()  # (ts, failed, timed_out)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_sec
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def rates(self) -> Tuple[int, float, float]:
+        self._prune(time.monotonic())
+        n = len(self._outcomes)
+        if n == 0:
+            return 0, 0.0, 0.0
+        failed = sum(1 for _, f, _ in self._outcomes if f)
+        timed_out = sum(1 for _, _, t in self._outcomes if t)
+        return n, failed / n, timed_out / n
+
+    def _transition(self, new_state: BreakerState, reason: str) -> None:
+        if new_state is self.state:
+            return
+        n, err, tmo = self.rates()
+        log_event(
+            "openai_breaker_state",
+            model=self.name,
+            from_state=self.state.value,
+            to_state=new_state.value,
+            reason=reason,
+            samples=n,
+            error_rate=f"{err:.2f}",
+            timeout_rate=f"{tmo:.2f}",
+        )
+        self.state = new_state
+        if new_state is BreakerState.OPEN:
+            self._opened_at = time.monotonic()
+        elif new_state is BreakerState.HALF_OPEN:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        elif new_state is BreakerState.CLOSED:
+            self._outcomes.clear()
+
+    def admit(self) -> Optional[BreakerTicket]:
+        """Return a ticket if the call may proceed, None if it is rejected."""
+        if self.state is BreakerState.OPEN:
+            if time.monotonic() - self._opened_at < self.open_sec:
+                return None
+            self._transition(BreakerState.HALF_OPEN, "open_elapsed")
+        if self.state is BreakerState.HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                return None
+            self._probes_in_flight += 1
+            return BreakerTicket(probe=True)
+        return BreakerTicket(probe=False)
+
+    def done(self, ticket: BreakerTicket) -> None:
+        """Call ends (success, failure or cancellation): free the probe slot."""
+        if ticket.probe and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def record_success(self, ticket: BreakerTicket) -> None:
+        if self.state is BreakerState.HALF_OPEN:
+            if ticket.probe:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(BreakerState.CLOSED, "probes_succeeded")
+            return
+        if self.state is BreakerState.CLOSED:
+            self._outcomes.append((time.monotonic(), False, False))
+
+    def record_failure(self, ticket: BreakerTicket, timed_out: bool) -> None:
+        if self.state is BreakerState.HALF_OPEN:
+            self._transition(BreakerState.OPEN, "probe_failed")
+            return
+        if self.state is not BreakerState.CLOSED:
+            return
+        self._outcomes.append((time.monotonic(), True, timed_out))
+        n, err, tmo = self.rates()
+        if n >= self.min_requests and (err >= self.error_rate or tmo >= self.timeout_rate):
+            self._transition(BreakerState.OPEN, "timeout_rate" if tmo >= self.timeout_rate else "error_rate")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(model: str) -> Optional[CircuitBreaker]:
+    """Breaker for model, or None when OPENAI_BREAKER_ENABLED=0."""
+    if not OPENAI_BREAKER_ENABLED:
+        return None
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = CircuitBreaker(model)
+        _breakers[model] = breaker
+    return breaker
+
+
+def breaker_snapshot() -> Dict[str, Dict[str, object]]:
+    snap: Dict[str, Dict[str, object]] = {}
+    for name, b in _breakers.items():
+        n, err, tmo = b.rates()
+        snap[name] = {"state": b.state.value, "samples": n, "error_rate": round(err, 2), "timeout_rate": round(tmo, 2)}
+    return snap
+
+
+__all__ = ["BreakerState", "CircuitBreaker", "get_breaker", "breaker_snapshot"]
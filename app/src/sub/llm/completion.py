@@ -3,7 +3,7 @@ import asyncio
 import time
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, List
+from typing import Any, Awaitable, Optional, List, Tuple, Union
 import re
 from sub.constants import (
     OPENAI_API_KEY,
@@ -14,23 +14,26 @@ from sub.constants import (
 from sub.constants import (
     EXAMPLE_CONVOS,
     OPENAI_MODEL,
+    OPENAI_FALLBACK_MODEL,
 )
 from sub.core.base import Message
 from sub.discord.discord_utils import split_into_shorter_messages, close_thread
-from sub.infra.logging import logger
+from sub.discord.streaming import StreamingReply
+from sub.infra.logging import logger, log_event
 from sub.search.websearch import perform_web_search, format_search_results
 from sub.disclaimer import sanitize_reply
 from sub.llm.message_augment import augment_messages
-from sub.constants import (
-    SUMMARY_TRIGGER_PROMPT_TOKENS,
-    SUMMARY_TARGET_REDUCTION_RATIO,
-    SUMMARY_MAX_SOURCE_CHARS,
-    SUMMARY_MODEL,
-)
 from sub.search.search_decision import should_perform_web_search, SearchDecisionType
-from sub.search.search_context import build_search_context
+from sub.search.search_context import build_search_context, SearchContextResult
 from datetime import datetime, timezone
-from sub.llm.openai_wrapper import chat as openai_chat, chat_with_fallback, OpenAITimeoutError, OpenAIFinalError
+from sub.llm.openai_wrapper import chat_with_fallback, OpenAITimeoutError, OpenAIFinalError
+from sub.llm.concurrency import LLMPriority
+from sub.llm.completion_cache import cache as completion_cache, cache_key as completion_cache_key
+from sub.llm.near_dup_cache import cache as near_dup_cache, references_context
+from sub.llm.prompt_budget import assemble_prompt, preflight
+from sub.llm.stage_graph import StageGraph
+from sub.llm.usage_ledger import ledger as usage_ledger
+from sub.overload import DegradeLevel, work_gate
 
 import discord
 
@@ -50,45 +53,167 @@ class CompletionData:
     status: CompletionResult
     reply_text: Optional[str]
     status_text: Optional[str]
+    streamed: bool = False  # reply already rendered into the channel by StreamingReply
+
+
+def _model_prefix(model_used: str, hedged: bool = False, cached: bool = False) -> str:
+    """Reply prefix naming the model that answered (", hedged" when raced, ", cached" on a cache hit)."""
+    suffix = (", hedged" if hedged else "") + (", cached" if cached else "")
+    if model_used == "primary":
+        return f"(model: {OPENAI_MODEL}{suffix}) \n "
+    if model_used == "fallback":
+        return f"(fallback: {OPENAI_FALLBACK_MODEL}{suffix}) \n "
+    return ""
+
+
+def _usage_scope(user, channel) -> Tuple[str, str, str]:
+    """(guild_id, channel_id, user_id) for the usage ledger ("" when unknown)."""
+    guild = getattr(channel, "guild", None)
+    return (
+        str(getattr(guild, "id", "") or ""),
+        str(getattr(channel, "id", "") or ""),
+        str(getattr(user, "id", "") or ""),
+    )
+
+
+def _near_dup_scope(channel) -> Optional[str]:
+    """Near-duplicate cache scope: the guild, or the channel outside guilds
+    (DMs); None (cache not used) when neither is known."""
+    guild_id, channel_id, _ = _usage_scope(None, channel)
+    if guild_id:
+        return guild_id
+    return f"channel:{channel_id}" if channel_id else None
+
+
+QUOTA_EXCEEDED_MESSAGE = "申し訳ありませんが、本日の利用上限に達しました。明日以降に再度お試しください。"
+
+
+def _near_dup_text(messages: List[Message], decision) -> Optional[str]:
+    """Near-duplicate cache key text, or None when the answer is not reusable
+    (no web search, non-text message, or a follow-up leaning on earlier turns)."""
+    if decision.decision != SearchDecisionType.QUERY or not decision.query:
+        return None
+    latest = next((m.content for m in reversed(messages) if m.role == "user"), None)
+    if not isinstance(latest, str):
+        return None
+    latest = re.sub(r"<@[!&]?\d+>", "", latest).strip()
+    if not latest or references_context(latest):
+        return None
+    return f"{latest}\n{decision.query}"
+
+
+def _near_dup_lookup(messages: List[Message], decision, scope: Optional[str]) -> Tuple[Optional[str], Any]:
+    """(near_dup_text, NearDupHit or None); only entries of the same scope match."""
+    text = _near_dup_text(messages, decision) if near_dup_cache is not None and scope is not None else None
+    return text, (near_dup_cache.lookup(OPENAI_MODEL, scope, text) if text is not None else None)
+
+
+@dataclass
+class SearchPrefetch:
+    """Search decision / near-dup lookup / web search started speculatively
+    from the triggering message while the receive debounce is still running."""
+    latest_message: Message
+    decision: Any
+    near_dup: Tuple[Optional[str], Any]
+    search: Optional[asyncio.Task]
+
+    def cancel(self) -> None:
+        if self.search is not None and not self.search.done():
+            self.search.cancel()
+            log_event("prefetch_cancelled", query=(self.decision.query or "")[:60])
+
+
+def start_search_prefetch(latest_message: Optional[Message], channel=None) -> Optional[SearchPrefetch]:
+    """Start the search stages for latest_message (posted in channel) now; None if it is not a user message."""
+    if latest_message is None or latest_message.role != "user":
+        return None
+    decision = should_perform_web_search([latest_message])
+    near_dup = _near_dup_lookup([latest_message], decision, _near_dup_scope(channel))
+    search = None
+    if decision.decision == SearchDecisionType.QUERY and near_dup[1] is None:
+        search = asyncio.ensure_future(build_search_context(decision, [latest_message]))
+    return SearchPrefetch(latest_message, decision, near_dup, search)
 
 
 async def generate_completion_response(
-    messages: List[Message], user: str, conversation_context: str = None
+    messages: Union[List[Message], Awaitable[List[Message]]],
+    user: str,
+    conversation_context: str = None,
+    conversation_summary: Optional[str] = None,
+    stream: bool = False,
+    channel=None,
+    priority: int = LLMPriority.MENTION,
+    latest_message: Optional[Message] = None,
+    prefetch: Optional[SearchPrefetch] = None,
+    degrade: int = DegradeLevel.NORMAL,
 ) -> CompletionData:
+    """Run search/augment/LLM and return the reply.
+
+    Stages run as a dependency graph (sub.llm.stage_graph):
+        messages ─────────────────────────┐
+        decision ─> near_dup ─> search ───┴─> assemble ─> llm
+    messages may be an awaitable (channel history still being fetched); when
+    latest_message (the triggering user message) is given, the search
+    decision and web search only depend on it and overlap with the fetch.
+    prefetch (start_search_prefetch) supplies decision / near_dup / search
+    already started during the receive debounce; they are reused as is.
+
+    stream=True (requires channel): the reply is posted progressively into
+    channel while tokens arrive; the returned CompletionData has streamed=True
+    and process_*_response will not post it again.
+    priority: LLMPriority of the trigger (mention / command / fallback chatter).
+    conversation_summary: the channel's rolling summary (sub.llm.summarizer),
+    injected as the <SUMMARY> section; it is never computed on this path.
+    degrade: sub.overload.DegradeLevel under load; NO_SEARCH skips a web
+    search that has not finished yet, FALLBACK_MODEL also answers with
+    OPENAI_FALLBACK_MODEL (when configured).
+    """
+    stream_reply = StreamingReply(channel) if (stream and channel is not None) else None
+    graph = StageGraph("completion")
     try:
-        logger.info(messages)
-        # 1. 会話履歴要約検討 (簡易トークン概算 = 4 chars / token 近似)
-        summary_applied = False
-        if conversation_context:
-            try:
-                approx_prompt_tokens = len(conversation_context) / 4
-                if (
-                    approx_prompt_tokens > SUMMARY_TRIGGER_PROMPT_TOKENS
-                    and len(conversation_context) < SUMMARY_MAX_SOURCE_CHARS
-                ):
-                    system_sum = {
-                        "role": "system",
-                        "content": "以下は過去会話の生ログです。重要な事実・ユーザーの意図・未回答の要求・決定事項を日本語で簡潔に列挙し、不要な挨拶や雑談は除外し200～300文字程度に要約してください。出力は箇条書き風で。",
-                    }
-                    user_sum = {"role": "user", "content": conversation_context}
-                    try:
-                        sum_resp, sum_metrics = await openai_chat(
-                            [system_sum, user_sum],
-                            model=SUMMARY_MODEL,
-                            timeout=15,
-                            purpose="summary",
-                        )
-                        summarized = sum_resp.choices[0]["message"]["content"].strip()
-                        target_chars = int(len(conversation_context) * SUMMARY_TARGET_REDUCTION_RATIO)
-                        if len(summarized) > target_chars:
-                            summarized = summarized[: target_chars - 15] + "..."
-                        conversation_context = summarized
-                        summary_applied = True
-                    except Exception as se:
-                        logger.warning(f"summary_failed err={se}")
-            except Exception:
-                pass
-        decision = should_perform_web_search(messages)
+        # 会話要約は RollingSummarizer がバックグラウンドで更新済み (ここでは待たない)
+        summary_applied = bool(conversation_summary)
+        usage_scope = _usage_scope(user, channel)
+        if usage_ledger is not None and usage_ledger.check_quota(usage_scope[0], usage_scope[2]):
+            return CompletionData(status=CompletionResult.OK, reply_text=QUOTA_EXCEEDED_MESSAGE, status_text=None)
+        if prefetch is not None:
+            latest_message = prefetch.latest_message
+        if latest_message is not None and latest_message.role != "user":
+            latest_message = None  # e.g. thread starter: decide from the fetched history
+        decision_deps = () if latest_message is not None else ("messages",)
+        use_fallback = degrade >= DegradeLevel.FALLBACK_MODEL and bool(OPENAI_FALLBACK_MODEL)
+        llm_model = OPENAI_FALLBACK_MODEL if use_fallback else OPENAI_MODEL
+
+        def _decision_messages(results) -> List[Message]:
+            return [latest_message] if latest_message is not None else results["messages"]
+
+        def _decision_stage(results):
+            if prefetch is not None:
+                return prefetch.decision
+            return should_perform_web_search(_decision_messages(results))
+
+        def _near_dup_stage(results):
+            if prefetch is not None:
+                return prefetch.near_dup
+            return _near_dup_lookup(_decision_messages(results), results["decision"], _near_dup_scope(channel))
+
+        def _search_stage(results):
+            if results["near_dup"][1] is not None:
+                return None  # answered from the near-duplicate cache
+            if prefetch is not None and prefetch.search is not None:
+                if degrade < DegradeLevel.NO_SEARCH or prefetch.search.done():
+                    return prefetch.search
+            if degrade >= DegradeLevel.NO_SEARCH:
+                return SearchContextResult("", False, "SKIPPED")  # overloaded: no web search
+            return build_search_context(results["decision"], _decision_messages(results))
+
+        graph.add("messages", lambda results: messages)
+        graph.add("decision", _decision_stage, deps=decision_deps)
+        graph.add("near_dup", _near_dup_stage, deps=("decision",))
+        graph.add("search", _search_stage, deps=("near_dup",))
+        graph.start()
+
+        decision = await graph.result("decision")
         # datetime direct answer short-circuit
         if decision.decision == SearchDecisionType.DATETIME_ANSWER:
             return CompletionData(
@@ -96,32 +221,111 @@ async def generate_completion_response(
                 reply_text=decision.direct_answer or "",
                 status_text=None,
             )
-        search_result = await build_search_context(decision, messages)
+        near_dup_text, hit = await graph.result("near_dup")
+        if hit is not None:
+            # paraphrase of a recent search-backed question: skip search + LLM
+            reply = sanitize_reply(_model_prefix(hit.model_used, cached=True) + hit.response, True)
+            streamed = False
+            if stream_reply is not None and reply:
+                await stream_reply.finalize(reply)
+                streamed = True
+            logger.info(
+                "openai_metrics decision=%s near_dup_hit=True similarity=%.3f reply_chars=%d streamed=%s priority=%s",
+                decision.decision.name,
+                hit.similarity,
+                len(reply),
+                streamed,
+                LLMPriority(priority).name,
+            )
+            return CompletionData(status=CompletionResult.OK, reply_text=reply, status_text=None, streamed=streamed)
+        search_result = await graph.result("search")
+        messages = await graph.result("messages")
+        logger.info(messages)
         search_context = search_result.context
         search_executed = search_result.executed
         search_status = search_result.status
-        augment_result = augment_messages(
-            messages,
-            conversation_context=conversation_context,
-            search_context=search_context,
-            search_executed=search_executed,
-        )
-        rendered_messages = augment_result.messages
-        response, metrics, model_used = await chat_with_fallback(rendered_messages, model=OPENAI_MODEL, purpose="completion")
+        with graph.timer("assemble"):
+            # fit every section into the model's token budget before rendering
+            budgeted = assemble_prompt(messages, conversation_context, conversation_summary, search_context, llm_model)
+            if not budgeted.fits:
+                return CompletionData(
+                    status=CompletionResult.TOO_LONG,
+                    reply_text=None,
+                    status_text=f"prompt exceeds the {budgeted.budget} token budget",
+                )
+            augment_result = augment_messages(
+                budgeted.messages,
+                conversation_context=budgeted.conversation_context,
+                search_context=budgeted.search_context,
+                search_executed=search_executed,
+                max_history_chars=len(budgeted.conversation_context),  # already trimmed by tokens
+                conversation_summary=budgeted.conversation_summary,
+            )
+            rendered_messages = augment_result.messages
+            prompt_fits, prompt_tokens_est, prompt_budget = preflight(rendered_messages, llm_model)
+            if not prompt_fits:
+                logger.warning(f"prompt preflight rejected estimated={prompt_tokens_est} budget={prompt_budget}")
+                return CompletionData(
+                    status=CompletionResult.TOO_LONG,
+                    reply_text=None,
+                    status_text=f"prompt ~{prompt_tokens_est} tokens exceeds the {prompt_budget} token budget",
+                )
+        on_text = None
+        if stream_reply is not None:
+            on_text = lambda text, used: stream_reply.push(_model_prefix(used) + text)
+        cache_hit = False
+        cached = None
+        with graph.timer("llm"):
+            if completion_cache is not None:
+                response_key = completion_cache_key(llm_model, rendered_messages)
+                cached = completion_cache.get(response_key)
+            if cached is not None:
+                response, model_used = cached
+                metrics = {}
+                cache_hit = True
+            else:
+                response, metrics, model_used = await chat_with_fallback(
+                    rendered_messages, model=llm_model, purpose="completion",
+                    on_text=(lambda text, used: on_text(text, "fallback")) if use_fallback and on_text else on_text,
+                    priority=priority,
+                    fallback=not use_fallback,  # already on the fallback model: one retry loop only
+                )
+                if use_fallback:
+                    model_used = "fallback"
+                if (
+                    completion_cache is not None
+                    and not metrics.get('coalesced')
+                    and response.choices[0].get("finish_reason") == "stop"
+                    and (response.choices[0]["message"]["content"] or "").strip()
+                ):
+                    completion_cache.set(response_key, llm_model, response, model_used)
+                if (
+                    near_dup_text is not None
+                    and not use_fallback
+                    and search_status == "OK"
+                    and not metrics.get('coalesced')
+                    and response.choices[0].get("finish_reason") == "stop"
+                    and (response.choices[0]["message"]["content"] or "").strip()
+                ):
+                    near_dup_cache.add(OPENAI_MODEL, _near_dup_scope(channel), near_dup_text, response.choices[0]["message"]["content"].strip(), model_used)
         queue_wait_ms = metrics.get('queue_wait_ms', 0.0)
+        if not cache_hit:
+            work_gate.observe(queue_wait_ms)
         invoke_ms = metrics.get('invoke_ms', 0.0)
         attempt_used = metrics.get('attempt', 1)
+        first_token_ms = metrics.get('first_token_ms')
         reply = response.choices[0]["message"]["content"].strip()
         
         # Add model prefix to reply
-        if model_used == "primary":
-            reply = f"(model: {OPENAI_MODEL}) \n {reply}"
-        elif model_used == "fallback":
-            from sub.constants import OPENAI_FALLBACK_MODEL
-            reply = f"(fallback: {OPENAI_FALLBACK_MODEL}) \n {reply}"
+        reply = _model_prefix(model_used, metrics.get('hedged', False), cache_hit) + reply
 
         reply = sanitize_reply(reply, search_executed)
-        usage = getattr(response, "usage", {}) or {}
+        streamed = False
+        if stream_reply is not None and reply:
+            await stream_reply.finalize(reply)
+            streamed = True
+        # a cache hit spends no tokens
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0} if cache_hit else (getattr(response, "usage", {}) or {})
         prompt_toks = usage.get("prompt_tokens", "?")
         comp_toks = usage.get("completion_tokens", "?")
         total_toks = usage.get("total_tokens", "?")
@@ -135,10 +339,22 @@ async def generate_completion_response(
         except Exception:
             pass
         total_cost = cost_prompt + cost_completion
+        if usage_ledger is not None and not cache_hit and not metrics.get('coalesced'):
+            # coalesced followers share the leader's call: recorded once
+            usage_ledger.record(
+                *usage_scope,
+                model=OPENAI_FALLBACK_MODEL if model_used == "fallback" else OPENAI_MODEL,
+                purpose="completion",
+                prompt_tokens=int(prompt_toks) if str(prompt_toks).isdigit() else 0,
+                completion_tokens=int(comp_toks) if str(comp_toks).isdigit() else 0,
+                cost=total_cost,
+                latency_ms=queue_wait_ms + invoke_ms,
+            )
         logger.info(
             "openai_metrics decision=%s decision_score=%s decision_reasons=%s prompt_tokens=%s completion_tokens=%s total_tokens=%s "
             "queue_wait_ms=%.1f invoke_ms=%.1f attempt=%d messages=%d reply_chars=%d cost_prompt=%.6f cost_completion=%.6f cost_total=%.6f summary_applied=%s "
-            "augment_truncated=%s augment_sections=%s search_executed=%s search_status=%s",
+            "augment_truncated=%s augment_sections=%s search_executed=%s search_status=%s streamed=%s first_token_ms=%s priority=%s coalesced=%s coalesced_waiters=%s "
+            "cache_hit=%s cache_hit_ratio=%s cache_bytes=%s prompt_tokens_est=%d prompt_budget=%d prompt_trimmed=%s degrade=%s",
             decision.decision.name,
             getattr(decision, 'score', '?'),
             getattr(decision, 'reasons', []),
@@ -158,12 +374,28 @@ async def generate_completion_response(
             ','.join(augment_result.meta.sections_applied),
             search_executed,
             search_status,
+            streamed,
+            f"{first_token_ms:.1f}" if first_token_ms is not None else "-",
+            LLMPriority(priority).name,
+            metrics.get('coalesced', False),
+            metrics.get('coalesced_waiters', 0),
+            cache_hit,
+            f"{completion_cache.hit_ratio:.3f}" if completion_cache is not None else "-",
+            completion_cache.bytes_used if completion_cache is not None else "-",
+            prompt_tokens_est,
+            prompt_budget,
+            ','.join(budgeted.trimmed) or '-',
+            DegradeLevel(degrade).name,
         )
-        return CompletionData(status=CompletionResult.OK, reply_text=reply, status_text=None)
+        return CompletionData(status=CompletionResult.OK, reply_text=reply, status_text=None, streamed=streamed)
     except (OpenAITimeoutError, OpenAIFinalError) as e:
         logger.warning(f"OpenAI timeout/final error: {e}")
         # Return user-friendly Japanese timeout message
         timeout_message = "申し訳ありませんが、AIサービスがタイムアウトしました。しばらく待ってから再度お試しください。"
+        if stream_reply is not None and stream_reply.started:
+            # replace the partial streamed text in place
+            await stream_reply.finalize(timeout_message)
+            return CompletionData(status=CompletionResult.OK, reply_text=timeout_message, status_text=None, streamed=True)
         return CompletionData(status=CompletionResult.OK, reply_text=timeout_message, status_text=None)
     except openai.error.InvalidRequestError as e:
         if "This model's maximum context length" in e.user_message:
@@ -181,6 +413,17 @@ async def generate_completion_response(
         return CompletionData(
             status=CompletionResult.OTHER_ERROR, reply_text=None, status_text=str(e)
         )
+    finally:
+        graph.cancel()
+        if prefetch is not None:
+            prefetch.cancel()  # no-op unless we returned before consuming it
+        graph.log(priority=LLMPriority(priority).name, prefetched=prefetch is not None)
+        if stream_reply is not None and stream_reply.started:
+            # no-op after finalize(); otherwise remove partial text before the error embed
+            try:
+                await stream_reply.discard()
+            except Exception as de:
+                logger.warning(f"[stream] discard failed error={de}")
 
 async def process_thread_response(
     user: str, thread: discord.Thread, response_data: CompletionData
@@ -190,6 +433,8 @@ async def process_thread_response(
     status_text = response_data.status_text
     if status is CompletionResult.OK:
         sent_message = None
+        if response_data.streamed:
+            return
         if not reply_text:
             sent_message = await thread.send(
                 embed=discord.Embed(
@@ -226,6 +471,8 @@ async def process_channel_response(
     status_text = response_data.status_text
     if status is CompletionResult.OK:
         sent_message = None
+        if response_data.streamed:
+            return
         if not reply_text:
             sent_message = await channel.send(
                 embed=discord.Embed(
@@ -0,0 +1,185 @@
+"""Persistent exact-match completion cache (SQLite, opt-in).
+
+Responsibilities:
+  - Key = sha256 of model + rendered messages, canonicalized so the volatile
+    web search header (取得時刻) does not defeat repeated questions.
+  - TTL: entries older than COMPLETION_CACHE_TTL_SEC are never served.
+  - Size bound: total stored bytes <= COMPLETION_CACHE_MAX_BYTES, evicting the
+    least recently used rows first.
+  - Hit / miss counters and byte usage for openai_metrics and /diag.
+
+Rows are tiny and lookups are by primary key, so the sqlite3 calls run
+inline on the event loop (WAL + synchronous=NORMAL keeps commits cheap).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import openai
+from sub.constants import (
+    COMPLETION_CACHE_ENABLED,
+    COMPLETION_CACHE_PATH,
+    COMPLETION_CACHE_TTL_SEC,
+    COMPLETION_CACHE_MAX_BYTES,
+)
+from sub.infra.logging import logger, log_event
+
+# search_context header: 【Web検索結果（取得時刻: 2024-01-01 12:00:00 JST）】
+_SEARCH_TS_RE = re.compile(r"【Web検索結果（取得時刻: [^）]*）】")
+_SEARCH_TS_CANONICAL = "【Web検索結果】"
+
+
+def _canonical_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return _SEARCH_TS_RE.sub(_SEARCH_TS_CANONICAL, content)
+    if isinstance(content, list):
+        return [
+            dict(part, text=_canonical_content(part["text"]))
+            if isinstance(part, dict) and isinstance(part.get("text"), str) else part
+            for part in content
+        ]
+    return content
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]]) -> str:
+    canonical = [dict(m, content=_canonical_content(m.get("content"))) for m in messages]
+    payload = json.dumps([model, canonical], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(
+        self,
+        path: str = COMPLETION_CACHE_PATH,
+        ttl_sec: int = COMPLETION_CACHE_TTL_SEC,
+        max_bytes: int = COMPLETION_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, model TEXT, model_used TEXT, response TEXT,"
+                " bytes INTEGER, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions(accessed)")
+            conn.execute("DELETE FROM completions WHERE created < ?", (time.time() - self.ttl_sec,))
+            conn.commit()
+            self._bytes = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM completions").fetchone()[0]
+            self._conn = conn
+            log_event("completion_cache_open", path=self.path, bytes=self._bytes, ttl_s=self.ttl_sec, max_bytes=self.max_bytes)
+        return self._conn
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[Tuple[Any, str]]:
+        """Return (response_object, model_used) or None."""
+        try:
+            db = self._db()
+            row = db.execute(
+                "SELECT response, model_used, created, bytes FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None:
+                self.misses += 1
+                return None
+            response, model_used, created, size = row
+            if now - created > self.ttl_sec:
+                db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                db.commit()
+                self._bytes -= size
+                self.misses += 1
+                return None
+            db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return openai.util.convert_to_openai_object(json.loads(response)), model_used
+        except Exception as e:
+            logger.warning(f"completion_cache get failed error={e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, model: str, response: Any, model_used: str) -> None:
+        try:
+            payload = json.dumps(response, ensure_ascii=False)
+            size = len(payload.encode("utf-8"))
+            if size > self.max_bytes:
+                return
+            db = self._db()
+            old = db.execute("SELECT bytes FROM completions WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO completions (key, model, model_used, response, bytes, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, model_used, payload, size, now, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._evict(db)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"completion_cache set failed error={e}")
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        # expired rows first, then least recently used until under the byte bound
+        expired = db.execute(
+            "SELECT key, bytes FROM completions WHERE created < ?", (time.time() - self.ttl_sec,)
+        ).fetchall()
+        victims = list(expired)
+        if self._bytes - sum(b for _, b in victims) > self.max_bytes:
+            cursor = db.execute("SELECT key, bytes FROM completions ORDER BY accessed ASC")
+            remaining = self._bytes - sum(b for _, b in victims)
+            expired_keys = {k for k, _ in victims}
+            for key, size in cursor:
+                if remaining <= self.max_bytes:
+                    break
+                if key in expired_keys:
+                    continue
+                victims.append((key, size))
+                remaining -= size
+        if not victims:
+            return
+        db.executemany("DELETE FROM completions WHERE key = ?", [(k,) for k, _ in victims])
+        self._bytes -= sum(b for _, b in victims)
+        self.evictions += len(victims)
+        log_event("completion_cache_evict", rows=len(victims), bytes=self._bytes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 3),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+# singleton (None when COMPLETION_CACHE_ENABLED=0)
+cache: Optional[CompletionCache] = CompletionCache() if COMPLETION_CACHE_ENABLED else None
+
+__all__ = ["cache", "cache_key", "CompletionCache"]
@@ -0,0 +1,160 @@
+"""Adaptive (AIMD) concurrency limiting for OpenAI calls.
+
+Strategy:
+  - Additive increase: each success while the limit is saturated raises the
+    limit by 1/limit (≈ +1 per "window" of limit successes).
+  - Multiplicative decrease: a rate-limit / overload / timeout cuts the limit
+    by OPENAI_CONCURRENCY_DECREASE_FACTOR, at most once per cooldown so one
+    burst of 429s from the same wave counts as a single congestion signal.
+  - One limiter per model name (primary / fallback / summary models scale
+    independently; identical model names share provider capacity).
+
+Queued calls are served by priority with aging instead of FIFO: a waiter's
+key is ``enqueue_time + priority * OPENAI_PRIORITY_AGING_SEC``, so a lower
+priority call overtakes fresher higher priority ones once it has waited
+(level difference x aging) seconds. Nothing starves.
+
+Single event loop only (discord.py); no thread safety needed.
+"""
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, List, Tuple
+from sub.constants import (
+    OPENAI_CONCURRENCY_INITIAL,
+    OPENAI_CONCURRENCY_MIN,
+    OPENAI_CONCURRENCY_MAX,
+    OPENAI_CONCURRENCY_DECREASE_FACTOR,
+    OPENAI_PRIORITY_AGING_SEC,
+)
+from sub.infra.logging import log_event
+
+
+class LLMPriority(IntEnum):
+    """Lower value = served first (derived from the call site)."""
+    MENTION = 0  # direct mention / reply / name prefix / active thread
+    COMMAND = 1  # /thread, /message
+    FALLBACK = 2  # RESPOND_WITHOUT_MENTION passive replies
+    SUMMARY = 3  # background summarization
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial: int = OPENAI_CONCURRENCY_INITIAL,
+        min_limit: int = OPENAI_CONCURRENCY_MIN,
+        max_limit: int = OPENAI_CONCURRENCY_MAX,
+        decrease_factor: float = OPENAI_CONCURRENCY_DECREASE_FACTOR,
+        cooldown_sec: float = 2.0,
+        aging_sec: float = OPENAI_PRIORITY_AGING_SEC,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.cooldown_sec = cooldown_sec
+        self.aging_sec = aging_sec
+        self.in_flight = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []  # heap
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    async def acquire(self, priority: int = LLMPriority.MENTION) -> None:
+        if self.in_flight < self.current_limit and not self._waiting:
+            self.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        key = time.monotonic() + int(priority) * self.aging_sec
+        heapq.heappush(self._waiters, (key, next(self._seq), fut))
+        self._waiting += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # slot was granted right before cancellation: hand it on
+                self.release()
+            else:
+                # still queued: the heap entry is skipped lazily in _wake
+                fut.cancel()
+                self._waiting -= 1
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.current_limit:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self.in_flight += 1
+            self._waiting -= 1
+            fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = LLMPriority.MENTION) -> AsyncIterator["AdaptiveLimiter"]:
+        await self.acquire(priority)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def on_success(self) -> None:
+        # grow only under demand; an idle limiter should not drift to max
+        if self.in_flight >= self.current_limit or self._waiting:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_overload(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_sec:
+            return
+        self._last_decrease = now
+        before = self.limit
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        log_event(
+            "openai_limit_decrease",
+            model=self.name,
+            reason=reason,
+            limit_before=f"{before:.2f}",
+            limit=f"{self.limit:.2f}",
+            in_flight=self.in_flight,
+            queue_depth=self.queue_depth,
+        )
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(model: str) -> AdaptiveLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limiter = AdaptiveLimiter(model)
+        _limiters[model] = limiter
+    return limiter
+
+
+def limiter_snapshot() -> Dict[str, Dict[str, float]]:
+    return {
+        name: {"limit": round(l.limit, 2), "in_flight": l.in_flight, "queue_depth": l.queue_depth}
+        for name, l in _limiters.items()
+    }
+
+
+__all__ = ["AdaptiveLimiter", "LLMPriority", "get_limiter", "limiter_snapshot"]
@@ -0,0 +1,35 @@
+"""Rolling per-model latency samples (successful OpenAI calls).
+
+Used to derive adaptive thresholds such as the hedging delay (e.g. p90 of the
+primary model). Samples are end-to-end ``chat()`` latency: queue wait +
+invoke, which is what the user actually waits for.
+"""
+from __future__ import annotations
+from collections import deque
+from typing import Deque, Dict, Optional
+
+_WINDOW = 200  # most recent samples kept per model
+_MIN_SAMPLES = 20  # percentile is not trusted below this
+
+_samples: Dict[str, Deque[float]] = {}
+
+
+def record(model: str, latency_ms: float) -> None:
+    dq = _samples.get(model)
+    if dq is None:
+        dq = deque(maxlen=_WINDOW)
+        _samples[model] = dq
+    dq.append(latency_ms)
+
+
+def percentile(model: str, q: float, min_samples: int = _MIN_SAMPLES) -> Optional[float]:
+    """Return the q-quantile (0..1) in ms, or None when there are too few samples."""
+    dq = _samples.get(model)
+    if not dq or len(dq) < min_samples:
+        return None
+    ordered = sorted(dq)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+__all__ = ["record", "percentile"]
@@ -8,15 +8,17 @@ from sub.infra.logging import logger
 # 将来的に設定化したい値 (必要なら環境変数化)
 DEFAULT_MAX_HISTORY_CHARS = 4000  # 会話履歴インジェクション最大長
 DEFAULT_CONTEXT_HEADER = "会話履歴:"  # 会話履歴前に付与
+DEFAULT_SUMMARY_HEADER = "これまでの会話の要約:"  # 履歴から押し出された古い会話の要約 (RollingSummarizer)
 INJECTED_SEARCH_GUIDELINE_JA = (
     "最新ニュース系の質問に対して、上に最新検索結果がある場合は『リアルタイム取得できません』等の定型免責を繰り返さず、検索結果と一般知識を統合し簡潔で正確な日本語要約を提供してください。"
 )
 
 # セクション化: 既存 system メッセージ内の管理領域を差分更新
+SECTION_SUMMARY = "### <SUMMARY>"
 SECTION_CONV = "### <CONVERSATION_CONTEXT>"
 SECTION_SEARCH = "### <SEARCH_CONTEXT>"
 SECTION_GUIDELINE = "### <GUIDELINE>"
-MANAGED_SECTIONS = [SECTION_CONV, SECTION_SEARCH, SECTION_GUIDELINE]
+MANAGED_SECTIONS = [SECTION_SUMMARY, SECTION_CONV, SECTION_SEARCH, SECTION_GUIDELINE]
 
 @dataclass
 class AugmentMeta:
@@ -28,6 +30,7 @@ class AugmentMeta:
     added_system: bool
     diff_mode: bool  # 既存systemをセクション差分置換した場合 True
     sections_applied: List[str]
+    summary_injected: bool = False
 
 @dataclass
 class AugmentResult:
@@ -53,9 +56,11 @@ def augment_messages(
     search_context: Optional[str] = None,
     search_executed: bool = False,
     max_history_chars: int = DEFAULT_MAX_HISTORY_CHARS,
+    conversation_summary: Optional[str] = None,
 ) -> AugmentResult:
     """汎用メッセージ拡張。
-    - 会話履歴/検索結果/ガイドラインを既存 system に追記 (なければ作成)。
+    - 会話要約/会話履歴/検索結果/ガイドラインを既存 system に追記 (なければ作成)。
+    - 会話要約はバックグラウンドで更新済みのものを受け取るだけ (ここでは LLM を呼ばない)。
     - 会話履歴は長い場合後方優先トリミング。
     - すでに同一ブロックが存在する場合は重複注入を避ける。
     """
@@ -70,8 +75,12 @@ def augment_messages(
         used_chars = len(truncated_text)
         conversation_block = f"{DEFAULT_CONTEXT_HEADER}\n{truncated_text}" if truncated_text else ""
 
+    summary_block = f"{DEFAULT_SUMMARY_HEADER}\n{conversation_summary.strip()}" if conversation_summary and conversation_summary.strip() else ""
+
     # インジェクトするパーツを順序で蓄積
     parts: List[str] = []
+    if summary_block:
+        parts.append(summary_block)
     if conversation_block:
         parts.append(conversation_block)
     if search_context:
@@ -122,6 +131,9 @@ def augment_messages(
 
         # 新セクション組み立て
         new_sections: List[str] = []
+        if summary_block:
+            new_sections.append(f"{SECTION_SUMMARY}\n{summary_block}")
+            sections_applied.append(SECTION_SUMMARY)
         if conversation_block:
             new_sections.append(f"{SECTION_CONV}\n{conversation_block}")
             sections_applied.append(SECTION_CONV)
@@ -137,6 +149,8 @@ def augment_messages(
         diff_mode = True
     else:
         # 新規 system 作成 (セクション形式)
+        if summary_block:
+            sections_applied.append(SECTION_SUMMARY)
         if conversation_block:
             sections_applied.append(SECTION_CONV)
         if search_context:
@@ -144,6 +158,8 @@ def augment_messages(
         if search_executed:
             sections_applied.append(SECTION_GUIDELINE)
         section_blocks: List[str] = []
+        if summary_block:
+            section_blocks.append(f"{SECTION_SUMMARY}\n{summary_block}")
         if conversation_block:
             section_blocks.append(f"{SECTION_CONV}\n{conversation_block}")
         if search_context:
@@ -162,6 +178,7 @@ def augment_messages(
         added_system=added_system,
         diff_mode=diff_mode,
         sections_applied=sections_applied,
+        summary_injected=bool(summary_block),
     )
 
     logger.info(
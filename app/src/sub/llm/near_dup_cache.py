@@ -0,0 +1,227 @@
+"""In-process near-duplicate answer cache (MinHash + LSH over char n-grams).
+
+Paraphrased questions ("今日の天気は？" / "今日の天気教えて") miss the exact
+completion cache. This index matches them by shingle similarity:
+
+  - text    = latest user message + search query (one line each), each line
+              NFKC-normalized, lowercased, whitespace / punctuation removed
+  - shingles = character n-grams per line (NEAR_DUP_NGRAM, default 2 which
+              suits CJK)
+  - pinned terms (numbers, relative dates such as 今日 / 明日) must match
+    exactly: "今日の天気" and "明日の天気" share most n-grams but differ in
+    meaning
+  - signature: one-permutation MinHash (one crc32 per shingle, NUM_BINS bins,
+    empty bins densified from the next filled bin) so hashing is O(shingles)
+  - LSH: BANDS bands of ROWS bins; entries sharing MIN_BAND_VOTES bands are
+    candidates (oversized buckets are skipped, see MAX_BUCKET_SCAN)
+  - candidates are verified with the exact Jaccard similarity of the shingle
+    sets and the best one >= NEAR_DUP_THRESHOLD is returned
+
+Entries are scoped (the guild, or the channel outside guilds): a reply
+written with one server's conversation and usernames is never served in
+another. The scope is part of every LSH band key, so other scopes' entries
+are not even candidates.
+
+Only search-backed, non-conversational answers are stored (see
+completion.py); entries expire after NEAR_DUP_CACHE_TTL_SEC and the oldest
+entry is evicted beyond NEAR_DUP_CACHE_MAX_ITEMS. A lookup costs tens of
+microseconds (see app/bench/bench_near_dup_cache.py).
+"""
+from __future__ import annotations
+import re
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+from sub.constants import (
+    NEAR_DUP_CACHE_ENABLED,
+    NEAR_DUP_THRESHOLD,
+    NEAR_DUP_NGRAM,
+    NEAR_DUP_CACHE_TTL_SEC,
+    NEAR_DUP_CACHE_MAX_ITEMS,
+)
+from sub.infra.logging import log_event
+
+NUM_BINS = 32
+ROWS = 2
+BANDS = NUM_BINS // ROWS
+# an entry must share >= 2 bands: P(candidate) ~0.94 at J=0.5, ~0.4 at J=0.3
+MIN_BAND_VOTES = 2
+# bands shared by this many entries come from stock phrases ("の天気は") and
+# carry no signal (like stop words); skipping them keeps lookups O(small)
+MAX_BUCKET_SCAN = 64
+_BIN_MASK = NUM_BINS - 1
+_BIN_SHIFT = NUM_BINS.bit_length() - 1
+_EMPTY = 1 << 32
+
+_STRIP_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+_PINNED_RE = re.compile(r"\d+|一昨日|昨日|今日|明日|明後日|今週|先週|来週|今月|先月|来月|今年|去年|昨年|来年|今朝|今夜|午前|午後")
+
+# the latest message leans on earlier turns: its answer is not reusable
+_CONTEXT_MARKERS = ("それ", "これ", "あれ", "さっき", "先ほど", "前の", "上の", "続き", "もっと", "他には")
+
+
+def normalize(text: str) -> str:
+    return _STRIP_RE.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def shingles(text: str, n: int = NEAR_DUP_NGRAM) -> FrozenSet[str]:
+    if len(text) <= n:
+        return frozenset((text,)) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def text_grams(text: str) -> FrozenSet[str]:
+    grams: Set[str] = set()
+    for line in text.split("\n"):
+        grams |= shingles(normalize(line))
+    return frozenset(grams)
+
+
+def pinned_terms(text: str) -> FrozenSet[str]:
+    return frozenset(_PINNED_RE.findall(unicodedata.normalize("NFKC", text)))
+
+
+def signature(grams: FrozenSet[str]) -> List[int]:
+    sig = [_EMPTY] * NUM_BINS
+    for g in grams:
+        h = zlib.crc32(g.encode("utf-8"))
+        b = h & _BIN_MASK
+        v = h >> _BIN_SHIFT
+        if v < sig[b]:
+            sig[b] = v
+    # densify: an empty bin borrows the next filled bin (cyclic) plus an offset
+    if _EMPTY in sig and len(grams):
+        for i in range(NUM_BINS):
+            if sig[i] == _EMPTY:
+                j = 1
+                while sig[(i + j) & _BIN_MASK] >= _EMPTY:
+                    j += 1
+                sig[i] = _EMPTY + j * NUM_BINS + sig[(i + j) & _BIN_MASK]
+    return sig
+
+
+def band_keys(sig: List[int], scope: str = "") -> List[Tuple[Any, ...]]:
+    return [(scope, b) + tuple(sig[b * ROWS:(b + 1) * ROWS]) for b in range(BANDS)]
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+def references_context(text: str) -> bool:
+    return any(m in text for m in _CONTEXT_MARKERS)
+
+
+@dataclass
+class _Entry:
+    model: str
+    scope: str
+    grams: FrozenSet[str]
+    pinned: FrozenSet[str]
+    keys: List[Tuple[Any, ...]]
+    response: Any
+    model_used: str
+    created: float
+
+
+@dataclass
+class NearDupHit:
+    response: Any
+    model_used: str
+    similarity: float
+
+
+class NearDupCache:
+    def __init__(
+        self,
+        threshold: float = NEAR_DUP_THRESHOLD,
+        ttl_sec: int = NEAR_DUP_CACHE_TTL_SEC,
+        max_items: int = NEAR_DUP_CACHE_MAX_ITEMS,
+    ):
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_items = max_items
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[Any, ...], Set[int]] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, model: str, scope: str, text: str) -> Optional[NearDupHit]:
+        """Best entry of the same model and scope (guild) similar enough to text."""
+        grams = text_grams(text)
+        if not grams:
+            return None
+        votes: Dict[int, int] = {}
+        for key in band_keys(signature(grams), scope):
+            ids = self._buckets.get(key)
+            if ids and len(ids) <= MAX_BUCKET_SCAN:
+                for eid in ids:
+                    votes[eid] = votes.get(eid, 0) + 1
+        candidates = [eid for eid, n in votes.items() if n >= MIN_BAND_VOTES]
+        now = time.time()
+        best: Optional[_Entry] = None
+        best_sim = 0.0
+        pinned = pinned_terms(text)
+        expired: List[int] = []
+        for eid in candidates:
+            entry = self._entries[eid]
+            if now - entry.created > self.ttl_sec:
+                expired.append(eid)
+                continue
+            if entry.model != model or entry.scope != scope or entry.pinned != pinned:
+                continue
+            sim = jaccard(grams, entry.grams)
+            if sim > best_sim:
+                best, best_sim = entry, sim
+        for eid in expired:
+            self._remove(eid)
+        if best is None or best_sim < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        log_event("near_dup_hit", similarity=f"{best_sim:.3f}", candidates=len(candidates), entries=len(self._entries))
+        return NearDupHit(best.response, best.model_used, best_sim)
+
+    def add(self, model: str, scope: str, text: str, response: Any, model_used: str) -> None:
+        grams = text_grams(text)
+        if not grams:
+            return
+        eid = self._next_id
+        self._next_id += 1
+        keys = band_keys(signature(grams), scope)
+        self._entries[eid] = _Entry(model, scope, grams, pinned_terms(text), keys, response, model_used, time.time())
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(eid)
+        while len(self._entries) > self.max_items:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, eid: int) -> None:
+        entry = self._entries.pop(eid, None)
+        if entry is None:
+            return
+        for key in entry.keys:
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.discard(eid)
+                if not ids:
+                    del self._buckets[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "buckets": len(self._buckets), "hits": self.hits, "misses": self.misses}
+
+
+# singleton (None when NEAR_DUP_CACHE_ENABLED=0)
+cache: Optional[NearDupCache] = NearDupCache() if NEAR_DUP_CACHE_ENABLED else None
+
+__all__ = ["cache", "NearDupCache", "NearDupHit", "references_context", "text_grams", "signature", "jaccard"]
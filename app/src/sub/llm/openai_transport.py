@@ -0,0 +1,240 @@
+"""Asyncio HTTP transport for the OpenAI Chat Completions endpoint.
+
+Responsibilities:
+  - Keep ONE long-lived aiohttp.ClientSession per process so connections are
+    pooled / kept alive and DNS lookups are cached (no TLS handshake per call).
+  - Map HTTP / network failures onto openai.error.* exceptions so the retry
+    classification in openai_wrapper works the same as with the SDK path.
+  - Return openai.openai_object.OpenAIObject so callers keep using
+    ``resp.choices[0]["message"]["content"]`` / ``resp.usage`` unchanged.
+  - Streaming (SSE) variant that reports the accumulated text as it grows and
+    still returns one aggregated response object at the end. Token usage is
+    requested with stream_options only where the server is known to accept
+    it (OPENAI_STREAM_USAGE); a 400 naming stream_options turns it off and
+    the call is retried once without it.
+
+The session is created lazily on first use so it binds to the running loop
+(discord.py creates the loop inside ``client.run``).
+"""
+from __future__ import annotations
+import asyncio
+import json
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+import aiohttp
+import openai
+from openai.openai_object import OpenAIObject
+from sub.constants import (
+    OPENAI_API_BASE,
+    OPENAI_HTTP_POOL_LIMIT,
+    OPENAI_HTTP_KEEPALIVE_SEC,
+    OPENAI_HTTP_DNS_TTL_SEC,
+    OPENAI_STREAM_USAGE,
+)
+from sub.infra.logging import log_event
+
+
+def _error_message(body: bytes) -> str:
+    try:
+        data = json.loads(body)
+        err = data.get("error") if isinstance(data, dict) else None
+        if isinstance(err, dict) and err.get("message"):
+            return str(err["message"])
+    except Exception:
+        pass
+    return body[:300].decode("utf-8", errors="replace")
+
+
+def _raise_for_status(status: int, body: bytes, headers: Any) -> None:
+    """Raise the openai.error type the SDK would raise for this HTTP status."""
+    if status < 400:
+        return
+    message = f"HTTP {status}: {_error_message(body)}"
+    kwargs = dict(http_body=body, http_status=status, headers=dict(headers or {}))
+    if status == 429:
+        raise openai.error.RateLimitError(message, **kwargs)
+    if status in (400, 404, 409, 422):
+        raise openai.error.InvalidRequestError(message, None, **kwargs)
+    if status == 401:
+        raise openai.error.AuthenticationError(message, **kwargs)
+    if status == 403:
+        raise openai.error.PermissionError(message, **kwargs)
+    if status == 503:
+        raise openai.error.ServiceUnavailableError(message, **kwargs)
+    raise openai.error.APIError(message, **kwargs)
+
+
+def build_stream_response(model: str, text: str, finish_reason: Optional[str], usage: Optional[Dict[str, Any]]) -> OpenAIObject:
+    """Aggregate a streamed completion into the non-streaming response shape."""
+    return openai.util.convert_to_openai_object({
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": finish_reason,
+        }],
+        "usage": usage or {},
+    })
+
+
+class OpenAIHTTPTransport:
+    def __init__(
+        self,
+        api_base: str = OPENAI_API_BASE,
+        pool_limit: int = OPENAI_HTTP_POOL_LIMIT,
+        keepalive_sec: float = OPENAI_HTTP_KEEPALIVE_SEC,
+        dns_ttl_sec: int = OPENAI_HTTP_DNS_TTL_SEC,
+        stream_usage: str = OPENAI_STREAM_USAGE,
+    ):
+        self.api_base = api_base.rstrip("/")
+        self.pool_limit = pool_limit
+        self.keepalive_sec = keepalive_sec
+        self.dns_ttl_sec = dns_ttl_sec
+        # OpenAI-compatible servers may reject the unknown stream_options field
+        if stream_usage == "auto":
+            self.stream_usage = urlparse(self.api_base).hostname == "api.openai.com"
+        else:
+            self.stream_usage = stream_usage not in ("0", "false", "off", "")
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit,
+                keepalive_timeout=self.keepalive_sec,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl_sec,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            log_event(
+                "openai_http_session_open",
+                api_base=self.api_base,
+                pool_limit=self.pool_limit,
+                keepalive_s=self.keepalive_sec,
+                dns_ttl_s=self.dns_ttl_sec,
+            )
+        return self._session
+
+    async def chat_completion(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        timeout: float,
+        **params: Any,
+    ) -> OpenAIObject:
+        """POST /chat/completions and return the parsed response object."""
+        session = self._get_session()
+        payload: Dict[str, Any] = {"model": model, "messages": messages}
+        payload.update(params)
+        headers = {"Authorization": f"Bearer {api_key}"}
+        try:
+            async with session.post(
+                f"{self.api_base}/chat/completions",
+                json=payload,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as resp:
+                body = await resp.read()
+                _raise_for_status(resp.status, body, resp.headers)
+        except asyncio.TimeoutError as e:
+            raise openai.error.Timeout(f"Request timeout after {timeout}s") from e
+        except aiohttp.ClientError as e:
+            raise openai.error.APIConnectionError(f"Connection error: {e}") from e
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise openai.error.APIError(f"Invalid JSON response: {body[:200]!r}") from e
+        return openai.util.convert_to_openai_object(data)
+
+    async def chat_completion_stream(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        timeout: float,
+        on_text: Callable[[str], None],
+        **params: Any,
+    ) -> OpenAIObject:
+        """POST /chat/completions with stream=true.
+
+        ``on_text`` receives the full text accumulated so far after every
+        content delta. ``timeout`` bounds connect and the gap between chunks
+        (not the whole stream, which may legitimately run longer).
+        """
+        include_usage = self.stream_usage
+        try:
+            return await self._stream(api_key, model, messages, timeout, on_text, include_usage, params)
+        except openai.error.InvalidRequestError as e:
+            if not include_usage or e.http_status != 400 or "stream_options" not in str(e):
+                raise
+            # nothing was streamed yet (rejected before the body): retry once without it
+            self.stream_usage = False
+            log_event("openai_stream_usage_disabled", api_base=self.api_base, error=str(e)[:200])
+            return await self._stream(api_key, model, messages, timeout, on_text, False, params)
+
+    async def _stream(
+        self,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        timeout: float,
+        on_text: Callable[[str], None],
+        include_usage: bool,
+        params: Dict[str, Any],
+    ) -> OpenAIObject:
+        session = self._get_session()
+        payload: Dict[str, Any] = {"model": model, "messages": messages, "stream": True}
+        if include_usage:
+            payload["stream_options"] = {"include_usage": True}
+        payload.update(params)
+        headers = {"Authorization": f"Bearer {api_key}"}
+        text = ""
+        finish_reason: Optional[str] = None
+        usage: Optional[Dict[str, Any]] = None
+        try:
+            async with session.post(
+                f"{self.api_base}/chat/completions",
+                json=payload,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+            ) as resp:
+                if resp.status >= 400:
+                    _raise_for_status(resp.status, await resp.read(), resp.headers)
+                async for raw_line in resp.content:
+                    line = raw_line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            text += delta
+                            on_text(text)
+                        if choice.get("finish_reason"):
+                            finish_reason = choice["finish_reason"]
+        except asyncio.TimeoutError as e:
+            raise openai.error.Timeout(f"Request timeout after {timeout}s (stream)") from e
+        except aiohttp.ClientError as e:
+            raise openai.error.APIConnectionError(f"Connection error: {e}") from e
+        return build_stream_response(model, text, finish_reason, usage)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+# singleton
+transport = OpenAIHTTPTransport()
+
+__all__ = ["transport", "OpenAIHTTPTransport", "build_stream_response"]
@@ -1,13 +1,22 @@
 import asyncio
+import threading
 import time
 import openai
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from sub.constants import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_PRIMARY_TIMEOUT_SEC, OPENAI_FALLBACK_TIMEOUT_SEC, OPENAI_FALLBACK_MODEL, OPENAI_MAX_ATTEMPTS
+from sub.constants import OPENAI_TRANSPORT, OPENAI_API_BASE, OPENAI_EXPECTED_COMPLETION_TOKENS
+from sub.constants import OPENAI_SINGLE_FLIGHT
+from sub.constants import OPENAI_HEDGE_ENABLED, OPENAI_HEDGE_DELAY_SEC, OPENAI_HEDGE_PERCENTILE, OPENAI_HEDGE_MIN_DELAY_SEC
 from sub.infra.logging import logger, log_event
-
-# Public semaphore size can be tuned later
-_DEFAULT_CONCURRENCY = 3
-_semaphore = asyncio.Semaphore(_DEFAULT_CONCURRENCY)
+from sub.llm.openai_transport import transport as http_transport, build_stream_response
+from sub.llm.concurrency import LLMPriority, get_limiter, limiter_snapshot
+from sub.llm.budget import get_budgeter, budget_snapshot
+from sub.llm.token_utils import estimate_tokens_from_messages, memo_stats as token_memo_stats
+from sub.llm import latency
+from sub.llm.circuit_breaker import get_breaker, breaker_snapshot
+from sub.llm.single_flight import SingleFlight, request_key
+from sub.llm.completion_cache import cache as completion_cache
+from sub.llm.near_dup_cache import cache as near_dup_cache
 
 class OpenAIError(Exception):
     pass
@@ -20,6 +29,13 @@ class OpenAIFinalError(OpenAIError):
     """Raised when all retry attempts are exhausted."""
     pass
 
+class OpenAICircuitOpenError(OpenAIFinalError):
+    """Raised without calling the API while the model's circuit breaker is open."""
+    pass
+
+# identical concurrent chat_with_fallback calls share one upstream call
+_single_flight = SingleFlight()
+
 def _is_timeout(exception: Exception) -> bool:
     """Check if exception indicates a timeout."""
     return 'timeout' in str(exception).lower()
@@ -31,6 +47,105 @@ def _is_retriable(exception: Exception) -> bool:
         'rate limit', 'timeout', 'temporar', 'overloaded', '503'
     ])
 
+def _is_provider_failure(exception: Exception) -> bool:
+    """Failures that indicate a degraded provider (count against the circuit breaker)."""
+    if isinstance(exception, (openai.error.APIError, openai.error.APIConnectionError,
+                              openai.error.ServiceUnavailableError, openai.error.Timeout)):
+        return True
+    return _is_retriable(exception)
+
+def _overload_reason(exception: Exception) -> Optional[str]:
+    """Classify errors that signal provider congestion (drive the AIMD decrease)."""
+    error_str = str(exception).lower()
+    if 'rate limit' in error_str or '429' in error_str:
+        return 'rate_limit'
+    if 'timeout' in error_str:
+        return 'timeout'
+    if any(k in error_str for k in ['overloaded', '503', 'temporar']):
+        return 'overload'
+    return None
+
+def _invoke_thread(model: str, messages: List[Dict[str, Any]], timeout: int) -> Tuple[Any, float]:
+    """Blocking SDK call (run via asyncio.to_thread). Returns (resp, invoke_ms)."""
+    invoke_start = time.perf_counter()
+    resp = openai.ChatCompletion.create(
+        model=model,
+        messages=messages,
+        timeout=timeout,
+    )
+    invoke_ms = (time.perf_counter() - invoke_start) * 1000
+    return resp, invoke_ms
+
+async def _invoke_http(model: str, messages: List[Dict[str, Any]], timeout: int) -> Tuple[Any, float]:
+    """Native asyncio call over the pooled keep-alive session. Returns (resp, invoke_ms)."""
+    invoke_start = time.perf_counter()
+    resp = await http_transport.chat_completion(OPENAI_API_KEY, model, messages, timeout)
+    invoke_ms = (time.perf_counter() - invoke_start) * 1000
+    return resp, invoke_ms
+
+def _invoke_thread_stream(
+    model: str,
+    messages: List[Dict[str, Any]],
+    timeout: int,
+    on_text: Callable[[str], None],
+    stop: Optional[threading.Event] = None,
+) -> Tuple[Any, float]:
+    """Blocking SDK streaming call; aggregates chunks into one response object.
+
+    stop: set by the awaiting coroutine when it is cancelled; the stream is
+    abandoned at the next chunk instead of being read to the end.
+    """
+    invoke_start = time.perf_counter()
+    text = ""
+    finish_reason = None
+    for chunk in openai.ChatCompletion.create(
+        model=model,
+        messages=messages,
+        timeout=timeout,
+        stream=True,
+    ):
+        if stop is not None and stop.is_set():
+            break
+        for choice in chunk.get("choices") or []:
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                text += delta
+                on_text(text)
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+    invoke_ms = (time.perf_counter() - invoke_start) * 1000
+    return build_stream_response(model, text, finish_reason, None), invoke_ms
+
+async def _invoke_http_stream(model: str, messages: List[Dict[str, Any]], timeout: int, on_text: Callable[[str], None]) -> Tuple[Any, float]:
+    invoke_start = time.perf_counter()
+    resp = await http_transport.chat_completion_stream(OPENAI_API_KEY, model, messages, timeout, on_text)
+    invoke_ms = (time.perf_counter() - invoke_start) * 1000
+    return resp, invoke_ms
+
+async def _invoke(
+    model: str,
+    messages: List[Dict[str, Any]],
+    timeout: int,
+    on_text: Optional[Callable[[str], None]] = None,
+) -> Tuple[Any, float]:
+    if on_text is None:
+        if OPENAI_TRANSPORT == "thread":
+            return await asyncio.to_thread(_invoke_thread, model, messages, timeout)
+        return await _invoke_http(model, messages, timeout)
+    if OPENAI_TRANSPORT == "thread":
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+        try:
+            return await asyncio.to_thread(
+                _invoke_thread_stream, model, messages, timeout,
+                lambda text: loop.call_soon_threadsafe(on_text, text),
+                stop,
+            )
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+    return await _invoke_http_stream(model, messages, timeout, on_text)
+
 async def chat(
     messages: List[Dict[str, Any]],
     model: Optional[str] = None,
@@ -38,78 +153,191 @@ async def chat(
     max_attempts: int = 3,
     backoff_base: float = 0.8,
     purpose: str = "completion",
+    on_text: Optional[Callable[[str], None]] = None,
+    priority: int = LLMPriority.MENTION,
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """Unified OpenAI ChatCompletion wrapper with:
-    - semaphore concurrency control
+    - pooled asyncio HTTP transport (OPENAI_TRANSPORT=thread for the SDK path)
+    - optional streaming: on_text(accumulated_text) per delta; a retry restarts
+      the text from scratch, so consumers must treat each call as "replace"
+    - per-model circuit breaker (fails fast with OpenAICircuitOpenError while open)
+    - client-side TPM/RPM budget (waits locally instead of provoking 429s,
+      before taking a concurrency slot; backoff also waits outside the slot)
+    - adaptive (AIMD) per-model concurrency control; queued calls are served
+      by priority (LLMPriority, with aging) rather than FIFO
     - retry (exponential backoff + jitter)
     - timing metrics
+    - cancellation (e.g. the request went stale): propagates from any stage
+      (queue, budget wait, invoke, backoff) without retrying; the concurrency
+      slot and a half-open breaker probe are released, an unsettled token
+      reservation is refunded, and openai_call_cancelled is logged. With
+      OPENAI_TRANSPORT=thread a non-streaming SDK call cannot be interrupted
+      and finishes in its worker thread (its slot is released anyway).
     Returns: (raw_response, metrics_dict)
-    metrics: queue_wait_ms, invoke_ms, attempt, purpose
+    metrics: queue_wait_ms, invoke_ms, attempt, purpose, priority, transport, first_token_ms (stream only)
     """
-    start_wait = time.perf_counter()
-    async with _semaphore:
-        queue_wait_ms = (time.perf_counter() - start_wait) * 1000
+    breaker = get_breaker(model or OPENAI_MODEL)
+    ticket = breaker.admit() if breaker else None
+    if breaker is not None and ticket is None:
+        log_event("openai_circuit_reject", model=(model or OPENAI_MODEL), purpose=purpose, state=breaker.state.value)
+        raise OpenAICircuitOpenError(f"circuit open for model={model or OPENAI_MODEL}")
+    stage = "queue"
+    attempt = 0
+    reservation = None
+    try:
+        limiter = get_limiter(model or OPENAI_MODEL)
+        budgeter = get_budgeter(model or OPENAI_MODEL)
+        estimated_tokens = 0
+        if budgeter.enabled:
+            try:
+                estimated_tokens = estimate_tokens_from_messages(messages, model or OPENAI_MODEL)
+            except Exception:
+                estimated_tokens = 0
+            estimated_tokens += OPENAI_EXPECTED_COMPLETION_TOKENS
+        queue_depth_at_enqueue = limiter.queue_depth
+        queue_wait_ms = 0.0
         openai.api_key = OPENAI_API_KEY
+        openai.api_base = OPENAI_API_BASE
         last_exc = None
         for attempt in range(1, max_attempts + 1):
-            def _sync_invoke():
-                invoke_start = time.perf_counter()
-                resp = openai.ChatCompletion.create(
-                    model=model or OPENAI_MODEL,
-                    messages=messages,
-                    timeout=timeout,
-                )
-                invoke_ms = (time.perf_counter() - invoke_start) * 1000
-                return resp, invoke_ms
-            try:
-                resp, invoke_ms = await asyncio.to_thread(_sync_invoke)
-                metrics = {
-                    'queue_wait_ms': queue_wait_ms,
-                    'invoke_ms': invoke_ms,
-                    'attempt': attempt,
-                    'purpose': purpose,
-                }
+            # budget first: a TPM/RPM stall must not hold a concurrency slot
+            # that other callers could use, nor count as queue wait
+            stage = "budget"
+            reservation = await budgeter.reserve(estimated_tokens)
+            stage = "queue"
+            start_wait = time.perf_counter()
+            async with limiter.slot(priority):
+                queue_wait_ms += (time.perf_counter() - start_wait) * 1000
+                attempt_start = time.perf_counter()
+                first_token_at: List[float] = []
+                stream_cb = None
+                if on_text is not None:
+                    def stream_cb(text: str, _first=first_token_at) -> None:
+                        if not _first:
+                            _first.append(time.perf_counter())
+                        on_text(text)
+                stage = "invoke"
                 try:
+                    resp, invoke_ms = await _invoke(model or OPENAI_MODEL, messages, timeout, stream_cb)
+                    first_token_ms = (first_token_at[0] - attempt_start) * 1000 if first_token_at else None
+                    metrics = {
+                        'queue_wait_ms': queue_wait_ms,
+                        'invoke_ms': invoke_ms,
+                        'attempt': attempt,
+                        'purpose': purpose,
+                        'priority': int(priority),
+                        'transport': OPENAI_TRANSPORT,
+                        'first_token_ms': first_token_ms,
+                        'concurrency_limit': limiter.current_limit,
+                        'queue_depth': queue_depth_at_enqueue,
+                        'budget_wait_ms': reservation.wait_ms,
+                    }
+                    limiter.on_success()
+                    if ticket is not None:
+                        breaker.record_success(ticket)
+                    latency.record(model or OPENAI_MODEL, queue_wait_ms + invoke_ms)
                     usage = getattr(resp, 'usage', None) or {}
-                    prompt_t = usage.get('prompt_tokens') if isinstance(usage, dict) else None
-                    comp_t = usage.get('completion_tokens') if isinstance(usage, dict) else None
-                    total_t = usage.get('total_tokens') if isinstance(usage, dict) else None
-                    log_event("openai_call", attempt=attempt, purpose=purpose, invoke_ms=f"{invoke_ms:.1f}", queue_wait_ms=f"{queue_wait_ms:.1f}", prompt_tokens=prompt_t, completion_tokens=comp_t, total_tokens=total_t, model=(model or OPENAI_MODEL))
-                except Exception:
-                    pass
-                return resp, metrics
-            except Exception as e:
-                last_exc = e
-                retriable = _is_retriable(e)
-                is_timeout = _is_timeout(e)
-                
-                if is_timeout:
-                    log_event("openai_timeout", purpose=purpose, attempt=attempt, timeout=timeout, model=(model or OPENAI_MODEL))
+                    budget_wait_ms = reservation.wait_ms
+                    budgeter.settle(reservation, usage.get('total_tokens') if isinstance(usage, dict) else None)
+                    reservation = None
+                    try:
+                        prompt_t = usage.get('prompt_tokens') if isinstance(usage, dict) else None
+                        comp_t = usage.get('completion_tokens') if isinstance(usage, dict) else None
+                        total_t = usage.get('total_tokens') if isinstance(usage, dict) else None
+                        log_event("openai_call", attempt=attempt, purpose=purpose, priority=int(priority), invoke_ms=f"{invoke_ms:.1f}", queue_wait_ms=f"{queue_wait_ms:.1f}", prompt_tokens=prompt_t, completion_tokens=comp_t, total_tokens=total_t, model=(model or OPENAI_MODEL), transport=OPENAI_TRANSPORT, first_token_ms=(f"{first_token_ms:.1f}" if first_token_ms is not None else None), concurrency_limit=limiter.current_limit, in_flight=limiter.in_flight, queue_depth=limiter.queue_depth, budget_wait_ms=f"{budget_wait_ms:.1f}")
+                    except Exception as log_e:
+                        logger.warning(f"openai_call log failed error={log_e!r}")
+                    return resp, metrics
+                except Exception as e:
+                    last_exc = e
+                    budgeter.refund(reservation)
+                    reservation = None
+                    retriable = _is_retriable(e)
+                    is_timeout = _is_timeout(e)
+                    overload = _overload_reason(e)
+                    if overload:
+                        limiter.on_overload(overload)
+                    if ticket is not None and _is_provider_failure(e):
+                        breaker.record_failure(ticket, is_timeout)
                 
-                if attempt == max_attempts or not retriable:
-                    log_event("openai_call_failed", purpose=purpose, attempt=attempt, retriable=retriable, error=str(e)[:300])
                     if is_timeout:
-                        raise OpenAITimeoutError(str(e))
-                    else:
-                        raise OpenAIFinalError(str(e))
-                sleep_for = backoff_base * (2 ** (attempt - 1))
-                jitter = 0.05 * sleep_for
-                log_event("openai_retry", attempt=attempt, sleep_ms=int((sleep_for + jitter)*1000), retriable=retriable)
-                await asyncio.sleep(sleep_for + jitter)
+                        log_event("openai_timeout", purpose=purpose, attempt=attempt, timeout=timeout, model=(model or OPENAI_MODEL))
+                
+                    if attempt == max_attempts or not retriable:
+                        log_event("openai_call_failed", purpose=purpose, attempt=attempt, retriable=retriable, error=str(e)[:300])
+                        if is_timeout:
+                            raise OpenAITimeoutError(str(e))
+                        else:
+                            raise OpenAIFinalError(str(e))
+            # back off outside the slot
+            sleep_for = backoff_base * (2 ** (attempt - 1))
+            jitter = 0.05 * sleep_for
+            log_event("openai_retry", attempt=attempt, sleep_ms=int((sleep_for + jitter)*1000), retriable=retriable)
+            stage = "backoff"
+            await asyncio.sleep(sleep_for + jitter)
         raise OpenAIError(str(last_exc))  # safety
+    except asyncio.CancelledError:
+        if reservation is not None:
+            budgeter.refund(reservation)
+        log_event("openai_call_cancelled", purpose=purpose, stage=stage, attempt=attempt, priority=int(priority),
+                  model=(model or OPENAI_MODEL), probe=(ticket.probe if ticket is not None else None))
+        raise
+    finally:
+        if ticket is not None:
+            breaker.done(ticket)
 
 async def chat_with_fallback(
     messages: List[Dict[str, Any]],
     model: Optional[str] = None,
     purpose: str = "completion",
+    on_text: Optional[Callable[[str, str], None]] = None,
+    priority: int = LLMPriority.MENTION,
+    fallback: bool = True,
 ) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
     """Chat function with automatic fallback to secondary model on primary failure.
     
+    on_text: optional streaming callback on_text(accumulated_text, model_used)
+    priority: LLMPriority of the caller (scheduling order when calls queue up)
+    fallback: False runs only ``model`` (no fallback leg, no hedge), e.g. when
+      the caller already degraded to the fallback model
+    OPENAI_HEDGE_ENABLED=1: see _chat_hedged (metrics['hedged'] marks a raced call)
+    OPENAI_SINGLE_FLIGHT=1: identical concurrent calls (same model + messages,
+      both streaming or both not) share one upstream call; metrics['coalesced'] marks a follower and
+      metrics['coalesced_waiters'] counts the followers of the shared call
     Returns: (raw_response, metrics_dict, model_used)
     model_used: "primary", "fallback", or the actual model name used
     """
+    if not OPENAI_SINGLE_FLIGHT:
+        return await _chat_with_fallback(messages, model, purpose, on_text, priority, fallback)
+    primary_model = model or OPENAI_MODEL
+    # a no-fallback call must not join (or be joined by) one that may fall back,
+    # and a streaming caller must not wait silently on a non-streaming leader
+    key = request_key(primary_model, messages) + ("" if fallback else ":nofallback") + (":stream" if on_text else "")
+    (resp, metrics, model_used), coalesced, waiters = await _single_flight.run(
+        key,
+        lambda fan_out: _chat_with_fallback(
+            messages, primary_model, purpose, fan_out if on_text else None, priority, fallback
+        ),
+        on_text,
+    )
+    metrics = dict(metrics, coalesced=coalesced, coalesced_waiters=waiters)
+    if coalesced:
+        log_event("openai_coalesced", model=primary_model, purpose=purpose, key=key[:12], model_used=model_used)
+    return resp, metrics, model_used
+
+async def _chat_with_fallback(
+    messages: List[Dict[str, Any]],
+    model: Optional[str],
+    purpose: str,
+    on_text: Optional[Callable[[str, str], None]],
+    priority: int,
+    fallback: bool = True,
+) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
     primary_model = model or OPENAI_MODEL
-    fallback_model = OPENAI_FALLBACK_MODEL.strip() if OPENAI_FALLBACK_MODEL else None
+    fallback_model = OPENAI_FALLBACK_MODEL.strip() if OPENAI_FALLBACK_MODEL and fallback else None
+
+    if OPENAI_HEDGE_ENABLED and fallback_model and fallback_model != primary_model:
+        return await _chat_hedged(messages, primary_model, fallback_model, purpose, on_text, priority)
     
     # Try primary model first
     try:
@@ -120,6 +348,8 @@ async def chat_with_fallback(
             timeout=OPENAI_PRIMARY_TIMEOUT_SEC,
             max_attempts=OPENAI_MAX_ATTEMPTS,
             purpose=purpose,
+            on_text=(lambda text: on_text(text, "primary")) if on_text else None,
+            priority=priority,
         )
         return resp, metrics, "primary"
         
@@ -138,6 +368,8 @@ async def chat_with_fallback(
                     timeout=OPENAI_FALLBACK_TIMEOUT_SEC,
                     max_attempts=OPENAI_MAX_ATTEMPTS,
                     purpose=purpose,
+                    on_text=(lambda text: on_text(text, "fallback")) if on_text else None,
+                    priority=priority,
                 )
                 log_event("openai_fallback_success", model=fallback_model, purpose=purpose)
                 return resp, metrics, "fallback"
@@ -149,3 +381,143 @@ async def chat_with_fallback(
         else:
             # No fallback configured, re-raise original error
             raise e
+
+def _hedge_delay(primary_model: str) -> float:
+    """Seconds to wait for the primary before firing the fallback in parallel."""
+    if OPENAI_HEDGE_DELAY_SEC > 0:
+        return OPENAI_HEDGE_DELAY_SEC
+    p = latency.percentile(primary_model, OPENAI_HEDGE_PERCENTILE)
+    if p is None:
+        # cold start: no latency history yet
+        return max(OPENAI_HEDGE_MIN_DELAY_SEC, OPENAI_PRIMARY_TIMEOUT_SEC / 2)
+    return max(OPENAI_HEDGE_MIN_DELAY_SEC, p / 1000)
+
+async def _chat_hedged(
+    messages: List[Dict[str, Any]],
+    primary_model: str,
+    fallback_model: str,
+    purpose: str,
+    on_text: Optional[Callable[[str, str], None]],
+    priority: int = LLMPriority.MENTION,
+) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """Race primary and fallback: the fallback starts once the primary has not
+    answered within _hedge_delay(); the first success wins, the loser is cancelled.
+    A primary that fails before the delay falls back immediately (as unhedged).
+    When streaming, the hedge is called off once the primary emits its first token:
+    the delay tracks total latency, and a second leg would double spend on a healthy
+    stream and flash its partial text before the winner overwrites it.
+    """
+    # only one model streams into the reply at a time: first emitter owns it
+    stream_owner: List[Optional[str]] = [None]
+    primary_streaming = asyncio.Event()
+
+    def _stream_for(label: str):
+        if on_text is None:
+            return None
+        def _cb(text: str) -> None:
+            if label == "primary":
+                primary_streaming.set()
+            if stream_owner[0] is None:
+                stream_owner[0] = label
+            if stream_owner[0] == label:
+                on_text(text, label)
+        return _cb
+
+    labels: Dict[asyncio.Task, str] = {}
+    primary_task = asyncio.create_task(chat(
+        messages=messages,
+        model=primary_model,
+        timeout=OPENAI_PRIMARY_TIMEOUT_SEC,
+        max_attempts=OPENAI_MAX_ATTEMPTS,
+        purpose=purpose,
+        on_text=_stream_for("primary"),
+        priority=priority,
+    ))
+    labels[primary_task] = "primary"
+    pending = {primary_task}
+    first_token = asyncio.create_task(primary_streaming.wait())
+    delay = _hedge_delay(primary_model)
+    hedged = False
+    last_error: Optional[Exception] = None
+    try:
+        log_event("openai_primary_start", model=primary_model, purpose=purpose, has_fallback=True, hedge_delay_ms=int(delay * 1000))
+        await asyncio.wait({primary_task, first_token}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        if first_token.done() and not primary_task.done():
+            log_event("openai_hedge_skipped", model=primary_model, purpose=purpose, reason="streaming")
+            await asyncio.wait({primary_task})
+        if primary_task.done():
+            pending = set()
+            try:
+                resp, metrics = primary_task.result()
+                metrics['hedged'] = False
+                return resp, metrics, "primary"
+            except (OpenAITimeoutError, OpenAIFinalError) as e:
+                last_error = e
+                stream_owner[0] = None
+                log_event("openai_primary_failed", model=primary_model, purpose=purpose,
+                         error_type=type(e).__name__, error=str(e)[:200])
+                log_event("openai_fallback_start", primary_model=primary_model,
+                         fallback_model=fallback_model, purpose=purpose)
+        else:
+            hedged = True
+            log_event("openai_hedge_start", primary_model=primary_model, fallback_model=fallback_model,
+                     purpose=purpose, delay_ms=int(delay * 1000))
+        fallback_task = asyncio.create_task(chat(
+            messages=messages,
+            model=fallback_model,
+            timeout=OPENAI_FALLBACK_TIMEOUT_SEC,
+            max_attempts=OPENAI_MAX_ATTEMPTS,
+            purpose=purpose,
+            on_text=_stream_for("fallback"),
+            priority=priority,
+        ))
+        labels[fallback_task] = "fallback"
+        pending = set(pending) | {fallback_task}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                label = labels[task]
+                try:
+                    resp, metrics = task.result()
+                except (OpenAITimeoutError, OpenAIFinalError) as e:
+                    last_error = e
+                    if stream_owner[0] == label:
+                        stream_owner[0] = None
+                    log_event("openai_hedge_leg_failed", leg=label, purpose=purpose,
+                             error_type=type(e).__name__, error=str(e)[:200])
+                    continue
+                metrics['hedged'] = hedged
+                if hedged:
+                    log_event("openai_hedge_won", winner=label, model=(primary_model if label == "primary" else fallback_model),
+                             purpose=purpose, cancelled=len(pending))
+                elif label == "fallback":
+                    log_event("openai_fallback_success", model=fallback_model, purpose=purpose)
+                return resp, metrics, label
+        log_event("openai_fallback_failed", model=fallback_model, purpose=purpose,
+                 error_type=type(last_error).__name__, error=str(last_error)[:200])
+        raise last_error
+    finally:
+        first_token.cancel()
+        for task in pending:
+            task.cancel()
+
+def diag_lines() -> List[str]:
+    """Human readable OpenAI client state for /diag."""
+    lines: List[str] = []
+    for name, snap in limiter_snapshot().items():
+        lines.append(f"Limiter[{name}]: limit={snap['limit']} in_flight={snap['in_flight']} queue={snap['queue_depth']}")
+    for name, snap in breaker_snapshot().items():
+        lines.append(f"Breaker[{name}]: state={snap['state']} samples={snap['samples']} error_rate={snap['error_rate']} timeout_rate={snap['timeout_rate']}")
+    for name, snap in budget_snapshot().items():
+        parts = [f"{k}={v}" for k, v in snap.items()]
+        lines.append(f"Budget[{name}]: {' '.join(parts)}")
+    if completion_cache is not None:
+        parts = [f"{k}={v}" for k, v in completion_cache.snapshot().items()]
+        lines.append(f"CompletionCache: {' '.join(parts)}")
+    if near_dup_cache is not None:
+        parts = [f"{k}={v}" for k, v in near_dup_cache.snapshot().items()]
+        lines.append(f"NearDupCache: {' '.join(parts)}")
+    if OPENAI_SINGLE_FLIGHT:
+        lines.append(f"SingleFlight: in_flight={_single_flight.in_flight} coalesced_total={_single_flight.coalesced_total}")
+    lines.append("TokenMemo: " + " ".join(f"{k}={v}" for k, v in token_memo_stats().items()))
+    return lines
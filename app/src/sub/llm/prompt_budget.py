@@ -0,0 +1,213 @@
+"""Token-budgeted prompt assembly and preflight context-length guard.
+
+Budget = min(model context window - PROMPT_COMPLETION_RESERVE_TOKENS,
+             PROMPT_MAX_TOKENS)
+
+The window comes from token_utils.MODELS (same prefix table as the
+tokenizer choice). PROMPT_MAX_TOKENS (default 16000) is a cost cap below
+it: large-window models get prompts trimmed to it, and a required part
+above it is refused as TOO_LONG. 0 uses the full window.
+
+Sections and how they shrink:
+  - system messages + latest user message: required, never trimmed (if they
+    alone exceed the budget the request is refused as TOO_LONG locally)
+  - search context: capped at _SEARCH_SHARE of the budget, keeps the head
+    (result blocks are ordered by rank)
+  - summary: capped at _SUMMARY_SHARE, keeps the head
+  - conversation history (HistoryStore lines): capped at _HISTORY_SHARE,
+    keeps the newest lines
+  - channel messages: whatever is left, oldest dropped first
+
+If the capped sections still overflow, sections are cut further in
+_TRIM_ORDER (lowest priority first). preflight() re-counts the final
+rendered request so nothing oversize is ever sent.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from sub.constants import (
+    OPENAI_CONTEXT_WINDOW,
+    PROMPT_MAX_TOKENS,
+    PROMPT_COMPLETION_RESERVE_TOKENS,
+)
+from sub.core.base import Message
+from sub.llm.token_utils import count_tokens, count_message_tokens, estimate_tokens_from_messages, model_info
+from sub.infra.logging import log_event
+
+# models missing from token_utils.MODELS
+_DEFAULT_CONTEXT_WINDOW = 8_192
+
+_SEARCH_SHARE = 0.20
+_SUMMARY_SHARE = 0.10
+_HISTORY_SHARE = 0.25
+_TRIM_ORDER = ["history", "channel", "summary", "search"]
+
+# section headers + search guideline augment adds
+_SECTION_OVERHEAD = 128
+
+
+def context_window(model: str) -> int:
+    if OPENAI_CONTEXT_WINDOW > 0:
+        return OPENAI_CONTEXT_WINDOW
+    info = model_info(model)
+    return info[1] if info else _DEFAULT_CONTEXT_WINDOW
+
+
+def prompt_budget(model: str) -> int:
+    budget = context_window(model) - PROMPT_COMPLETION_RESERVE_TOKENS
+    if PROMPT_MAX_TOKENS > 0:
+        budget = min(budget, PROMPT_MAX_TOKENS)
+    return max(0, budget)
+
+
+def estimate_prompt_tokens(rendered_messages: List[Dict[str, Any]], model: str) -> int:
+    return estimate_tokens_from_messages(rendered_messages, model)
+
+
+def _keep_head(text: str, max_tokens: int, model: str) -> str:
+    """First lines of text that fit max_tokens."""
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    kept: List[str] = []
+    used = 0
+    for line in text.split("\n"):
+        cost = count_tokens(line, model) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def _keep_tail(text: str, max_tokens: int, model: str) -> str:
+    """Last (newest) lines of text that fit max_tokens."""
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    kept: List[str] = []
+    used = 0
+    for line in reversed(text.split("\n")):
+        cost = count_tokens(line, model) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return "\n".join(kept)
+
+
+@dataclass
+class BudgetedPrompt:
+    messages: List[Message]
+    conversation_context: str
+    conversation_summary: str
+    search_context: str
+    budget: int
+    fits: bool
+    tokens: Dict[str, int] = field(default_factory=dict)
+    trimmed: List[str] = field(default_factory=list)
+
+
+def assemble_prompt(
+    messages: List[Message],
+    conversation_context: Optional[str],
+    conversation_summary: Optional[str],
+    search_context: Optional[str],
+    model: str,
+) -> BudgetedPrompt:
+    """Fit every section into prompt_budget(model); see module docstring."""
+    budget = prompt_budget(model)
+    usable = budget - _SECTION_OVERHEAD - 2
+
+    latest_user = max((i for i, m in enumerate(messages) if m.role == "user"), default=None)
+    required_idx = {i for i, m in enumerate(messages) if m.role == "system" or i == latest_user}
+    msg_tokens = count_message_tokens([m.render() for m in messages], model)
+    required = sum(msg_tokens[i] for i in required_idx)
+
+    texts = {
+        "search": search_context or "",
+        "summary": conversation_summary or "",
+        "history": conversation_context or "",
+    }
+    caps = {
+        "search": int(usable * _SEARCH_SHARE),
+        "summary": int(usable * _SUMMARY_SHARE),
+        "history": int(usable * _HISTORY_SHARE),
+    }
+    trimmed: List[str] = []
+
+    def _fit_text(name: str, limit: int) -> None:
+        before = texts[name]
+        after = _keep_tail(before, limit, model) if name == "history" else _keep_head(before, limit, model)
+        if after != before:
+            texts[name] = after
+            if name not in trimmed:
+                trimmed.append(name)
+
+    for name, cap in caps.items():
+        _fit_text(name, cap)
+    tokens = {name: count_tokens(t, model) for name, t in texts.items()}
+
+    # channel messages: newest first into whatever is left
+    optional_idx = [i for i in range(len(messages)) if i not in required_idx]
+    room = usable - required - sum(tokens.values())
+    keep_idx = set(required_idx)
+    for i in reversed(optional_idx):
+        if msg_tokens[i] > room:
+            break
+        keep_idx.add(i)
+        room -= msg_tokens[i]
+    if len(keep_idx) < len(messages):
+        trimmed.append("channel")
+    tokens["channel"] = sum(msg_tokens[i] for i in keep_idx - required_idx)
+    tokens["required"] = required
+
+    # still over (e.g. a huge system prompt): cut sections by priority
+    overflow = sum(tokens.values()) - usable
+    for name in _TRIM_ORDER:
+        if overflow <= 0:
+            break
+        if name == "channel":
+            for i in sorted(keep_idx - required_idx):
+                if overflow <= 0:
+                    break
+                keep_idx.discard(i)
+                tokens["channel"] -= msg_tokens[i]
+                overflow -= msg_tokens[i]
+                if "channel" not in trimmed:
+                    trimmed.append("channel")
+            continue
+        if tokens[name] <= 0:
+            continue
+        _fit_text(name, max(0, tokens[name] - overflow))
+        new_tokens = count_tokens(texts[name], model)
+        overflow -= tokens[name] - new_tokens
+        tokens[name] = new_tokens
+
+    fits = required <= usable and overflow <= 0
+    if trimmed or not fits:
+        log_event("prompt_budget_trim", model=model, budget=budget, fits=fits, trimmed=','.join(trimmed) or None,
+                  **{f"{k}_tokens": v for k, v in tokens.items()})
+    return BudgetedPrompt(
+        messages=[m for i, m in enumerate(messages) if i in keep_idx],
+        conversation_context=texts["history"],
+        conversation_summary=texts["summary"],
+        search_context=texts["search"],
+        budget=budget,
+        fits=fits,
+        tokens=tokens,
+        trimmed=trimmed,
+    )
+
+
+def preflight(rendered_messages: List[Dict[str, Any]], model: str) -> Tuple[bool, int, int]:
+    """Final guard on the exact request: (fits, estimated_tokens, budget)."""
+    budget = prompt_budget(model)
+    estimated = estimate_prompt_tokens(rendered_messages, model)
+    return estimated <= budget, estimated, budget
+
+
+__all__ = ["assemble_prompt", "preflight", "prompt_budget", "context_window", "BudgetedPrompt"]
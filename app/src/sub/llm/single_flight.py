@@ -0,0 +1,91 @@
+"""Single-flight coalescing of identical in-flight LLM calls.
+
+Concurrent callers with the same key (hash of model + rendered messages)
+share ONE upstream call:
+  - the first caller (leader) starts the call as a task;
+  - later callers (followers) attach to it and receive the same result or
+    exception;
+  - streaming callbacks are fanned out to every subscriber; a late joiner
+    is immediately replayed the text accumulated so far;
+  - a caller that is cancelled only detaches; the upstream call is cancelled
+    once no subscriber is left.
+
+The key is released as soon as the call finishes, so this never serves
+stale results (it is not a cache).
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+TextCallback = Callable[[str, str], None]
+
+
+def request_key(model: str, messages: List[Dict[str, Any]]) -> str:
+    payload = json.dumps([model, messages], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[Optional[TextCallback]] = []
+        self.joined = 0  # total callers ever attached (leader included)
+        self.last_text: Optional[Tuple[str, str]] = None
+
+    def fan_out(self, text: str, model_used: str) -> None:
+        self.last_text = (text, model_used)
+        for cb in list(self.subscribers):
+            if cb is not None:
+                cb(text, model_used)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced_total = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[TextCallback], Awaitable[Any]],
+        on_text: Optional[TextCallback] = None,
+    ) -> Tuple[Any, bool, int]:
+        """Run factory(fan_out) once per key among concurrent callers.
+
+        Returns (result, coalesced, waiters): coalesced is True for followers,
+        waiters is the number of followers that joined the flight.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(factory(flight.fan_out))
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._release(k, f))
+        else:
+            self.coalesced_total += 1
+            if on_text is not None and flight.last_text is not None:
+                on_text(*flight.last_text)
+        flight.subscribers.append(on_text)
+        flight.joined += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.subscribers.remove(on_text)
+            if not flight.subscribers and not flight.task.done():
+                flight.task.cancel()
+            raise
+        return result, not leader, flight.joined - 1
+
+    def _release(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+__all__ = ["SingleFlight", "request_key"]
@@ -0,0 +1,120 @@
+"""Tiny async dependency-graph runner for the completion pipeline.
+
+Responsibilities:
+  - Each stage is ``fn(results) -> value`` (sync or async) declared with the
+    names of the stages it depends on; a stage starts as soon as all of its
+    dependencies have finished, so independent stages overlap.
+  - Per-stage timing (start offset + duration from graph start) for the
+    ``pipeline_stages`` log line; inline steps can be timed with ``timer()``.
+  - A failing stage fails its dependents; ``cancel()`` stops whatever is
+    still running (early return / error path).
+
+Usage:
+    graph = StageGraph("completion")
+    graph.add("messages", fetch)
+    graph.add("decision", decide)
+    graph.add("search", search, deps=("decision",))
+    graph.start()
+    search = await graph.result("search")
+"""
+from __future__ import annotations
+import asyncio
+import inspect
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from sub.infra.logging import log_event
+
+
+@dataclass
+class StageTiming:
+    start_ms: float
+    end_ms: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def ms(self) -> Optional[float]:
+        return None if self.end_ms is None else self.end_ms - self.start_ms
+
+
+class StageGraph:
+    def __init__(self, name: str):
+        self.name = name
+        self._stages: Dict[str, Tuple[Callable[[Dict[str, Any]], Any], Tuple[str, ...]]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, StageTiming] = {}
+        self._t0: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Any], deps: Tuple[str, ...] = ()) -> None:
+        if self._t0 is not None:
+            raise RuntimeError("stages must be added before start()")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"stage {name!r} depends on unknown stage {dep!r}")
+        self._stages[name] = (fn, tuple(deps))
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    async def _run_stage(self, name: str) -> Any:
+        fn, deps = self._stages[name]
+        if deps:
+            await asyncio.gather(*(self._tasks[d] for d in deps))
+        timing = self.timings[name] = StageTiming(self._now_ms())
+        try:
+            value = fn(self.results)
+            if inspect.isawaitable(value):
+                value = await value
+        except BaseException as e:
+            timing.error = type(e).__name__
+            raise
+        finally:
+            timing.end_ms = self._now_ms()
+        self.results[name] = value
+        return value
+
+    def start(self) -> None:
+        """Schedule every stage (declaration order is a valid topological order)."""
+        self._t0 = time.perf_counter()
+        for name in self._stages:
+            self._tasks[name] = asyncio.ensure_future(self._run_stage(name))
+
+    async def result(self, name: str) -> Any:
+        return await asyncio.shield(self._tasks[name])
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Record an inline (non-graph) step under the same clock."""
+        timing = self.timings[name] = StageTiming(self._now_ms())
+        try:
+            yield
+        except BaseException as e:
+            timing.error = type(e).__name__
+            raise
+        finally:
+            timing.end_ms = self._now_ms()
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark retrieved: failures were surfaced via result()
+
+    def log(self, **fields: Any) -> None:
+        stages = ",".join(
+            f"{name}:{t.start_ms:.0f}+{t.ms:.0f}" + (f"!{t.error}" if t.error else "")
+            for name, t in self.timings.items() if t.end_ms is not None
+        )
+        log_event(
+            "pipeline_stages",
+            pipeline=self.name,
+            total_ms=f"{self._now_ms():.1f}" if self._t0 is not None else None,
+            stages=stages,
+            **fields,
+        )
+
+
+__all__ = ["StageGraph", "StageTiming"]
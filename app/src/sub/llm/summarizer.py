@@ -0,0 +1,177 @@
+"""Rolling per-channel conversation summary, maintained off the request path.
+
+Flow:
+  - HistoryStore calls on_evict(channel_id, entry) when an entry ages out of
+    its buffer (HISTORY_MAX_ITEMS, or no longer fitting the HISTORY_CONTEXT_CHARS
+    reply window); the entry is queued for that channel.
+  - Once SUMMARY_BATCH_ITEMS entries are queued, ONE background task per
+    channel folds them into the channel's rolling summary:
+        new_summary = LLM(previous_summary + evicted lines)
+    using SUMMARY_MODEL at LLMPriority.SUMMARY (never ahead of user replies).
+  - The request path only reads get(channel_id): no waiting, no LLM call.
+    The buffer is bounded by the rendered window, so entries still in
+    HistoryStore are sent verbatim as conversation context and the summary
+    covers exactly what the buffer has dropped. (Only a prompt budget smaller
+    than the window makes prompt_budget trim the oldest of those lines for
+    that one request, logged as prompt_budget_trim.)
+
+A failed update keeps the queued entries for the next attempt; the queue is
+bounded by SUMMARY_MAX_SOURCE_CHARS (oldest lines dropped first).
+The LLM call is injectable (``llm``) so the summarizer can run against a stub.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from sub.constants import (
+    OPENAI_PROMPT_TOKEN_COST,
+    OPENAI_COMPLETION_TOKEN_COST,
+    SUMMARY_MODEL,
+    SUMMARY_BATCH_ITEMS,
+    SUMMARY_MAX_CHARS,
+    SUMMARY_MAX_SOURCE_CHARS,
+)
+from sub.history_store import HistoryEntry
+from sub.format_conversation import format_entry
+from sub.infra.logging import logger, log_event
+from sub.llm.concurrency import LLMPriority
+from sub.llm.openai_wrapper import chat as openai_chat
+from sub.llm.usage_ledger import ledger as usage_ledger
+
+SUMMARY_INSTRUCTION = (
+    "あなたは会話ログの要約係です。「これまでの要約」に「追加の会話」を統合し、"
+    "重要な事実・ユーザーの意図・未回答の要求・決定事項を日本語で簡潔に箇条書き風にまとめ直してください。"
+    "不要な挨拶や雑談は除外し、{max_chars}文字以内で出力してください。"
+)
+
+# llm(messages) -> summary text
+SummaryLLM = Callable[[List[Dict[str, str]]], Awaitable[str]]
+
+
+async def _openai_summary(messages: List[Dict[str, str]]) -> str:
+    resp, metrics = await openai_chat(
+        messages,
+        model=SUMMARY_MODEL,
+        timeout=15,
+        purpose="summary",
+        priority=LLMPriority.SUMMARY,
+    )
+    if usage_ledger is not None:
+        # background work: not attributed to a guild / user (never quota-checked)
+        usage = getattr(resp, "usage", {}) or {}
+        prompt_tokens = int(usage.get("prompt_tokens", 0) or 0)
+        completion_tokens = int(usage.get("completion_tokens", 0) or 0)
+        usage_ledger.record(
+            "", "", "",
+            model=SUMMARY_MODEL,
+            purpose="summary",
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=(prompt_tokens * OPENAI_PROMPT_TOKEN_COST + completion_tokens * OPENAI_COMPLETION_TOKEN_COST) / 1000.0,
+            latency_ms=metrics.get("queue_wait_ms", 0.0) + metrics.get("invoke_ms", 0.0),
+        )
+    return resp.choices[0]["message"]["content"].strip()
+
+
+class RollingSummarizer:
+    def __init__(
+        self,
+        llm: Optional[SummaryLLM] = None,
+        batch_items: int = SUMMARY_BATCH_ITEMS,
+        max_chars: int = SUMMARY_MAX_CHARS,
+        max_source_chars: int = SUMMARY_MAX_SOURCE_CHARS,
+    ):
+        self.llm = llm or _openai_summary
+        self.batch_items = max(1, batch_items)
+        self.max_chars = max_chars
+        self.max_source_chars = max_source_chars
+        self._summaries: Dict[str, str] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.updates = 0
+        self.failures = 0
+
+    def get(self, channel_id: str) -> str:
+        """Latest summary for channel ("" if none yet). Never blocks."""
+        return self._summaries.get(channel_id, "")
+
+    def on_evict(self, channel_id: str, entry: HistoryEntry) -> None:
+        """HistoryStore eviction hook (sync; schedules the update)."""
+        pending = self._pending.setdefault(channel_id, [])
+        pending.append(format_entry(entry))
+        # bound the backlog if the LLM is failing / slow
+        while len(pending) > 1 and sum(len(p) for p in pending) > self.max_source_chars:
+            pending.pop(0)
+        self._schedule(channel_id)
+
+    def forget(self, channel_id: str) -> None:
+        """Drop summary and backlog (channel history was cleared or dropped by HistoryStore)."""
+        self._summaries.pop(channel_id, None)
+        self._pending.pop(channel_id, None)
+        task = self._tasks.pop(channel_id, None)
+        if task is not None:
+            task.cancel()
+
+    def _schedule(self, channel_id: str) -> None:
+        if len(self._pending.get(channel_id, ())) < self.batch_items:
+            return
+        task = self._tasks.get(channel_id)
+        if task is not None and not task.done():
+            return  # the running task picks up the new entries
+        try:
+            self._tasks[channel_id] = asyncio.get_running_loop().create_task(self._run(channel_id))
+        except RuntimeError:
+            pass  # no loop (e.g. offline use); entries stay queued
+
+    async def _run(self, channel_id: str) -> None:
+        while len(self._pending.get(channel_id, ())) >= self.batch_items:
+            batch = self._pending[channel_id]
+            self._pending[channel_id] = []
+            if not await self._update(channel_id, batch):
+                # keep the lines for the next eviction-triggered attempt
+                self._pending[channel_id] = batch + self._pending[channel_id]
+                return
+
+    async def _update(self, channel_id: str, lines: List[str]) -> bool:
+        previous = self._summaries.get(channel_id, "")
+        messages = [
+            {"role": "system", "content": SUMMARY_INSTRUCTION.format(max_chars=self.max_chars)},
+            {"role": "user", "content": f"これまでの要約:\n{previous or '(なし)'}\n\n追加の会話:\n" + "\n".join(lines)},
+        ]
+        start = time.perf_counter()
+        try:
+            summary = (await self.llm(messages)).strip()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"summary_failed channel={channel_id} err={e}")
+            return False
+        if len(summary) > self.max_chars:
+            summary = summary[: self.max_chars - 3] + "..."
+        if summary:
+            self._summaries[channel_id] = summary
+        self.updates += 1
+        log_event(
+            "summary_update",
+            channel_id=channel_id,
+            entries=len(lines),
+            chars=len(summary),
+            ms=f"{(time.perf_counter() - start) * 1000:.1f}",
+        )
+        return True
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._summaries),
+            "pending": sum(len(p) for p in self._pending.values()),
+            "running": sum(1 for t in self._tasks.values() if not t.done()),
+            "updates": self.updates,
+            "failures": self.failures,
+        }
+
+
+# singleton
+summarizer = RollingSummarizer()
+
+__all__ = ["summarizer", "RollingSummarizer"]
@@ -1,8 +1,25 @@
 """Token estimation utilities.
-Prefer tiktoken if available; otherwise fallback to simple heuristic.
+Prefer tiktoken if available; otherwise estimate_tokens (script-class estimator).
+
+  - encoders are resolved once per model (tiktoken.encoding_for_model is
+    not free and was called on every estimate)
+  - counts are memoized in a bounded LRU keyed by (encoding, content hash):
+    the same channel messages are re-sent on every turn
+  - count_tokens_batch / count_message_tokens encode all memo misses in one
+    tiktoken encode_batch call
+  - image parts are priced like the API does (tiles of 512px) instead of a
+    flat placeholder
+  - without tiktoken (or without its BPE files, e.g. offline) estimate_tokens
+    counts characters per script class (ASCII words, digits, kana, kanji,
+    emoji, ...) in one pass, with weights fitted against tiktoken on
+    app/bench/data/token_corpus.jsonl (app/bench/bench_token_estimator.py);
+    a flat 4 chars / token undercounts Japanese 2-3x
 """
 from __future__ import annotations
-from typing import List, Dict, Any, Union
+import math
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
 from sub.infra.logging import logger
 
 try:
@@ -14,40 +31,279 @@ except Exception:
 # Default model encoding mapping fallback
 _DEFAULT_MODEL = "gpt-3.5-turbo"
 
-def estimate_tokens_from_messages(messages: List[Dict[str, Any]], model: str = _DEFAULT_MODEL) -> int:
-    if _HAS_TIKTOKEN:
-        try:
-            enc = tiktoken.encoding_for_model(model)
-        except Exception:
-            enc = tiktoken.get_encoding("cl100k_base")
-        total = 0
-        for m in messages:
-            content = m.get("content", "")
-            if isinstance(content, list):
-                # vision形式を単純連結
-                parts = []
-                for c in content:
-                    if isinstance(c, dict):
-                        if c.get("type") == "text":
-                            parts.append(c.get("text", ""))
-                        elif c.get("type") == "image_url":
-                            parts.append("[image]")
-                content = "\n".join(parts)
-            total += len(enc.encode(str(content))) + 4  # role/name overheadざっくり
-        return total + 2  # assistant priming
-    # Heuristic fallback: 1 token ~= 4 chars
-    char_sum = 0
-    for m in messages:
-        content = m.get("content", "")
-        if isinstance(content, list):
-            for c in content:
-                if isinstance(c, dict) and c.get("type") == "text":
-                    char_sum += len(c.get("text", ""))
-                elif isinstance(c, dict) and c.get("type") == "image_url":
-                    char_sum += 20  # placeholder cost
+PER_MESSAGE_OVERHEAD = 4  # role/name overheadざっくり
+REPLY_PRIMING = 2  # assistant priming
+
+# LRU memo of token counts; short strings are cheaper to count than to look up
+_MEMO_MAX_ITEMS = 4096
+_MEMO_MIN_CHARS = 64
+_memo: "OrderedDict[Tuple[str, int, int], int]" = OrderedDict()
+_memo_hits = 0
+_memo_misses = 0
+
+# Vision pricing (per image): base + per 512px tile after scaling; detail=low is base only.
+# Models with a different multiplier are matched by prefix (longest wins).
+_IMAGE_TOKENS_DEFAULT = (85, 170)
+_IMAGE_TOKENS_BY_MODEL = {
+    "gpt-4o-mini": (2833, 5667),
+}
+# Discord attachments are sent as bare URLs: assume a typical 1024x1024 image
+_DEFAULT_IMAGE_SIZE = (1024, 1024)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """tiktoken encoding for model (resolved once), or None -> estimate_tokens."""
+    if not _HAS_TIKTOKEN:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass  # unknown model name
+    except Exception as e:
+        # BPE file download failed (offline container): estimate instead of failing every count
+        logger.warning(f"tiktoken unavailable for model={model}, using estimator error={e}")
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name(model))
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable for model={model}, using estimator error={e}")
+        return None
+
+
+# ---- script-class estimator (no tiktoken) ----
+(_C_LETTER, _C_DIGIT, _C_PUNCT, _C_SPACE, _C_NEWLINE, _C_HIRAGANA, _C_KATAKANA,
+ _C_KANJI, _C_CJK_PUNCT, _C_EMOJI, _C_OTHER) = range(11)
+_NUM_CLASSES = 11
+
+# encoding -> (tokens per char, tokens per run) indexed by class; a run is a
+# maximal span of one class (ASCII words, digit groups and kana phrases merge)
+_ESTIMATOR_WEIGHTS = {
+    "cl100k_base": (
+        (0.035, 0.311, 0.53, 0.29, 0.206, 0.957, 0.836, 1.286, 1.011, 2.53, 0.769),
+        (0.674, 1.022, 0.0, 0.0, 0.0, 0.313, 0.0, 0.0, 0.0, 0.0, 0.0),
+    ),
+    "o200k_base": (
+        (0.034, 0.329, 0.493, 0.33, 0.577, 0.793, 0.478, 0.828, 0.611, 1.823, 0.529),
+        (0.638, 0.974, 0.0, 0.0, 0.0, 0.146, 0.0, 0.0, 0.0, 0.0, 0.0),
+    ),
+}
+
+# Known models by name prefix (longest match wins): (tiktoken encoding, prompt tokens
+# the model accepts). Shared by encoding_name and prompt_budget.context_window.
+MODELS: Dict[str, Tuple[str, int]] = {
+    "gpt-5": ("o200k_base", 272_000),  # 400k window, of which 128k are output only
+    "gpt-5-chat": ("o200k_base", 128_000),
+    "gpt-4.5": ("o200k_base", 128_000),
+    "gpt-4.1": ("o200k_base", 1_047_576),
+    "gpt-4o": ("o200k_base", 128_000),
+    "chatgpt-4o": ("o200k_base", 128_000),
+    "o1": ("o200k_base", 200_000),
+    "o1-mini": ("o200k_base", 128_000),
+    "o1-preview": ("o200k_base", 128_000),
+    "o3": ("o200k_base", 200_000),
+    "o4": ("o200k_base", 200_000),
+    "gpt-4-turbo": ("cl100k_base", 128_000),
+    "gpt-4-1106": ("cl100k_base", 128_000),
+    "gpt-4-0125": ("cl100k_base", 128_000),
+    "gpt-4-32k": ("cl100k_base", 32_768),
+    "gpt-4": ("cl100k_base", 8_192),
+    "gpt-3.5-turbo": ("cl100k_base", 16_385),
+}
+
+
+def model_info(model: str) -> Optional[Tuple[str, int]]:
+    """(encoding, context window) of the longest MODELS prefix of model, or None."""
+    best = ""
+    for prefix in MODELS:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return MODELS[best] if best else None
+
+
+def encoding_name(model: str) -> str:
+    info = model_info(model)
+    return info[0] if info else "cl100k_base"
+
+
+def _build_class_table() -> bytes:
+    table = bytearray([_C_OTHER]) * 0x10000
+    ranges = (
+        (0x41, 0x5A, _C_LETTER), (0x61, 0x7A, _C_LETTER), (0x30, 0x39, _C_DIGIT),
+        (0x3041, 0x309F, _C_HIRAGANA), (0x30A0, 0x30FF, _C_KATAKANA), (0x31F0, 0x31FF, _C_KATAKANA),
+        (0x3400, 0x4DBF, _C_KANJI), (0x4E00, 0x9FFF, _C_KANJI), (0xF900, 0xFAFF, _C_KANJI),
+        (0x3000, 0x303F, _C_CJK_PUNCT), (0xFF00, 0xFFEF, _C_CJK_PUNCT),
+        (0x2190, 0x21FF, _C_EMOJI), (0x2600, 0x27BF, _C_EMOJI), (0x2B00, 0x2BFF, _C_EMOJI),
+        (0x200D, 0x200D, _C_EMOJI), (0xFE0F, 0xFE0F, _C_EMOJI),
+    )
+    for o in range(0x80):
+        table[o] = _C_PUNCT
+    for lo, hi, c in ranges:
+        for o in range(lo, hi + 1):
+            table[o] = c
+    for o in (0x20, 0x09, 0x0D):
+        table[o] = _C_SPACE
+    table[0x0A] = _C_NEWLINE
+    return bytes(table)
+
+
+_CLASS_TABLE = _build_class_table()
+
+
+def estimate_tokens(text: str, model: str = _DEFAULT_MODEL) -> int:
+    """Single-pass token estimate for text without tiktoken."""
+    per_char, per_run = _ESTIMATOR_WEIGHTS[encoding_name(model)]
+    counts = [0] * _NUM_CLASSES
+    runs = [0] * _NUM_CLASSES
+    table = _CLASS_TABLE
+    prev = -1
+    for ch in text:
+        o = ord(ch)
+        c = table[o] if o < 0x10000 else _C_EMOJI  # astral plane: emoji / rare CJK
+        counts[c] += 1
+        if c != prev:
+            runs[c] += 1
+            prev = c
+    total = 0.0
+    for c in range(_NUM_CLASSES):
+        total += per_char[c] * counts[c] + per_run[c] * runs[c]
+    return math.ceil(total)
+
+
+def _count(enc, text: str, model: str) -> int:
+    return len(enc.encode(text)) if enc is not None else estimate_tokens(text, model)
+
+
+def _memo_key(enc, text: str, model: str) -> Tuple[str, int, int]:
+    return (enc.name if enc is not None else "estimate:" + encoding_name(model), len(text), hash(text))
+
+
+def _memo_get(key: Tuple[str, int, int]) -> Optional[int]:
+    global _memo_hits
+    n = _memo.get(key)
+    if n is not None:
+        _memo.move_to_end(key)
+        _memo_hits += 1
+    return n
+
+
+def _memo_put(key: Tuple[str, int, int], n: int) -> None:
+    global _memo_misses
+    _memo_misses += 1
+    _memo[key] = n
+    if len(_memo) > _MEMO_MAX_ITEMS:
+        _memo.popitem(last=False)
+
+
+def count_tokens(text: str, model: str = _DEFAULT_MODEL) -> int:
+    """Token count of a plain text fragment (no per-message overhead)."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if len(text) < _MEMO_MIN_CHARS:
+        return _count(enc, text, model)
+    key = _memo_key(enc, text, model)
+    n = _memo_get(key)
+    if n is None:
+        n = _count(enc, text, model)
+        _memo_put(key, n)
+    return n
+
+
+def count_tokens_batch(texts: Sequence[str], model: str = _DEFAULT_MODEL) -> List[int]:
+    """count_tokens for many texts; memo misses are encoded in one batch."""
+    enc = _encoding(model)
+    counts: List[int] = [0] * len(texts)
+    missing: List[int] = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        n = _memo_get(_memo_key(enc, text, model)) if len(text) >= _MEMO_MIN_CHARS else None
+        if n is None:
+            missing.append(i)
         else:
-            char_sum += len(str(content))
-    approx = int(char_sum / 4)
-    return approx
+            counts[i] = n
+    if missing:
+        if enc is not None and len(missing) > 1:
+            encoded = enc.encode_batch([texts[i] for i in missing])
+            fresh = [len(tokens) for tokens in encoded]
+        else:
+            fresh = [_count(enc, texts[i], model) for i in missing]
+        for i, n in zip(missing, fresh):
+            counts[i] = n
+            if len(texts[i]) >= _MEMO_MIN_CHARS:
+                _memo_put(_memo_key(enc, texts[i], model), n)
+    return counts
+
+
+def image_tokens(
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    detail: str = "auto",
+    model: str = _DEFAULT_MODEL,
+) -> int:
+    """Prompt tokens of one image input (OpenAI tile formula).
+
+    high / auto: fit within 2048x2048, scale the shortest side down to 768,
+    then base + per_tile * number of 512px tiles. low: base only.
+    """
+    best = ""
+    for prefix in _IMAGE_TOKENS_BY_MODEL:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    base, per_tile = _IMAGE_TOKENS_BY_MODEL[best] if best else _IMAGE_TOKENS_DEFAULT
+    if detail == "low":
+        return base
+    w, h = (width, height) if width and height else _DEFAULT_IMAGE_SIZE
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return base + per_tile * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def _split_content(content: Any, model: str) -> Tuple[str, int]:
+    """(text to encode, image tokens) of a message content (str or vision list)."""
+    if not isinstance(content, list):
+        return str(content or ""), 0
+    parts: List[str] = []
+    images = 0
+    for c in content:
+        if not isinstance(c, dict):
+            continue
+        if c.get("type") == "text":
+            parts.append(c.get("text", ""))
+        elif c.get("type") == "image_url":
+            image = c.get("image_url") or {}
+            detail = image.get("detail", "auto") if isinstance(image, dict) else "auto"
+            images += image_tokens(detail=detail, model=model)
+    return "\n".join(parts), images
+
+
+def count_message_tokens(messages: Sequence[Dict[str, Any]], model: str = _DEFAULT_MODEL) -> List[int]:
+    """Per-message prompt tokens (content + images + role overhead), batched."""
+    split = [_split_content(m.get("content", ""), model) for m in messages]
+    texts = count_tokens_batch([text for text, _ in split], model)
+    return [n + images + PER_MESSAGE_OVERHEAD for n, (_, images) in zip(texts, split)]
+
+
+def estimate_tokens_from_messages(messages: List[Dict[str, Any]], model: str = _DEFAULT_MODEL) -> int:
+    return sum(count_message_tokens(messages, model)) + REPLY_PRIMING
+
+
+def memo_stats() -> Dict[str, int]:
+    return {"items": len(_memo), "hits": _memo_hits, "misses": _memo_misses}
+
 
-__all__ = ["estimate_tokens_from_messages"]
+__all__ = [
+    "estimate_tokens_from_messages",
+    "count_tokens",
+    "count_tokens_batch",
+    "estimate_tokens",
+    "encoding_name",
+    "model_info",
+    "MODELS",
+    "count_message_tokens",
+    "image_tokens",
+    "memo_stats",
+]
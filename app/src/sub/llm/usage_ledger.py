@@ -0,0 +1,315 @@
+"""Durable token / cost ledger with optional daily quotas (SQLite, write-behind).
+
+Responsibilities:
+  - record(): aggregate tokens, cost, call count and latency per
+    (day, guild, channel, user, model, purpose). Rows are merged in memory
+    and upserted in one batch every USAGE_FLUSH_SEC (or sooner once
+    _MAX_PENDING keys are waiting), so the request path never touches disk.
+    Batches are written with asyncio.to_thread; the event loop only swaps
+    the pending dict.
+  - check_quota(): O(1) dict lookups against today's per-guild / per-user
+    totals kept in memory (seeded from the database by ``await open()`` at
+    startup, so a restart does not reset the day). Runs before the LLM call;
+    concurrent requests already in flight may overshoot a limit by their own
+    usage.
+  - summary(): aggregated rows for the /usage command (queried on a worker
+    thread).
+
+A limit of 0 disables that quota. Days are local-time calendar days.
+"""
+from __future__ import annotations
+import asyncio
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from sub.constants import (
+    USAGE_LEDGER_ENABLED,
+    USAGE_LEDGER_PATH,
+    USAGE_FLUSH_SEC,
+    USAGE_DAILY_TOKEN_LIMIT_GUILD,
+    USAGE_DAILY_TOKEN_LIMIT_USER,
+    USAGE_DAILY_COST_LIMIT_GUILD,
+    USAGE_DAILY_COST_LIMIT_USER,
+)
+from sub.infra.logging import logger, log_event
+
+_MAX_PENDING = 256
+_GROUP_COLUMNS = ("guild_id", "channel_id", "user_id", "model", "purpose")
+
+# (day, guild_id, channel_id, user_id, model, purpose)
+_Key = Tuple[str, str, str, str, str, str]
+
+
+def _today() -> str:
+    return time.strftime("%Y-%m-%d", time.localtime())
+
+
+class UsageLedger:
+    def __init__(
+        self,
+        path: str = USAGE_LEDGER_PATH,
+        flush_sec: float = USAGE_FLUSH_SEC,
+        guild_token_limit: int = USAGE_DAILY_TOKEN_LIMIT_GUILD,
+        user_token_limit: int = USAGE_DAILY_TOKEN_LIMIT_USER,
+        guild_cost_limit: float = USAGE_DAILY_COST_LIMIT_GUILD,
+        user_cost_limit: float = USAGE_DAILY_COST_LIMIT_USER,
+    ):
+        self.path = path
+        self.flush_sec = flush_sec
+        self.guild_token_limit = guild_token_limit
+        self.user_token_limit = user_token_limit
+        self.guild_cost_limit = guild_cost_limit
+        self.user_cost_limit = user_cost_limit
+        # key -> [calls, prompt_tokens, completion_tokens, cost, latency_ms]
+        self._pending: Dict[_Key, List[float]] = {}
+        # today's running totals for quota checks: id -> [tokens, cost]
+        self._day = ""
+        self._guild_totals: Dict[str, List[float]] = {}
+        self._user_totals: Dict[str, List[float]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # the database is used from worker threads
+        self._flusher: Optional[asyncio.Task] = None
+        self._full = asyncio.Event()  # _MAX_PENDING keys waiting: flush before flush_sec
+        self.flushes = 0
+        self.rejections = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage_daily ("
+                " day TEXT, guild_id TEXT, channel_id TEXT, user_id TEXT, model TEXT, purpose TEXT,"
+                " calls INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, cost REAL, latency_ms REAL,"
+                " PRIMARY KEY (day, guild_id, channel_id, user_id, model, purpose))"
+            )
+            conn.commit()
+            self._conn = conn
+            atexit.register(self.flush)
+            log_event("usage_ledger_open", path=self.path, flush_s=self.flush_sec)
+        return self._conn
+
+    async def open(self) -> None:
+        """Open the database and seed today's quota totals on a worker thread (once, at startup)."""
+        today = _today()
+        totals = await asyncio.to_thread(self._load_totals, today)
+        if not self._day:  # not already started inline by an early record / check
+            self._start_day(today, totals)
+
+    def _load_totals(self, day: str) -> Tuple[Dict[str, List[float]], Dict[str, List[float]]]:
+        guild_totals: Dict[str, List[float]] = {}
+        user_totals: Dict[str, List[float]] = {}
+        try:
+            with self._lock:
+                db = self._db()
+                for column, totals in (("guild_id", guild_totals), ("user_id", user_totals)):
+                    rows = db.execute(
+                        f"SELECT {column}, SUM(prompt_tokens + completion_tokens), SUM(cost)"
+                        f" FROM usage_daily WHERE day = ? GROUP BY {column}",
+                        (day,),
+                    ).fetchall()
+                    for scope_id, tokens, cost in rows:
+                        totals[scope_id] = [tokens or 0, cost or 0.0]
+        except Exception as e:
+            logger.warning(f"usage_ledger load failed error={e}")
+        return guild_totals, user_totals
+
+    def _start_day(self, day: str, totals: Tuple[Dict[str, List[float]], Dict[str, List[float]]]) -> None:
+        self._day = day
+        self._guild_totals, self._user_totals = totals
+        # unflushed usage of the new day (rare: records right at midnight)
+        for key, values in self._pending.items():
+            if key[0] == day:
+                self._add_totals(key[1], key[3], values[1] + values[2], values[3])
+
+    def _roll_day(self) -> None:
+        today = _today()
+        if today == self._day:
+            return
+        # a running process has seen all of the new day; only the first day is read
+        # back (inline only when open() was not awaited, e.g. offline use)
+        self._start_day(today, ({}, {}) if self._day else self._load_totals(today))
+
+    def _add_totals(self, guild_id: str, user_id: str, tokens: float, cost: float) -> None:
+        for totals, scope_id in ((self._guild_totals, guild_id), (self._user_totals, user_id)):
+            if scope_id:
+                t = totals.setdefault(scope_id, [0, 0.0])
+                t[0] += tokens
+                t[1] += cost
+
+    def check_quota(self, guild_id: str, user_id: str) -> Optional[str]:
+        """Return the exceeded quota ("guild_tokens", ...) or None."""
+        if not (self.guild_token_limit or self.user_token_limit or self.guild_cost_limit or self.user_cost_limit):
+            return None
+        self._roll_day()
+        guild = self._guild_totals.get(guild_id)
+        user = self._user_totals.get(user_id)
+        exceeded = None
+        if guild and self.guild_token_limit and guild[0] >= self.guild_token_limit:
+            exceeded = "guild_tokens"
+        elif guild and self.guild_cost_limit and guild[1] >= self.guild_cost_limit:
+            exceeded = "guild_cost"
+        elif user and self.user_token_limit and user[0] >= self.user_token_limit:
+            exceeded = "user_tokens"
+        elif user and self.user_cost_limit and user[1] >= self.user_cost_limit:
+            exceeded = "user_cost"
+        if exceeded:
+            self.rejections += 1
+            log_event("usage_quota_exceeded", quota=exceeded, guild_id=guild_id, user_id=user_id)
+        return exceeded
+
+    def record(
+        self,
+        guild_id: str,
+        channel_id: str,
+        user_id: str,
+        model: str,
+        purpose: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        latency_ms: float,
+    ) -> None:
+        self._roll_day()
+        key = (self._day, guild_id, channel_id, user_id, model, purpose)
+        row = self._pending.get(key)
+        if row is None:
+            row = self._pending[key] = [0, 0, 0, 0.0, 0.0]
+        row[0] += 1
+        row[1] += prompt_tokens
+        row[2] += completion_tokens
+        row[3] += cost
+        row[4] += latency_ms
+        self._add_totals(guild_id, user_id, prompt_tokens + completion_tokens, cost)
+        if len(self._pending) >= _MAX_PENDING:
+            self._full.set()
+        self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        except RuntimeError:
+            # no loop (offline use): flushed on _MAX_PENDING / exit
+            if len(self._pending) >= _MAX_PENDING:
+                self.flush()
+
+    async def _flush_loop(self) -> None:
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush_async()
+
+    def flush(self) -> int:
+        """Upsert the pending aggregates in one transaction; returns rows written.
+
+        Blocks on disk: for exit / offline use; the bot uses flush_async.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        return self._settle(pending, self._write(pending))
+
+    async def flush_async(self) -> int:
+        """flush() with the database write on a worker thread."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        return self._settle(pending, await asyncio.to_thread(self._write, pending))
+
+    def _write(self, pending: Dict[_Key, List[float]]) -> bool:
+        try:
+            with self._lock:
+                db = self._db()
+                db.executemany(
+                    "INSERT INTO usage_daily (day, guild_id, channel_id, user_id, model, purpose,"
+                    " calls, prompt_tokens, completion_tokens, cost, latency_ms)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (day, guild_id, channel_id, user_id, model, purpose) DO UPDATE SET"
+                    " calls = calls + excluded.calls,"
+                    " prompt_tokens = prompt_tokens + excluded.prompt_tokens,"
+                    " completion_tokens = completion_tokens + excluded.completion_tokens,"
+                    " cost = cost + excluded.cost,"
+                    " latency_ms = latency_ms + excluded.latency_ms",
+                    [key + tuple(values) for key, values in pending.items()],
+                )
+                db.commit()
+        except Exception as e:
+            logger.warning(f"usage_ledger flush failed rows={len(pending)} error={e}")
+            return False
+        return True
+
+    def _settle(self, pending: Dict[_Key, List[float]], written: bool) -> int:
+        if not written:
+            # keep the data for the next attempt
+            for key, values in pending.items():
+                row = self._pending.setdefault(key, [0, 0, 0, 0.0, 0.0])
+                for i, v in enumerate(values):
+                    row[i] += v
+            return 0
+        self.flushes += 1
+        return len(pending)
+
+    async def summary(
+        self,
+        days: int = 1,
+        group_by: str = "user_id",
+        limit: int = 10,
+        **filters: str,
+    ) -> Tuple[Tuple[Any, ...], List[Tuple[Any, ...]]]:
+        """(totals, top rows) since ``days`` calendar days ago.
+
+        Each row: (group value, calls, prompt_tokens, completion_tokens, cost, avg latency ms).
+        filters: column=value for guild_id / channel_id / user_id / model / purpose.
+        """
+        if group_by not in _GROUP_COLUMNS or any(k not in _GROUP_COLUMNS for k in filters):
+            raise ValueError("unknown usage column")
+        await self.flush_async()
+        since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (max(1, days) - 1) * 86400))
+        where = "day >= ?" + "".join(f" AND {k} = ?" for k in filters)
+        params = (since,) + tuple(filters.values())
+        aggregates = (
+            "SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost),"
+            " SUM(latency_ms) / MAX(SUM(calls), 1)"
+        )
+        totals_sql = f"SELECT {aggregates} FROM usage_daily WHERE {where}"
+        rows_sql = (
+            f"SELECT {group_by}, {aggregates} FROM usage_daily WHERE {where}"
+            f" GROUP BY {group_by} ORDER BY SUM(cost) DESC, SUM(prompt_tokens + completion_tokens) DESC LIMIT ?"
+        )
+        return await asyncio.to_thread(self._query, totals_sql, rows_sql, params, limit)
+
+    def _query(
+        self, totals_sql: str, rows_sql: str, params: Tuple[Any, ...], limit: int
+    ) -> Tuple[Tuple[Any, ...], List[Tuple[Any, ...]]]:
+        with self._lock:
+            db = self._db()
+            totals = db.execute(totals_sql, params).fetchone()
+            rows = db.execute(rows_sql, params + (limit,)).fetchall()
+        return totals, rows
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rejections": self.rejections,
+            "guilds_today": len(self._guild_totals),
+            "users_today": len(self._user_totals),
+        }
+
+
+# singleton (None when USAGE_LEDGER_ENABLED=0)
+ledger: Optional[UsageLedger] = UsageLedger() if USAGE_LEDGER_ENABLED else None
+
+__all__ = ["ledger", "UsageLedger"]
@@ -0,0 +1,136 @@
+"""Global work admission with load shedding and a degradation ladder.
+
+Responsibilities:
+  - Bound the channel runs (search + LLM + typing indicator) in flight
+    across all channels (WORK_MAX_CONCURRENT) and the runs waiting for a
+    slot (WORK_QUEUE_MAX). Waiters are served by priority (mentions before
+    passive chatter, with aging) like the OpenAI limiter.
+  - A run arriving at a full queue is shed per WORK_OVERLOAD_POLICY:
+    "busy" replies with a short notice, "drop" ignores it silently.
+  - Track queue wait (admission wait + OpenAI queue wait) as a time-decayed
+    EWMA and map it onto DegradeLevel via DEGRADE_WAIT_MS thresholds:
+        NORMAL -> NO_SEARCH -> FALLBACK_MODEL -> BUSY
+    Each step keeps the previous ones (FALLBACK_MODEL also skips search).
+    The EWMA halves every DEGRADE_HALF_LIFE_SEC without samples, so the
+    level recovers by itself once the queue drains.
+
+Per-channel bounds live in sub.channel_actor (CHANNEL_INBOX_MAX / _POLICY).
+"""
+from __future__ import annotations
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List
+from sub.constants import (
+    WORK_MAX_CONCURRENT,
+    WORK_QUEUE_MAX,
+    WORK_OVERLOAD_POLICY,
+    DEGRADE_WAIT_MS,
+    DEGRADE_HALF_LIFE_SEC,
+)
+from sub.llm.concurrency import AdaptiveLimiter, LLMPriority
+from sub.infra.logging import log_event
+
+_EWMA_ALPHA = 0.3
+
+BUSY_MESSAGE = "ただいま混み合っています。少し時間をおいてから、もう一度話しかけてください。"
+
+
+class DegradeLevel(IntEnum):
+    NORMAL = 0
+    NO_SEARCH = 1  # skip web search
+    FALLBACK_MODEL = 2  # answer with OPENAI_FALLBACK_MODEL
+    BUSY = 3  # reply with BUSY_MESSAGE instead of calling the LLM
+
+
+class WorkShed(Exception):
+    """Raised by WorkGate.admit when the global queue is full."""
+
+    def __init__(self, policy: str):
+        super().__init__(f"work queue full (policy={policy})")
+        self.policy = policy
+
+
+def _parse_thresholds(spec: str) -> List[float]:
+    values = [float(v) for v in spec.split(",") if v.strip()]
+    return (values + [float("inf")] * 3)[:3]
+
+
+class WorkGate:
+    def __init__(
+        self,
+        max_concurrent: int = WORK_MAX_CONCURRENT,
+        max_queue: int = WORK_QUEUE_MAX,
+        policy: str = WORK_OVERLOAD_POLICY,
+        thresholds_ms: str = DEGRADE_WAIT_MS,
+        half_life_sec: float = DEGRADE_HALF_LIFE_SEC,
+    ):
+        n = max(1, max_concurrent)
+        self._slots = AdaptiveLimiter("work", initial=n, min_limit=n, max_limit=n)
+        self.max_queue = max(0, max_queue)
+        self.policy = policy if policy in ("busy", "drop") else "busy"
+        self.thresholds_ms = _parse_thresholds(thresholds_ms)
+        self.half_life_sec = max(0.1, half_life_sec)
+        self._wait_ms = 0.0
+        self._wait_t = time.monotonic()
+        self._level = DegradeLevel.NORMAL
+        self.admitted = 0
+        self.shed = 0
+        self.degraded = 0
+
+    def _decayed_wait(self, now: float) -> float:
+        return self._wait_ms * 0.5 ** ((now - self._wait_t) / self.half_life_sec)
+
+    def observe(self, wait_ms: float) -> None:
+        """Feed one queue wait sample (ms)."""
+        now = time.monotonic()
+        current = self._decayed_wait(now)
+        self._wait_ms = current + _EWMA_ALPHA * (wait_ms - current)
+        self._wait_t = now
+
+    @property
+    def wait_ms(self) -> float:
+        return self._decayed_wait(time.monotonic())
+
+    @property
+    def level(self) -> DegradeLevel:
+        wait = self.wait_ms
+        level = DegradeLevel(sum(1 for t in self.thresholds_ms if wait >= t))
+        if level != self._level:
+            log_event("overload_level", level=level.name, previous=self._level.name, wait_ms=f"{wait:.0f}")
+            self._level = level
+        return level
+
+    @asynccontextmanager
+    async def admit(self, priority: int = LLMPriority.MENTION) -> AsyncIterator[DegradeLevel]:
+        """Hold one work slot; yields the DegradeLevel to apply to this run."""
+        slots = self._slots
+        if slots.in_flight >= slots.current_limit and slots.queue_depth >= self.max_queue:
+            self.shed += 1
+            log_event("work_shed", policy=self.policy, priority=LLMPriority(priority).name,
+                      in_flight=slots.in_flight, queue_depth=slots.queue_depth)
+            raise WorkShed(self.policy)
+        t0 = time.perf_counter()
+        async with slots.slot(priority):
+            self.observe((time.perf_counter() - t0) * 1000)
+            self.admitted += 1
+            level = self.level
+            if level is not DegradeLevel.NORMAL:
+                self.degraded += 1
+            yield level
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "level": self.level.name,
+            "wait_ms": f"{self.wait_ms:.0f}",
+            "in_flight": self._slots.in_flight,
+            "queued": self._slots.queue_depth,
+            "admitted": self.admitted,
+            "degraded": self.degraded,
+            "shed": self.shed,
+        }
+
+
+work_gate = WorkGate()
+
+__all__ = ["work_gate", "WorkGate", "WorkShed", "DegradeLevel", "BUSY_MESSAGE"]
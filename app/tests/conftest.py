@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+# constants.py requires these; tests never talk to Discord / OpenAI.
+for _k, _v in {
+    "DISCORD_BOT_TOKEN": "test",
+    "DISCORD_CLIENT_ID": "0",
+    "OPENAI_API_KEY": "sk-test",
+    "PERMISSIONS": "0",
+    "ALLOWED_SERVER_IDS": "",
+    "USAGE_LEDGER_ENABLED": "0",
+    "HISTORY_PERSIST_ENABLED": "0",
+}.items():
+    os.environ.setdefault(_k, _v)
@@ -0,0 +1,31 @@
+import asyncio
+
+from sub.channel_actor import ChannelActors, Work
+from sub.llm.concurrency import LLMPriority
+
+
+def test_superseding_burst_keeps_cancelled_priority():
+    async def run():
+        actors = ChannelActors(quiet_sec=0.01, max_wait_sec=0.01)
+        started = asyncio.Event()
+        runs = []
+        delivered = asyncio.Event()
+
+        async def work_run(messages, priority):
+            runs.append((messages, priority))
+            started.set()
+            await asyncio.sleep(0 if len(runs) > 1 else 10)
+            return priority
+
+        async def deliver(result):
+            delivered.set()
+
+        actors.submit(1, Work("mention", LLMPriority.MENTION, work_run, deliver))
+        await started.wait()
+        # passive chatter supersedes the mention's in-flight run
+        actors.submit(1, Work("chatter", LLMPriority.FALLBACK, work_run, deliver))
+        await asyncio.wait_for(delivered.wait(), 1)
+        assert runs == [(["mention"], LLMPriority.MENTION), (["chatter"], LLMPriority.MENTION)]
+        assert actors.cancelled == 1
+
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from sub.llm import openai_wrapper
+from sub.llm.openai_wrapper import OpenAIFinalError, chat_with_fallback
+
+
+@pytest.fixture
+def failing_chat(monkeypatch):
+    """chat() stub that always fails; records the model of every call."""
+    models = []
+
+    async def chat(messages, model, **kwargs):
+        models.append(model)
+        raise OpenAIFinalError("stub failure")
+
+    monkeypatch.setattr(openai_wrapper, "chat", chat)
+    monkeypatch.setattr(openai_wrapper, "OPENAI_FALLBACK_MODEL", "fallback-model")
+    monkeypatch.setattr(openai_wrapper, "OPENAI_HEDGE_ENABLED", False)
+    return models
+
+
+@pytest.mark.parametrize("single_flight", [False, True])
+def test_failed_primary_falls_back(failing_chat, monkeypatch, single_flight):
+    monkeypatch.setattr(openai_wrapper, "OPENAI_SINGLE_FLIGHT", single_flight)
+    with pytest.raises(OpenAIFinalError):
+        asyncio.run(chat_with_fallback([{"role": "user", "content": "hi"}], model="primary-model"))
+    assert failing_chat == ["primary-model", "fallback-model"]
+
+
+@pytest.mark.parametrize("single_flight", [False, True])
+def test_no_fallback_runs_one_model(failing_chat, monkeypatch, single_flight):
+    # degraded callers already run the fallback model: no second retry loop on it
+    monkeypatch.setattr(openai_wrapper, "OPENAI_SINGLE_FLIGHT", single_flight)
+    with pytest.raises(OpenAIFinalError):
+        asyncio.run(chat_with_fallback(
+            [{"role": "user", "content": "hi"}], model="fallback-model", fallback=False,
+        ))
+    assert failing_chat == ["fallback-model"]
+
+
+@pytest.fixture
+def slow_chat(monkeypatch):
+    """chat() stub that streams one delta right away and answers after 50ms."""
+    models = []
+
+    async def chat(messages, model, on_text=None, **kwargs):
+        models.append(model)
+        if on_text is not None:
+            on_text("partial")
+        await asyncio.sleep(0.05)
+        return {"model": model}, {}
+
+    monkeypatch.setattr(openai_wrapper, "chat", chat)
+    monkeypatch.setattr(openai_wrapper, "OPENAI_FALLBACK_MODEL", "fallback-model")
+    monkeypatch.setattr(openai_wrapper, "OPENAI_HEDGE_ENABLED", True)
+    monkeypatch.setattr(openai_wrapper, "OPENAI_HEDGE_DELAY_SEC", 0.01)
+    monkeypatch.setattr(openai_wrapper, "OPENAI_SINGLE_FLIGHT", False)
+    return models
+
+
+def test_hedge_fires_on_slow_primary(slow_chat):
+    asyncio.run(chat_with_fallback([{"role": "user", "content": "hi"}], model="primary-model"))
+    assert slow_chat == ["primary-model", "fallback-model"]
+
+
+def test_streaming_primary_is_not_hedged(slow_chat):
+    streamed = []
+    _, metrics, model_used = asyncio.run(chat_with_fallback(
+        [{"role": "user", "content": "hi"}], model="primary-model",
+        on_text=lambda text, label: streamed.append(label),
+    ))
+    assert slow_chat == ["primary-model"]
+    assert model_used == "primary" and metrics["hedged"] is False
+    assert streamed == ["primary"]
+
+
+def test_streaming_caller_does_not_join_silent_flight(monkeypatch):
+    models = []
+
+    async def chat(messages, model, on_text=None, **kwargs):
+        models.append(model)
+        if on_text is not None:
+            on_text("partial")
+        await asyncio.sleep(0.01)
+        return {"model": model}, {}
+
+    monkeypatch.setattr(openai_wrapper, "chat", chat)
+    monkeypatch.setattr(openai_wrapper, "OPENAI_HEDGE_ENABLED", False)
+    monkeypatch.setattr(openai_wrapper, "OPENAI_SINGLE_FLIGHT", True)
+    messages = [{"role": "user", "content": "hi"}]
+    streamed = []
+
+    async def run():
+        return await asyncio.gather(
+            chat_with_fallback(messages, model="primary-model"),
+            chat_with_fallback(messages, model="primary-model", on_text=lambda text, label: streamed.append(text)),
+            chat_with_fallback(messages, model="primary-model", on_text=lambda text, label: streamed.append(text)),
+        )
+
+    results = asyncio.run(run())
+    # the silent call and the streaming pair run separately; the pair shares one call
+    assert models == ["primary-model", "primary-model"]
+    assert [r[1]["coalesced"] for r in results] == [False, False, True]
+    assert streamed == ["partial", "partial"]
@@ -0,0 +1,72 @@
+import time
+
+from sub.history_store import HistoryEntry, HistoryStore
+from sub.llm.summarizer import RollingSummarizer
+
+
+def _entry(i: int) -> HistoryEntry:
+    return HistoryEntry(i, f"user{i}", f"msg{i}", "text", time.time())
+
+
+def _store(**kwargs):
+    summarizer = RollingSummarizer(llm=None, batch_items=100)
+    store = HistoryStore(max_items=2, on_evict=summarizer.on_evict, on_drop=summarizer.forget, **kwargs)
+    return store, summarizer
+
+
+def test_ring_buffer_evicts_to_summarizer():
+    store, summarizer = _store()
+    for i in range(5):
+        store.add_message("c", _entry(i))
+    assert [e.user_id for e in store.get_history("c")] == [3, 4]
+    assert len(summarizer._pending["c"]) == 3
+
+
+def test_lru_drop_forgets_summary():
+    store, summarizer = _store(max_channels=2)
+    for channel in ("a", "b"):
+        for i in range(3):
+            store.add_message(channel, _entry(i))
+    summarizer._summaries["a"] = "old summary"
+    store.add_message("c", _entry(1))
+    assert store.get_channel_count() == 2
+    assert "a" not in summarizer._pending
+    assert summarizer.get("a") == ""
+    assert "b" in summarizer._pending
+
+
+def test_idle_expiry_forgets_summary():
+    store, summarizer = _store(idle_ttl_sec=0.01)
+    for i in range(3):
+        store.add_message("a", _entry(i))
+    summarizer._summaries["a"] = "old summary"
+    time.sleep(0.02)
+    store.add_message("b", _entry(1))
+    assert store.get_history("a") == []
+    assert summarizer.get("a") == "" and "a" not in summarizer._pending
+
+
+def test_clear_history_forgets_summary():
+    store, summarizer = _store()
+    for i in range(3):
+        store.add_message("a", _entry(i))
+    summarizer._summaries["a"] = "old summary"
+    store.clear_history("a")
+    assert store.get_history("a") == [] and store.approx_bytes() == 0
+    assert summarizer.get("a") == "" and "a" not in summarizer._pending
+
+
+def test_context_chars_bounds_ring_to_rendered_window():
+    summarizer = RollingSummarizer(llm=None, batch_items=100)
+    store = HistoryStore(max_items=30, on_evict=summarizer.on_evict, context_chars=40)
+    for i in range(10):
+        store.add_message("c", _entry(i))
+        entries = store.get_history("c")
+        # everything kept but the newest is rendered for the reply ...
+        rendered = store.render_history("c", skip_newest=1)
+        assert len(rendered.split("\n") if rendered else []) == len(entries) - 1
+        assert len(rendered) <= 40
+    # ... and everything older went to the summarizer, oldest first
+    kept = [e.user_id for e in store.get_history("c")]
+    assert kept[-1] == 9 and len(kept) < 10
+    assert summarizer._pending["c"] == [f"user{i}({i}): msg{i}" for i in range(kept[0])]
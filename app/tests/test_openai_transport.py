@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+from sub.llm.openai_transport import OpenAIHTTPTransport
+
+
+def _sse(*chunks):
+    return "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+
+
+async def _serve(handler):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def _compatible_server(payloads):
+    """OpenAI-compatible server that rejects unknown fields such as stream_options."""
+
+    async def handler(request):
+        payload = await request.json()
+        payloads.append(payload)
+        if "stream_options" in payload:
+            return web.json_response(
+                {"error": {"message": "Unrecognized request argument supplied: stream_options"}}, status=400
+            )
+        body = _sse(
+            {"choices": [{"delta": {"content": "hel"}}]},
+            {"choices": [{"delta": {"content": "lo"}, "finish_reason": "stop"}]},
+        )
+        return web.Response(text=body, content_type="text/event-stream")
+
+    return handler
+
+
+def test_stream_usage_auto_is_off_for_other_servers():
+    async def run():
+        payloads = []
+        runner, base = await _serve(_compatible_server(payloads))
+        transport = OpenAIHTTPTransport(api_base=base)
+        try:
+            assert transport.stream_usage is False
+            resp = await transport.chat_completion_stream("k", "m", [], 5, lambda text: None)
+        finally:
+            await transport.close()
+            await runner.cleanup()
+        assert resp.choices[0]["message"]["content"] == "hello"
+        assert len(payloads) == 1 and "stream_options" not in payloads[0]
+
+    asyncio.run(run())
+
+
+def test_rejected_stream_options_retried_once_then_dropped():
+    async def run():
+        payloads = []
+        runner, base = await _serve(_compatible_server(payloads))
+        transport = OpenAIHTTPTransport(api_base=base, stream_usage="1")
+        streamed = []
+        try:
+            first = await transport.chat_completion_stream("k", "m", [], 5, streamed.append)
+            second = await transport.chat_completion_stream("k", "m", [], 5, streamed.append)
+        finally:
+            await transport.close()
+            await runner.cleanup()
+        assert first.choices[0]["message"]["content"] == second.choices[0]["message"]["content"] == "hello"
+        assert ["stream_options" in p for p in payloads] == [True, False, False]
+        assert streamed == ["hel", "hello", "hel", "hello"]
+        assert transport.stream_usage is False
+
+    asyncio.run(run())
+
+
+def test_stream_usage_auto_is_on_for_openai():
+    assert OpenAIHTTPTransport(api_base="https://api.openai.com/v1").stream_usage is True
@@ -0,0 +1,50 @@
+import asyncio
+
+from sub.llm import openai_wrapper
+from sub.llm.budget import Reservation
+from sub.llm.concurrency import AdaptiveLimiter
+
+
+class StallingBudgeter:
+    """RequestBudgeter stand-in whose reserve() stalls; records the limiter's in_flight."""
+
+    enabled = True
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.in_flight_at_reserve = []
+
+    async def reserve(self, tokens):
+        self.in_flight_at_reserve.append(self.limiter.in_flight)
+        await asyncio.sleep(0.01)
+        return Reservation(tokens, 10.0)
+
+    def settle(self, reservation, actual_tokens):
+        pass
+
+    def refund(self, reservation):
+        pass
+
+
+def test_budget_wait_holds_no_concurrency_slot(monkeypatch):
+    limiter = AdaptiveLimiter("m", initial=1, min_limit=1, max_limit=1)
+    budgeter = StallingBudgeter(limiter)
+    calls = []
+
+    async def invoke(model, messages, timeout, on_text=None):
+        calls.append(limiter.in_flight)
+        if len(calls) == 1:
+            raise openai_wrapper.openai.error.APIError("temporarily unavailable")
+        return {"usage": {}}, 1.0
+
+    monkeypatch.setattr(openai_wrapper, "get_limiter", lambda model: limiter)
+    monkeypatch.setattr(openai_wrapper, "get_budgeter", lambda model: budgeter)
+    monkeypatch.setattr(openai_wrapper, "get_breaker", lambda model: None)
+    monkeypatch.setattr(openai_wrapper, "_invoke", invoke)
+    _, metrics = asyncio.run(openai_wrapper.chat([{"role": "user", "content": "hi"}], model="m", backoff_base=0.0))
+    assert metrics["attempt"] == 2
+    # the slot is taken only around the upstream call, never while reserving budget
+    assert budgeter.in_flight_at_reserve == [0, 0]
+    assert calls == [1, 1]
+    assert metrics["queue_wait_ms"] < metrics["budget_wait_ms"]
+    assert limiter.in_flight == 0
@@ -0,0 +1,31 @@
+import pytest
+
+from sub.llm import prompt_budget
+from sub.llm.prompt_budget import context_window
+from sub.llm.token_utils import encoding_name
+
+
+@pytest.mark.parametrize("model, window, encoding", [
+    ("gpt-5", 272_000, "o200k_base"),
+    ("gpt-5-mini", 272_000, "o200k_base"),
+    ("gpt-4.1-mini", 1_047_576, "o200k_base"),
+    ("gpt-4o-mini", 128_000, "o200k_base"),
+    ("o4-mini", 200_000, "o200k_base"),
+    ("gpt-4-turbo", 128_000, "cl100k_base"),
+    ("gpt-4", 8_192, "cl100k_base"),
+])
+def test_window_and_encoding_from_one_table(model, window, encoding):
+    assert context_window(model) == window
+    assert encoding_name(model) == encoding
+
+
+def test_unknown_model_uses_default_window():
+    assert context_window("my-local-model") == 8_192
+    assert encoding_name("my-local-model") == "cl100k_base"
+
+
+def test_prompt_max_tokens_caps_large_windows(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "PROMPT_MAX_TOKENS", 16_000)
+    assert prompt_budget.prompt_budget("gpt-5") == 16_000
+    monkeypatch.setattr(prompt_budget, "PROMPT_MAX_TOKENS", 0)
+    assert prompt_budget.prompt_budget("gpt-5") == 272_000 - prompt_budget.PROMPT_COMPLETION_RESERVE_TOKENS
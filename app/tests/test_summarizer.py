@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from sub.history_store import HistoryEntry
+from sub.llm.summarizer import RollingSummarizer
+
+
+def _entry(i: int, content: str = "") -> HistoryEntry:
+    return HistoryEntry(i, f"user{i}", content or f"msg{i}", "text", time.time())
+
+
+class StubLLM:
+    """Records prompts; optionally fails or blocks until released."""
+
+    def __init__(self, fail_times: int = 0):
+        self.calls = []
+        self.fail_times = fail_times
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, messages):
+        self.calls.append(messages[1]["content"])
+        await self.release.wait()
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("stub failure")
+        return f"summary {len(self.calls)}"
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_batches_at_batch_items():
+    async def run():
+        llm = StubLLM()
+        s = RollingSummarizer(llm=llm, batch_items=3, max_chars=100, max_source_chars=10_000)
+        s.on_evict("c", _entry(1))
+        s.on_evict("c", _entry(2))
+        await _settle()
+        assert llm.calls == []
+        s.on_evict("c", _entry(3))
+        await _settle()
+        assert len(llm.calls) == 1
+        assert all(f"user{i}({i}): msg{i}" in llm.calls[0] for i in (1, 2, 3))
+        assert s.get("c") == "summary 1"
+        assert s.snapshot()["pending"] == 0
+
+    asyncio.run(run())
+
+
+def test_get_never_waits_for_update():
+    async def run():
+        llm = StubLLM()
+        llm.release.clear()
+        s = RollingSummarizer(llm=llm, batch_items=1, max_chars=100, max_source_chars=10_000)
+        s.on_evict("c", _entry(1))
+        await _settle()
+        assert len(llm.calls) == 1  # update in flight, blocked in the stub
+        assert s.get("c") == ""
+        assert s.snapshot()["running"] == 1
+        llm.release.set()
+        await _settle()
+        assert s.get("c") == "summary 1"
+
+    asyncio.run(run())
+
+
+def test_failed_update_keeps_entries_and_retries():
+    async def run():
+        llm = StubLLM(fail_times=1)
+        s = RollingSummarizer(llm=llm, batch_items=2, max_chars=100, max_source_chars=10_000)
+        s.on_evict("c", _entry(1))
+        s.on_evict("c", _entry(2))
+        await _settle()
+        assert len(llm.calls) == 1
+        assert s.get("c") == ""
+        assert s.failures == 1
+        assert s.snapshot()["pending"] == 2  # kept for the next attempt
+        s.on_evict("c", _entry(3))  # next eviction retries with the old lines
+        await _settle()
+        assert len(llm.calls) == 2
+        assert all(f"msg{i}" in llm.calls[1] for i in (1, 2, 3))
+        assert s.get("c") == "summary 2"
+        assert s.snapshot()["pending"] == 0
+
+    asyncio.run(run())
+
+
+def test_backlog_trimmed_to_max_source_chars():
+    s = RollingSummarizer(llm=StubLLM(), batch_items=100, max_chars=100, max_source_chars=60)
+    for i in range(10):
+        s.on_evict("c", _entry(i, "x" * 20))  # ~31 chars per formatted line
+    pending = s._pending["c"]
+    assert sum(len(p) for p in pending) <= 60
+    assert pending[-1].startswith("user9(9):")  # oldest lines dropped first
+    s.on_evict("d", _entry(1, "y" * 500))  # a single oversized line is kept
+    assert len(s._pending["d"]) == 1
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+import pytest
+
+from sub.llm import token_utils
+from sub.llm.token_utils import count_message_tokens, count_tokens, count_tokens_batch
+
+_TEXTS = [
+    "こんにちは、今日の天気は？ " * 8,
+    "The quick brown fox jumps over the lazy dog. " * 4,
+    "short",
+    "",
+    "絵文字😀と English の混在テキスト、数字 12345 も含む。" * 3,
+]
+
+
+class StubEncoding:
+    """tiktoken Encoding stand-in (one token per character) that counts encode calls."""
+
+    name = "stub_base"
+
+    def __init__(self):
+        self.encoded = 0
+        self.batches = 0
+
+    def encode(self, text):
+        self.encoded += 1
+        return list(text)
+
+    def encode_batch(self, texts):
+        self.batches += 1
+        return [list(t) for t in texts]
+
+
+@pytest.fixture
+def fresh_memo(monkeypatch):
+    monkeypatch.setattr(token_utils, "_memo", OrderedDict())
+
+
+def test_encoder_path_batches_and_memoizes(monkeypatch, fresh_memo):
+    enc = StubEncoding()
+    monkeypatch.setattr(token_utils, "_encoding", lambda model: enc)
+    assert count_tokens_batch(_TEXTS, "gpt-4o") == [len(t) for t in _TEXTS]
+    assert enc.batches == 1
+    # long texts come from the memo now; only the short one is encoded again
+    encoded = enc.encoded
+    assert count_tokens_batch(_TEXTS, "gpt-4o") == [len(t) for t in _TEXTS]
+    assert enc.batches == 1 and enc.encoded == encoded + 1
+    assert count_tokens(_TEXTS[0], "gpt-4o") == len(_TEXTS[0])
+    assert enc.encoded == encoded + 1
+
+
+def test_estimator_used_without_encoder(monkeypatch, fresh_memo):
+    monkeypatch.setattr(token_utils, "_encoding", lambda model: None)
+    counts = count_tokens_batch(_TEXTS, "gpt-4o")
+    assert counts == [token_utils.estimate_tokens(t, "gpt-4o") if t else 0 for t in _TEXTS]
+
+
+def _real_encoding(model):
+    pytest.importorskip("tiktoken")
+    enc = token_utils._encoding(model)
+    if enc is None:
+        pytest.skip("tiktoken BPE files unavailable (offline)")
+    return enc
+
+
+@pytest.mark.parametrize("model", ["gpt-4o", "gpt-4", "gpt-5"])
+def test_real_encoder_counts(model, fresh_memo):
+    enc = _real_encoding(model)
+    assert enc.name == token_utils.encoding_name(model)
+    expected = [len(enc.encode(t)) for t in _TEXTS]
+    assert count_tokens_batch(_TEXTS, model) == expected
+    assert count_tokens_batch(_TEXTS, model) == expected  # memo hits
+    assert [count_tokens(t, model) for t in _TEXTS] == expected
+    messages = [{"role": "user", "content": t} for t in _TEXTS]
+    assert count_message_tokens(messages, model) == [n + token_utils.PER_MESSAGE_OVERHEAD for n in expected]
@@ -0,0 +1,41 @@
+import asyncio
+
+from sub.llm.usage_ledger import UsageLedger
+
+
+def _record(ledger: UsageLedger, user_id: str, tokens: int) -> None:
+    ledger.record("g1", "c1", user_id, "model", "completion", tokens, 0, 0.0, 100.0)
+
+
+def test_summary_includes_pending_records(tmp_path):
+    async def run():
+        ledger = UsageLedger(path=str(tmp_path / "usage.sqlite3"), flush_sec=60)
+        await ledger.open()
+        _record(ledger, "u1", 10)
+        _record(ledger, "u2", 5)
+        _record(ledger, "u1", 10)
+        totals, rows = await ledger.summary(group_by="user_id", guild_id="g1")
+        assert totals[:3] == (3, 25, 0)
+        assert [(r[0], r[1]) for r in rows] == [("u1", 2), ("u2", 1)]
+        assert ledger.snapshot()["pending"] == 0
+
+    asyncio.run(run())
+
+
+def test_open_restores_quota_totals(tmp_path):
+    path = str(tmp_path / "usage.sqlite3")
+
+    async def first():
+        ledger = UsageLedger(path=path, flush_sec=60, user_token_limit=20)
+        await ledger.open()
+        _record(ledger, "u1", 25)
+        assert await ledger.flush_async() == 1
+
+    async def restarted():
+        ledger = UsageLedger(path=path, flush_sec=60, user_token_limit=20)
+        await ledger.open()
+        assert ledger.check_quota("g1", "u1") == "user_tokens"
+        assert ledger.check_quota("g1", "u2") is None
+
+    asyncio.run(first())
+    asyncio.run(restarted())